@@ -0,0 +1,120 @@
+# common/clients.py
+#
+# Registro de clientes de Google Cloud compartido por todas las peticiones de
+# un proceso. Este archivo se mantiene idéntico en cada función, porque cada
+# Cloud Function se despliega con su propia carpeta --source.
+
+import importlib
+import os
+import sys
+import threading
+import time
+
+# Tamaño del pool de conexiones HTTP de Cloud Storage. El valor por defecto de
+# 'requests' (10) se queda corto cuando se suben o descargan partes en paralelo.
+HTTP_POOL_SIZE = int(os.environ.get("GCP_HTTP_POOL_SIZE", 32))
+HTTP_MAX_RETRIES = int(os.environ.get("GCP_HTTP_MAX_RETRIES", 3))
+
+# Backend alternativo para pruebas locales: 'paquete.modulo:funcion'. La función
+# recibe este módulo y registra sus clientes falsos con install_backend().
+BACKEND_ENV_VAR = "EXO_CLIENT_BACKEND"
+
+_lock = threading.RLock()
+_clients = {}
+_factories = {}
+_setup_stats = {}
+_backend_loaded = False
+
+def _firestore_factory():
+    from google.cloud import firestore
+    return firestore.Client()
+
+def _storage_factory():
+    import google.auth
+    from google.auth.transport.requests import AuthorizedSession
+    from google.cloud import storage
+    from requests.adapters import HTTPAdapter
+
+    credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=HTTP_MAX_RETRIES)
+    session.mount("https://", adapter)
+    return storage.Client(project=project, credentials=credentials, _http=session)
+
+def _tasks_factory():
+    from google.cloud import tasks_v2
+    return tasks_v2.CloudTasksClient()
+
+_DEFAULT_FACTORIES = {
+    "firestore": _firestore_factory,
+    "storage": _storage_factory,
+    "tasks": _tasks_factory,
+}
+
+def install_backend(**factories):
+    """
+    Sustituye la fábrica de uno o varios clientes ('firestore', 'storage',
+    'tasks'). Acepta un callable sin argumentos o directamente el objeto cliente.
+    Descarta los clientes ya creados de esos tipos.
+    """
+    with _lock:
+        for name, factory in factories.items():
+            if name not in _DEFAULT_FACTORIES:
+                raise ValueError(f"Cliente desconocido: '{name}'.")
+            _factories[name] = factory if callable(factory) else (lambda client=factory: client)
+            _clients.pop(name, None)
+
+def reset():
+    """Olvida los clientes creados y los backends instalados."""
+    global _backend_loaded
+    with _lock:
+        _clients.clear()
+        _factories.clear()
+        _setup_stats.clear()
+        _backend_loaded = False
+
+def _load_backend_from_env():
+    global _backend_loaded
+    _backend_loaded = True
+    spec = os.environ.get(BACKEND_ENV_VAR)
+    if not spec:
+        return
+    module_name, _, attr = spec.partition(":")
+    installer = getattr(importlib.import_module(module_name), attr or "install")
+    print(f"INFO: Usando el backend de clientes '{spec}'.")
+    installer(sys.modules[__name__])
+
+def get_client(name):
+    """Devuelve el cliente 'name', creándolo una sola vez por proceso."""
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    if not _backend_loaded:
+        with _lock:
+            if not _backend_loaded:
+                _load_backend_from_env()
+    with _lock:
+        client = _clients.get(name)
+        if client is None:
+            factory = _factories.get(name) or _DEFAULT_FACTORIES[name]
+            started = time.perf_counter()
+            client = factory()
+            setup_ms = (time.perf_counter() - started) * 1000
+            _clients[name] = client
+            _setup_stats[name] = round(setup_ms, 2)
+            print(f"INFO: Cliente '{name}' inicializado en {setup_ms:.1f} ms.")
+    return client
+
+def get_firestore_client():
+    return get_client("firestore")
+
+def get_storage_client():
+    return get_client("storage")
+
+def get_tasks_client():
+    return get_client("tasks")
+
+def setup_stats():
+    """Milisegundos que tardó en crearse cada cliente de este proceso."""
+    with _lock:
+        return dict(_setup_stats)
@@ -0,0 +1,206 @@
+# job_cleanup.py
+#
+# Limpieza en cascada de los jobs eliminados y retención de jobs caducados:
+#
+#   DELETE /jobs/{id}           borra el documento y los alias y encola la limpieza
+#   POST   /jobs/{id}/cleanup   borra todo el almacenamiento del job (Cloud Tasks)
+#   POST   /retention           purga jobs con error, atascados o superados (Cloud Scheduler)
+# La limpieza y la purga son rutas de mantenimiento (common/maintenance_auth.py):
+# la tarea de Cloud Tasks lleva un token OIDC de CLEANUP_INVOKER_SERVICE_ACCOUNT.
+#
+# Almacenamiento de un job:
+#   gs://{MODEL_BUCKET_NAME}/models/{job_id}/                   bundle, artifacts.pkl y sidecar de resultados
+#   gs://{UPLOAD_BUCKET_NAME}/raw-uploads/{job_id}_*            CSV subido al orquestador
+#   gs://{PREDICTION_CACHE_BUCKET}/prediction-cache/{job_id}/   caché de resultados del predictor
+# Los prefijos se listan y se borran en paralelo. Solo se borran los objetos
+# creados antes de la eliminación: el job_id es el hash del CSV, así que volver
+# a subir el mismo archivo reutiliza el job_id y sus objetos nuevos se conservan.
+# La limpieza es idempotente; si falla, Cloud Tasks la reintenta. El borrado deja
+# además una lápida en la tabla de enrutado para que el predictor descarte lo que
+# guarda en memoria y en disco del job.
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from google.cloud import tasks_v2
+
+from common import model_routing
+from common.instrumentation import phase
+
+MODELS_COLLECTION = "exo_scout_models"
+MODEL_BUCKET_NAME = os.environ.get("MODEL_BUCKET_NAME", "exoplanets-nasa-models")
+UPLOAD_BUCKET_NAME = os.environ.get("UPLOAD_BUCKET_NAME", "exoplanets-nasa-models")
+PREDICTION_CACHE_BUCKET = os.environ.get("PREDICTION_CACHE_BUCKET", MODEL_BUCKET_NAME)
+PREDICTION_CACHE_PREFIX = "prediction-cache"
+CLEANUP_WORKERS = int(os.environ.get("EXO_CLEANUP_WORKERS", 8))
+DELETE_CHUNK_SIZE = 100   # Objetos por llamada a delete_blobs
+
+# --- RETENCIÓN ---
+RETENTION_ERROR_DAYS = float(os.environ.get("RETENTION_ERROR_DAYS", 7))             # Jobs con estado 'error'
+RETENTION_STALE_HOURS = float(os.environ.get("RETENTION_STALE_HOURS", 24))          # Jobs que nunca terminaron
+RETENTION_SUPERSEDED_DAYS = float(os.environ.get("RETENTION_SUPERSEDED_DAYS", 30))  # Completados sin alias
+RETENTION_KEEP_PER_SOURCE = int(os.environ.get("RETENTION_KEEP_PER_SOURCE", 5))     # Completados más recientes que se conservan
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", 50))
+IN_PROGRESS_STATUSES = ("training", "uploading_artifacts")
+RETENTION_FIELDS = ["status", "params.data_source", "created_at", "completed_at", "failed_at"]
+
+def _as_utc(value):
+    """Las fechas sin zona (datetime.now() del trainer) se tratan como UTC."""
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def storage_prefixes(job_id):
+    return {
+        "models": (MODEL_BUCKET_NAME, f"models/{job_id}/"),
+        "raw_uploads": (UPLOAD_BUCKET_NAME, f"raw-uploads/{job_id}_"),
+        "prediction_cache": (PREDICTION_CACHE_BUCKET, f"{PREDICTION_CACHE_PREFIX}/{job_id}/"),
+    }
+
+# =============================================================================
+# LIMPIEZA DE UN JOB
+# =============================================================================
+
+def _list_prefix(storage_client, bucket_name, prefix, deleted_at):
+    blobs = storage_client.list_blobs(storage_client.bucket(bucket_name), prefix=prefix)
+    return [blob for blob in blobs
+            if deleted_at is None or blob.time_created is None or _as_utc(blob.time_created) <= deleted_at]
+
+def cleanup_storage(storage_client, job_id, deleted_at=None):
+    """
+    Borra los objetos del job creados hasta 'deleted_at' (todos si es None).
+    Devuelve cuántos se borraron de cada prefijo.
+    """
+    prefixes = storage_prefixes(job_id)
+    with ThreadPoolExecutor(max_workers=CLEANUP_WORKERS) as executor:
+        with phase("gcs_read"):
+            listed = dict(zip(prefixes, executor.map(
+                lambda item: _list_prefix(storage_client, item[0], item[1], deleted_at), prefixes.values())))
+        chunks = [(prefixes[name][0], blobs[i:i + DELETE_CHUNK_SIZE])
+                  for name, blobs in listed.items() for i in range(0, len(blobs), DELETE_CHUNK_SIZE)]
+        with phase("gcs_write"):
+            list(executor.map(
+                lambda chunk: storage_client.bucket(chunk[0]).delete_blobs(chunk[1], on_error=lambda blob: None), chunks))
+    deleted = {name: len(blobs) for name, blobs in listed.items()}
+    print(f"✓ Almacenamiento del job {job_id} limpiado: {deleted}")
+    return deleted
+
+def enqueue_cleanup(tasks_client, job_id, deleted_at):
+    """Encola la limpieza del job. Devuelve False si Cloud Tasks no está configurado."""
+    gcp_project = os.environ.get("GCP_PROJECT")
+    gcp_location = os.environ.get("GCP_LOCATION", "us-central1")
+    tasks_queue = os.environ.get("CLEANUP_TASKS_QUEUE", os.environ.get("TASKS_QUEUE", "exo-scout-queue"))
+    jobs_api_url = (os.environ.get("JOBS_API_FUNCTION_URL") or "").rstrip("/")
+    invoker = os.environ.get("CLEANUP_INVOKER_SERVICE_ACCOUNT")
+    if not all([gcp_project, gcp_location, jobs_api_url, tasks_queue]):
+        return False
+
+    url = f"{jobs_api_url}/jobs/{job_id}/cleanup"
+    task = {
+        "http_request": {
+            "http_method": tasks_v2.HttpMethod.POST,
+            "url": url,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"deleted_at": deleted_at.isoformat()}).encode(),
+        }
+    }
+    if invoker:
+        # Sin token, la ruta de limpieza rechaza la tarea (common/maintenance_auth.py)
+        audience = (os.environ.get("MAINTENANCE_AUDIENCE") or "").split(",")[0].strip() or url
+        task["http_request"]["oidc_token"] = {"service_account_email": invoker, "audience": audience}
+    else:
+        print("WARN: CLEANUP_INVOKER_SERVICE_ACCOUNT no está definida; la tarea de limpieza irá sin token OIDC.")
+    parent = tasks_client.queue_path(gcp_project, gcp_location, tasks_queue)
+    with phase("enqueue"):
+        tasks_client.create_task(parent=parent, task=task)
+    print(f"INFO: Limpieza del job {job_id} encolada en {tasks_queue}")
+    return True
+
+def delete_job(firestore_client, storage_client, tasks_client, job_id):
+    """
+    Borra el documento del job, retira sus alias (pasan al siguiente mejor
+    modelo) y encola la limpieza de su almacenamiento. Sin Cloud Tasks
+    configurado (p. ej. en local) la limpieza se hace en la misma petición.
+    """
+    deleted_at = datetime.now(timezone.utc)
+    with phase("firestore_write"):
+        firestore_client.collection(MODELS_COLLECTION).document(job_id).delete()
+    removed, reassigned = model_routing.unpublish_job(firestore_client, job_id, deleted=True)
+
+    result = {"aliases_removed": removed, "aliases_reassigned": reassigned}
+    if enqueue_cleanup(tasks_client, job_id, deleted_at):
+        result["cleanup"] = {"status": "queued"}
+    else:
+        print(f"WARN: Cloud Tasks no está configurado; limpiando el job {job_id} en la propia petición.")
+        result["cleanup"] = {"status": "completed", "deleted": cleanup_storage(storage_client, job_id, deleted_at)}
+    return result
+
+# =============================================================================
+# RETENCIÓN
+# =============================================================================
+
+def retention_candidates(firestore_client, now=None):
+    """
+    Jobs a purgar, del más antiguo al más reciente, con el motivo:
+    - 'error': fallaron hace más de RETENTION_ERROR_DAYS,
+    - 'stale': siguen en entrenamiento tras RETENTION_STALE_HOURS,
+    - 'superseded': completados hace más de RETENTION_SUPERSEDED_DAYS, sin
+      ningún alias y fuera de los RETENTION_KEEP_PER_SOURCE más recientes de su fuente.
+    """
+    now = now or datetime.now(timezone.utc)
+    collection_ref = firestore_client.collection(MODELS_COLLECTION)
+    aliases = firestore_client.collection(model_routing.ROUTING_COLLECTION).document(model_routing.ALIASES_DOCUMENT).get()
+    aliased = {route.get("job_id") for route in ((aliases.to_dict() or {}).get("routes") or {}).values()}
+
+    with phase("firestore_read"):
+        docs = list(collection_ref.select(RETENTION_FIELDS).stream())
+
+    candidates, completed_by_source = [], {}
+    for doc in docs:
+        data = doc.to_dict() or {}
+        status = data.get("status")
+        created_at = _as_utc(data.get("created_at"))
+        if status == "error":
+            failed_at = _as_utc(data.get("failed_at")) or created_at
+            if failed_at and now - failed_at > timedelta(days=RETENTION_ERROR_DAYS):
+                candidates.append((failed_at, doc.id, "error"))
+        elif status in IN_PROGRESS_STATUSES:
+            if created_at and now - created_at > timedelta(hours=RETENTION_STALE_HOURS):
+                candidates.append((created_at, doc.id, "stale"))
+        elif status == "completed":
+            data_source = (data.get("params") or {}).get("data_source")
+            completed_by_source.setdefault(data_source, []).append((_as_utc(data.get("completed_at")) or created_at, doc.id))
+
+    for jobs in completed_by_source.values():
+        jobs.sort(key=lambda job: job[0] or datetime.min.replace(tzinfo=timezone.utc), reverse=True)
+        for completed_at, job_id in jobs[RETENTION_KEEP_PER_SOURCE:]:
+            if job_id not in aliased and completed_at and now - completed_at > timedelta(days=RETENTION_SUPERSEDED_DAYS):
+                candidates.append((completed_at, job_id, "superseded"))
+
+    candidates.sort(key=lambda candidate: candidate[0])
+    return [{"job_id": job_id, "reason": reason, "since": since.isoformat()} for since, job_id, reason in candidates]
+
+def run_retention(firestore_client, storage_client, tasks_client, dry_run=True, limit=RETENTION_BATCH_SIZE):
+    """
+    Purga como mucho 'limit' jobs candidatos (los más antiguos primero). Con
+    'dry_run' solo los lista. Los que no entran en este lote se purgan en la
+    siguiente ejecución programada ('remaining').
+    """
+    candidates = retention_candidates(firestore_client)
+    batch = candidates[:limit]
+    summary = {"dry_run": dry_run, "candidates": len(candidates), "remaining": len(candidates) - len(batch)}
+    if dry_run:
+        return {**summary, "jobs": batch}
+
+    purged, errors = [], []
+    for candidate in batch:
+        try:
+            delete_job(firestore_client, storage_client, tasks_client, candidate["job_id"])
+            purged.append(candidate)
+        except Exception as e:
+            print(f"ERROR: No se pudo purgar el job {candidate['job_id']}: {e}")
+            errors.append({**candidate, "error": str(e)})
+    print(f"Retención: {len(purged)} jobs purgados, {len(errors)} con error, {summary['remaining']} pendientes.")
+    return {**summary, "purged": purged, "errors": errors}
@@ -1,25 +1,189 @@
+import base64
+import gzip
+import json
+from datetime import datetime
 import functions_framework
 from flask import Request, jsonify
 from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
 
-# --- INICIALIZACIÓN PEREZOSA ---
-firestore_client = None
+import job_cleanup
+from common import maintenance_auth
+from common.clients import get_firestore_client, get_storage_client, get_tasks_client
+from common.instrumentation import instrumented, phase
+from common import model_routing
+from common.response_cache import response_cache, cached_json, cache_key, compute_etag
 
 # --- MANEJO DE CORS ---
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, If-None-Match, X-Exo-Profile, X-Exo-Admin-Token',
+    'Access-Control-Expose-Headers': 'ETag, X-Cache',
 }
 
-def get_firestore_client():
-    """Inicializa el cliente de Firestore la primera vez que se necesita."""
-    global firestore_client
-    if firestore_client is None:
-        firestore_client = firestore.Client()
-    return firestore_client
+# --- VISTA RESUMIDA DEL LISTADO ---
+# Campos que se proyectan en la consulta para la vista 'summary'. Los documentos
+# completos incluyen 'classification_report' y 'feature_importance', que el
+# listado del dashboard no necesita.
+SUMMARY_FIELDS = [
+    "job_id",
+    "model_name",
+    "status",
+    "params.algorithm",
+    "params.data_source",
+    "results.f1_score",
+    "created_at",
+    "completed_at",
+    "failed_at",
+]
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Valores de ?include= en GET /jobs/{job_id}
+JOB_INCLUDES = ("results",)
+
+# Filtros admitidos en /jobs -> campo de Firestore. Cada combinación con
+# 'created_at' descendente tiene su índice compuesto en firestore.indexes.json.
+LIST_FILTERS = {
+    "status": "status",
+    "data_source": "params.data_source",
+}
+
+def _encode_cursor(doc):
+    """
+    Cursor opaco para la siguiente página: 'created_at' e ID del último documento.
+    Así la página siguiente no necesita leer el documento completo del cursor.
+    """
+    created_at = (doc.to_dict() or {}).get("created_at")
+    payload = {"created_at": created_at.isoformat() if created_at else None, "id": doc.id}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor):
+    """Devuelve los valores de 'start_after' para el cursor. Lanza ValueError si no es válido."""
+    padding = "=" * (-len(cursor) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    return {
+        "created_at": datetime.fromisoformat(payload["created_at"]),
+        "__name__": payload["id"],
+    }
+
+def _to_summary(doc):
+    """Aplana un documento proyectado a la forma compacta del listado."""
+    data = doc.to_dict() or {}
+    params = data.get("params") or {}
+    results = data.get("results") or {}
+    return {
+        "job_id": data.get("job_id", doc.id),
+        "model_name": data.get("model_name"),
+        "status": data.get("status"),
+        "algorithm": params.get("algorithm"),
+        "data_source": params.get("data_source"),
+        "f1_score": results.get("f1_score"),
+        "created_at": data.get("created_at"),
+        "completed_at": data.get("completed_at"),
+        "failed_at": data.get("failed_at"),
+    }
+
+def _list_jobs(collection_ref, args):
+    """
+    Lista los trabajos ordenados por 'created_at' descendente.
+    - ?status=...&data_source=...: filtros de igualdad.
+    - ?view=summary: proyección compacta con paginación por cursor
+      (?limit=N&cursor=...). Devuelve {"jobs": [...], "next_cursor": ...}.
+    - ?view=full (por defecto): documentos completos, como antes.
+    Devuelve (payload, status, etag) para pasar por la caché de respuestas.
+    """
+    view = args.get("view", "full")
+    if view not in ("full", "summary"):
+        return {"error": "Parámetro 'view' no válido. Opciones: ['full', 'summary']"}, 400, None
+
+    query = collection_ref
+    for arg_name, field_path in LIST_FILTERS.items():
+        value = args.get(arg_name)
+        if value:
+            query = query.where(filter=FieldFilter(field_path, "==", value))
+    query = query.order_by("created_at", direction=firestore.Query.DESCENDING)
+
+    if view == "full":
+        all_jobs, snapshots = [], []
+        for doc in query.stream():
+            job_data = doc.to_dict()
+            job_data['job_id'] = doc.id
+            all_jobs.append(job_data)
+            snapshots.append(doc)
+        return all_jobs, 200, compute_etag(snapshots)
+
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return {"error": "El parámetro 'limit' debe ser un entero."}, 400, None
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    # Desempate estable por ID para que el cursor no salte ni repita trabajos.
+    query = query.order_by("__name__", direction=firestore.Query.DESCENDING)
+    cursor = args.get("cursor")
+    if cursor:
+        try:
+            query = query.start_after(_decode_cursor(cursor))
+        except (ValueError, TypeError, KeyError):
+            return {"error": "Cursor no válido."}, 400, None
+
+    # Pedimos un documento extra para saber si hay una página siguiente.
+    docs = list(query.select(SUMMARY_FIELDS).limit(limit + 1).stream())
+    page = docs[:limit]
+    next_cursor = _encode_cursor(page[-1]) if len(docs) > limit else None
+
+    return {"jobs": [_to_summary(doc) for doc in page], "next_cursor": next_cursor}, 200, compute_etag(docs)
+
+def _get_job(doc_ref, include=()):
+    """
+    Documento del job. Con include=('results',) se añaden a 'results' los
+    resultados del sidecar (classification_report, feature_importance, ...),
+    como los devolvía esta ruta antes de moverlos fuera del documento.
+    """
+    doc = doc_ref.get()
+    if not doc.exists:
+        return {"error": "Job no encontrado"}, 404, None
+    data = doc.to_dict()
+    sidecar_uri = (data.get("results") or {}).get("results_sidecar_path")
+    if "results" in include and sidecar_uri:
+        data["results"] = {**data["results"], **_load_results_sidecar(sidecar_uri)}
+    return data, 200, compute_etag([doc])
+
+def _load_results_sidecar(sidecar_uri):
+    """Descarga y descomprime el sidecar con los resultados completos de un job."""
+    bucket_name, blob_name = sidecar_uri.replace("gs://", "").split("/", 1)
+    blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+    with phase("gcs_read"):
+        data = blob.download_as_bytes()
+    return json.loads(gzip.decompress(data))
+
+def _get_job_results(doc_ref):
+    """
+    Resultados completos del entrenamiento (classification_report,
+    feature_importance, ...). Los jobs antiguos los guardan en el propio
+    documento; los nuevos en un sidecar en GCS que se descarga bajo demanda.
+    """
+    doc = doc_ref.get()
+    if not doc.exists:
+        return {"error": "Job no encontrado"}, 404, None
+    results = dict((doc.to_dict() or {}).get("results") or {})
+    sidecar_uri = results.get("results_sidecar_path")
+    if sidecar_uri:
+        results.update(_load_results_sidecar(sidecar_uri))
+    return results, 200, compute_etag([doc])
+
+def _get_aliases(client):
+    """Tabla de enrutado de modelos: {alias: {job_id, data_source, f1_score, ...}}."""
+    ref = client.collection(model_routing.ROUTING_COLLECTION).document(model_routing.ALIASES_DOCUMENT)
+    doc = ref.get()
+    data = (doc.to_dict() if doc.exists else None) or {}
+    payload = {"aliases": data.get("routes") or {}, "version": data.get("version", 0), "updated_at": data.get("updated_at")}
+    return payload, 200, compute_etag([doc])
 
 @functions_framework.http
+@instrumented("jobs_crud")
 def jobs_crud(request: Request):
     """
     Función CRUD para gestionar los trabajos de entrenamiento en Firestore.
@@ -33,21 +197,45 @@ def jobs_crud(request: Request):
         
         path_parts = request.path.strip('/').split('/')
 
-        # RUTA: /jobs (Listar todos los trabajos)
+        # RUTA: /jobs (Listar trabajos, completos o en vista resumida)
         if len(path_parts) == 1 and path_parts[0] == 'jobs' and request.method == 'GET':
-            
-            # --- CORRECCIÓN AQUÍ ---
-            # Añadimos .order_by() para ordenar por el campo 'created_at' en orden descendente.
-            query = collection_ref.order_by("created_at", direction=firestore.Query.DESCENDING)
-            
-            all_jobs = []
-            # Usamos la nueva 'query' en lugar de 'collection_ref' directamente.
-            for doc in query.stream():
-                job_data = doc.to_dict()
-                job_data['job_id'] = doc.id
-                all_jobs.append(job_data)
-                
-            return (jsonify(all_jobs), 200, CORS_HEADERS)
+            key = cache_key('jobs', request, 'list')
+            return cached_json(response_cache, request, key, lambda: _list_jobs(collection_ref, request.args), CORS_HEADERS)
+
+        # RUTA: /aliases (Alias de modelos: 'kepler:best' -> job_id, ...)
+        elif path_parts == ['aliases'] and request.method == 'GET':
+            key = cache_key('jobs', request, 'aliases')
+            return cached_json(response_cache, request, key, lambda: _get_aliases(client), CORS_HEADERS)
+
+        # RUTA: /aliases/rebuild (Recalcular los alias a partir de los jobs completados)
+        elif path_parts == ['aliases', 'rebuild'] and request.method == 'POST':
+            denied = maintenance_auth.authorize(request)
+            if denied:
+                return (jsonify({"error": denied[0]}), denied[1], CORS_HEADERS)
+            routes = model_routing.rebuild_routes(client)
+            response_cache.invalidate('jobs:')
+            return (jsonify({"status": "éxito", "aliases": routes}), 200, CORS_HEADERS)
+
+        # RUTA: /retention (Purga programada de jobs con error, atascados o superados)
+        elif path_parts == ['retention'] and request.method == 'POST':
+            try:
+                limit = int(request.args.get("limit", job_cleanup.RETENTION_BATCH_SIZE))
+            except ValueError:
+                return (jsonify({"error": "El parámetro 'limit' debe ser un entero."}), 400, CORS_HEADERS)
+            # Por defecto solo se listan los candidatos: purgar exige dry_run=false y
+            # credenciales de mantenimiento
+            dry_run = request.args.get("dry_run", "true").lower() not in ("0", "false", "no")
+            denied = None if dry_run else maintenance_auth.authorize(request)
+            if denied:
+                return (jsonify({"error": denied[0]}), denied[1], CORS_HEADERS)
+            result = job_cleanup.run_retention(client, get_storage_client(), get_tasks_client(), dry_run=dry_run, limit=max(1, limit))
+            if result.get("purged"):
+                response_cache.invalidate('jobs:')
+            return (jsonify(result), 200, CORS_HEADERS)
+
+        # RUTA: /metrics/cache (Métricas de la caché de esta instancia)
+        elif path_parts == ['metrics', 'cache'] and request.method == 'GET':
+            return (jsonify(response_cache.stats()), 200, CORS_HEADERS)
 
         # RUTA: /jobs/{job_id} (Obtener o Eliminar un trabajo)
         elif len(path_parts) == 2 and path_parts[0] == 'jobs':
@@ -55,15 +243,52 @@ def jobs_crud(request: Request):
             doc_ref = collection_ref.document(job_id)
 
             if request.method == 'GET':
-                doc = doc_ref.get()
-                if doc.exists:
-                    return (jsonify(doc.to_dict()), 200, CORS_HEADERS)
-                else:
-                    return (jsonify({"error": "Job no encontrado"}), 404, CORS_HEADERS)
+                include = tuple(part for part in request.args.get("include", "").split(",") if part)
+                if any(part not in JOB_INCLUDES for part in include):
+                    return (jsonify({"error": f"Parámetro 'include' no válido. Opciones: {list(JOB_INCLUDES)}"}), 400, CORS_HEADERS)
+                key = cache_key('jobs', request, 'doc', job_id)
+                return cached_json(response_cache, request, key, lambda: _get_job(doc_ref, include), CORS_HEADERS)
 
             elif request.method == 'DELETE':
-                doc_ref.delete()
-                return (jsonify({"status": "éxito", "message": f"Job {job_id} eliminado."}), 200, CORS_HEADERS)
+                # Documento y alias ahora; modelos, CSV subido y caché del predictor
+                # en segundo plano (job_cleanup.py).
+                result = job_cleanup.delete_job(client, get_storage_client(), get_tasks_client(), job_id)
+                # El job desaparece de su documento, de los listados y de los alias.
+                response_cache.invalidate('jobs:')
+                return (jsonify({
+                    "status": "éxito",
+                    "message": f"Job {job_id} eliminado.",
+                    **result,
+                }), 200, CORS_HEADERS)
+
+        # RUTA: /jobs/{job_id}/cleanup (Limpieza del almacenamiento de un job eliminado, Cloud Tasks)
+        elif len(path_parts) == 3 and path_parts[0] == 'jobs' and path_parts[2] == 'cleanup' and request.method == 'POST':
+            denied = maintenance_auth.authorize(request)
+            if denied:
+                return (jsonify({"error": denied[0]}), denied[1], CORS_HEADERS)
+            job_id = path_parts[1]
+            deleted_at = (request.get_json(silent=True) or {}).get("deleted_at")
+            try:
+                deleted_at = datetime.fromisoformat(deleted_at) if isinstance(deleted_at, str) else None
+            except ValueError:
+                deleted_at = None
+            if deleted_at is None or deleted_at.tzinfo is None:
+                return (jsonify({"error": "Se requiere 'deleted_at' (fecha ISO 8601 con zona horaria)."}), 400, CORS_HEADERS)
+            with phase("firestore_read"):
+                job_exists = collection_ref.document(job_id).get().exists
+            if job_exists:
+                # Solo se limpian jobs eliminados. Si se recreó con el mismo CSV, la tarea
+                # falla hasta agotar sus reintentos y los objetos antiguos quedan con el job nuevo.
+                return (jsonify({"error": f"El job {job_id} existe; solo se limpian jobs eliminados."}), 409, CORS_HEADERS)
+            deleted = job_cleanup.cleanup_storage(get_storage_client(), job_id, deleted_at)
+            response_cache.invalidate('jobs:')
+            return (jsonify({"status": "completed", "job_id": job_id, "deleted": deleted}), 200, CORS_HEADERS)
+
+        # RUTA: /jobs/{job_id}/results (Resultados completos del entrenamiento)
+        elif len(path_parts) == 3 and path_parts[0] == 'jobs' and path_parts[2] == 'results' and request.method == 'GET':
+            job_id = path_parts[1]
+            key = cache_key('jobs', request, 'results', job_id)
+            return cached_json(response_cache, request, key, lambda: _get_job_results(collection_ref.document(job_id)), CORS_HEADERS)
 
         return (jsonify({"error": "Ruta no encontrada"}), 404, CORS_HEADERS)
 
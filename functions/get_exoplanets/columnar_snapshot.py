@@ -0,0 +1,211 @@
+# columnar_snapshot.py
+#
+# Instantánea columnar en memoria de la colección 'exoplanetas' para resolver
+# filtros por rango, ordenaciones y top-k en el servidor.
+
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+# Campo con SERVER_TIMESTAMP que save_exoplanet escribe en cada alta o reingesta.
+UPDATED_AT_FIELD = "updated_at"
+# Solape al pedir cambios: un commit puede hacerse visible con una marca de tiempo
+# algo anterior a la última vista. Los repetidos se descartan por 'update_time'.
+WATERMARK_OVERLAP = timedelta(seconds=30)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+class SnapshotView:
+    """
+    Vista inmutable de la colección: documentos, una columna float64 por cada
+    campo numérico (NaN si falta) e índices ordenados construidos bajo demanda.
+    Las consultas trabajan sobre una vista; un refresco publica una vista nueva.
+    """
+    def __init__(self, docs):
+        self.ids = list(docs.keys())
+        self.docs = [docs[doc_id] for doc_id in self.ids]
+        self.columns = {}
+        self._indexes = {}
+
+        numeric_fields = {k for doc in self.docs for k, v in doc.items() if _is_number(v)}
+        for field in numeric_fields:
+            self.columns[field] = np.array(
+                [doc.get(field) if _is_number(doc.get(field)) else np.nan for doc in self.docs],
+                dtype=np.float64,
+            )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index(self, field):
+        """Devuelve (orden, valores_ordenados) sin NaN para 'field'."""
+        cached = self._indexes.get(field)
+        if cached is None:
+            values = self.columns[field]
+            order = np.argsort(values, kind="stable")   # Los NaN quedan al final
+            n_valid = int(np.count_nonzero(~np.isnan(values)))
+            order = order[:n_valid]
+            cached = (order, values[order])
+            self._indexes[field] = cached
+        return cached
+
+    def query(self, ranges, sort_field=None, descending=False, limit=None):
+        """
+        Filtra por rangos inclusivos {campo: (min, max)} (None = sin límite),
+        ordena por 'sort_field' y devuelve como mucho 'limit' posiciones.
+        """
+        for field in list(ranges) + ([sort_field] if sort_field else []):
+            if field not in self.columns:
+                raise KeyError(field)
+
+        candidates = None
+        if ranges:
+            # Empezamos por el rango más selectivo usando su índice ordenado y
+            # comprobamos el resto de rangos directamente sobre las columnas.
+            slices = {}
+            for field, (low, high) in ranges.items():
+                order, sorted_values = self.index(field)
+                start = 0 if low is None else np.searchsorted(sorted_values, low, side="left")
+                end = len(sorted_values) if high is None else np.searchsorted(sorted_values, high, side="right")
+                slices[field] = order[start:end]
+            first = min(slices, key=lambda f: len(slices[f]))
+            candidates = slices[first]
+            for field, (low, high) in ranges.items():
+                if field == first or len(candidates) == 0:
+                    continue
+                values = self.columns[field][candidates]
+                mask = ~np.isnan(values)
+                if low is not None:
+                    mask &= values >= low
+                if high is not None:
+                    mask &= values <= high
+                candidates = candidates[mask]
+            if sort_field is None:
+                candidates = np.sort(candidates)
+
+        if sort_field is not None:
+            if candidates is None:
+                order, _ = self.index(sort_field)
+                candidates = order[::-1] if descending else order
+            else:
+                values = self.columns[sort_field][candidates]
+                candidates = candidates[~np.isnan(values)]
+                values = values[~np.isnan(values)]
+                keys = -values if descending else values
+                if limit is not None and limit < len(candidates):
+                    # Top-k: seleccionamos los k primeros y solo ordenamos esos.
+                    top = np.argpartition(keys, limit - 1)[:limit]
+                    candidates, keys = candidates[top], keys[top]
+                candidates = candidates[np.argsort(keys, kind="stable")]
+        elif candidates is None:
+            candidates = np.arange(len(self.ids))
+
+        if limit is not None:
+            candidates = candidates[:limit]
+        return candidates
+
+class ColumnarSnapshot:
+    """
+    Mantiene la vista al día con refrescos incrementales: solo se piden a
+    Firestore los documentos con 'updated_at' posterior a la última marca, y un
+    documento ya conocido solo se reemplaza si cambió su 'update_time'. Cada
+    'full_reload_seconds' se recarga todo para recoger borrados y documentos
+    antiguos sin 'updated_at'.
+    """
+    def __init__(self, refresh_seconds=5.0, full_reload_seconds=600.0):
+        self.refresh_seconds = refresh_seconds
+        self.full_reload_seconds = full_reload_seconds
+        self._docs = {}
+        self._update_times = {}
+        self._watermark = None
+        self._view = SnapshotView({})
+        self._last_refresh = -math.inf
+        self._last_full_reload = -math.inf
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            refresh_seconds=float(os.environ.get("SNAPSHOT_REFRESH_SECONDS", 5)),
+            full_reload_seconds=float(os.environ.get("SNAPSHOT_FULL_RELOAD_SECONDS", 600)),
+        )
+
+    def view(self, collection_ref):
+        """Devuelve una vista actualizada (refrescando si hace falta)."""
+        now = time.monotonic()
+        if now - self._last_refresh >= self.refresh_seconds:
+            with self._lock:
+                if now - self._last_refresh >= self.refresh_seconds:
+                    self._refresh(collection_ref, now)
+        return self._view
+
+    def _refresh(self, collection_ref, now):
+        started = time.perf_counter()
+        full = now - self._last_full_reload >= self.full_reload_seconds
+        if full:
+            self._docs, self._update_times, self._watermark = {}, {}, None
+            stream = collection_ref.stream()
+        else:
+            since = self._watermark - WATERMARK_OVERLAP
+            stream = collection_ref.where(filter=FieldFilter(UPDATED_AT_FIELD, ">", since)).stream()
+
+        changed = 0
+        for doc in stream:
+            if self._update_times.get(doc.id) == doc.update_time:
+                continue
+            data = doc.to_dict()
+            data["id"] = doc.id
+            self._docs[doc.id] = data
+            self._update_times[doc.id] = doc.update_time
+            updated_at = data.get(UPDATED_AT_FIELD)
+            if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+            changed += 1
+
+        if self._watermark is None:
+            # Ningún documento tiene aún 'updated_at': vigilamos desde ahora.
+            self._watermark = datetime.now(timezone.utc)
+
+        if full or changed:
+            self._view = SnapshotView(self._docs)
+        self._last_refresh = now
+        if full:
+            self._last_full_reload = now
+        print(f"Instantánea {'completa' if full else 'incremental'}: {changed} documentos "
+              f"({len(self._view)} en total) en {time.perf_counter() - started:.3f}s.")
+
+def parse_query_args(args, default_limit=100, max_limit=5000):
+    """
+    Interpreta los parámetros de /_query:
+    - <campo>_min / <campo>_max: rangos inclusivos sobre campos numéricos.
+    - sort=<campo>, order=asc|desc, limit=<k>.
+    Lanza ValueError si algún valor no es válido.
+    """
+    ranges = {}
+    for name, raw_value in args.items():
+        for suffix, position in (("_min", 0), ("_max", 1)):
+            if name.endswith(suffix) and len(name) > len(suffix):
+                field = name[: -len(suffix)]
+                try:
+                    value = float(raw_value)
+                except ValueError:
+                    raise ValueError(f"El valor de '{name}' debe ser numérico.")
+                bounds = list(ranges.get(field, (None, None)))
+                bounds[position] = value
+                ranges[field] = tuple(bounds)
+
+    order = args.get("order", "asc")
+    if order not in ("asc", "desc"):
+        raise ValueError("El parámetro 'order' debe ser 'asc' o 'desc'.")
+    try:
+        limit = int(args.get("limit", default_limit))
+    except ValueError:
+        raise ValueError("El parámetro 'limit' debe ser un entero.")
+    limit = max(1, min(limit, max_limit))
+    return ranges, args.get("sort"), order == "desc", limit
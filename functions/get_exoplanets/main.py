@@ -1,25 +1,105 @@
+import time
 import functions_framework
 from flask import Request, jsonify
 from google.cloud import firestore
 
-firestore_client = None
+from common import exoplanet_stats
+from common.clients import get_firestore_client
+from common.instrumentation import instrumented, phase
+from common.response_cache import ResponseCache, response_cache, cached_json, cache_key, compute_etag
+from columnar_snapshot import UPDATED_AT_FIELD, ColumnarSnapshot, parse_query_args
+
+# Instantánea columnar para /_query, compartida por las peticiones de esta instancia
+exoplanet_snapshot = ColumnarSnapshot.from_env()
+# Rutas que se leen siempre de Firestore (una lectura de documento, tan barata
+# como revalidar la caché) pero mantienen el ETag y el 304 de cached_json
+uncached = ResponseCache(ttl_seconds=0)
 
 # Cabeceras CORS para permitir el acceso desde cualquier origen
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'GET, OPTIONS',
-    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Headers': 'Content-Type, If-None-Match, X-Exo-Profile',
+    'Access-Control-Expose-Headers': 'ETag, X-Cache',
 }
 
+def _collection_version(collection_ref):
+    """
+    Sello de versión de 'exoplanetas' compartido por todas las instancias: el
+    'updated_at' más reciente (lo escribe save_exoplanet en cada documento) y
+    el ID de ese documento. Cuesta una lectura de índice; el listado cacheado
+    se guarda bajo este sello, así que cualquier escritura lo invalida en todas
+    las instancias sin esperar al TTL. Los borrados hechos directamente en
+    Firestore no cambian el sello: esos solo se ven al caducar la entrada.
+    """
+    with phase("firestore_read"):
+        latest = list(collection_ref.order_by(UPDATED_AT_FIELD, direction=firestore.Query.DESCENDING)
+                      .limit(1).select([UPDATED_AT_FIELD]).stream())
+    if not latest:
+        return "empty"
+    updated_at = (latest[0].to_dict() or {}).get(UPDATED_AT_FIELD)
+    return f"{updated_at.isoformat() if updated_at is not None else ''}/{latest[0].id}"
+
+def _load_all(collection_ref):
+    all_docs, snapshots = [], []
+    for doc in collection_ref.stream():
+        doc_data = doc.to_dict()
+        doc_data['id'] = doc.id # Añadir el ID al resultado
+        all_docs.append(doc_data)
+        snapshots.append(doc)
+    return all_docs, 200, compute_etag(snapshots)
+
+def _load_one(collection_ref, doc_id):
+    doc = collection_ref.document(doc_id).get()
+    if not doc.exists:
+        return {"error": "Documento no encontrado"}, 404, None
+    return doc.to_dict(), 200, compute_etag([doc])
+
+def _load_stats():
+    """Estadísticas agregadas desde el documento de rollup (common/exoplanet_stats.py)."""
+    snapshot = exoplanet_stats.read_rollup(get_firestore_client())
+    return exoplanet_stats.summary(snapshot.to_dict() or {}), 200, compute_etag([snapshot])
+
+def _query(collection_ref, args):
+    """Resuelve filtros por rango, ordenación y top-k sobre la instantánea columnar."""
+    try:
+        ranges, sort_field, descending, limit = parse_query_args(args)
+    except ValueError as e:
+        return (jsonify({"error": str(e)}), 400, CORS_HEADERS)
+
+    with phase("firestore_read"):
+        view = exoplanet_snapshot.view(collection_ref)
+    started = time.perf_counter()
+    try:
+        with phase("query"):
+            positions = view.query(ranges, sort_field=sort_field, descending=descending, limit=limit)
+    except KeyError as e:
+        return (jsonify({"error": f"El campo {e} no existe o no es numérico."}), 400, CORS_HEADERS)
+    results = [view.docs[i] for i in positions]
+    query_ms = round((time.perf_counter() - started) * 1000, 3)
+    with phase("serialize"):
+        response = jsonify({
+            "results": results,
+            "returned": len(results),
+            "snapshot_size": len(view),
+            "query_ms": query_ms,
+        })
+    return (response, 200, CORS_HEADERS)
+
 @functions_framework.http
+@instrumented("get_exoplanets")
 def get_exoplanets(request: Request):
     """
     Consulta documentos de la colección 'exoplanetas' de Firestore.
     - GET /: Lista todos los documentos.
     - GET /{doc_id}: Obtiene un documento específico.
+    - GET /_query?<campo>_min=&<campo>_max=&sort=&order=&limit=: consulta por
+      rangos sobre la instantánea columnar en memoria.
+    - GET /_stats: recuentos por disposición y misión e histogramas de radio y
+      periodo, leídos de un único documento que mantiene save_exoplanet.
+    Todas las respuestas llevan ETag (If-None-Match -> 304). El listado pasa
+    además por la caché en memoria, revalidada con _collection_version.
     """
-    global firestore_client
-
     if request.method == 'OPTIONS':
         return ('', 204, CORS_HEADERS)
 
@@ -27,31 +107,34 @@ def get_exoplanets(request: Request):
         return (jsonify({"error": "Método no permitido"}), 405, CORS_HEADERS)
 
     try:
-        if firestore_client is None:
-            firestore_client = firestore.Client()
-        
         # Extraer la ruta de la URL para decidir si listar todo o buscar uno
         path_parts = request.path.strip('/').split('/')
-        collection_ref = firestore_client.collection('exoplanetas')
+        collection_ref = get_firestore_client().collection('exoplanetas')
 
         # Si la URL es solo la base (ej. /get-exoplanets), listar todo
         if len(path_parts) == 1:
-            all_docs = []
-            for doc in collection_ref.stream():
-                doc_data = doc.to_dict()
-                doc_data['id'] = doc.id # Añadir el ID al resultado
-                all_docs.append(doc_data)
-            return (jsonify(all_docs), 200, CORS_HEADERS)
+            key = f"{cache_key('exoplanetas', request, 'list')}@{_collection_version(collection_ref)}"
+            return cached_json(response_cache, request, key, lambda: _load_all(collection_ref), CORS_HEADERS)
         
+        # Consulta por rangos sobre la instantánea (ej. /get-exoplanets/_query?pl_rade_max=2)
+        elif len(path_parts) == 2 and path_parts[1] == '_query':
+            return _query(collection_ref, request.args)
+
+        # Estadísticas agregadas (ej. /get-exoplanets/_stats)
+        elif len(path_parts) == 2 and path_parts[1] == '_stats':
+            # Sin caché de respuestas: la antigüedad máxima es la del rollup (STATS_ROLLUP_MAX_AGE_SECONDS)
+            key = cache_key('exoplanetas', request, 'stats')
+            return cached_json(uncached, request, key, _load_stats, CORS_HEADERS)
+
+        # Métricas de la caché de esta instancia (ej. /get-exoplanets/_metrics)
+        elif len(path_parts) == 2 and path_parts[1] == '_metrics':
+            return (jsonify({"response_cache": response_cache.stats()}), 200, CORS_HEADERS)
+
         # Si la URL tiene un ID (ej. /get-exoplanets/xyz), buscar ese documento
         elif len(path_parts) == 2:
             doc_id = path_parts[1]
-            doc_ref = collection_ref.document(doc_id)
-            doc = doc_ref.get()
-            if doc.exists:
-                return (jsonify(doc.to_dict()), 200, CORS_HEADERS)
-            else:
-                return (jsonify({"error": "Documento no encontrado"}), 404, CORS_HEADERS)
+            key = cache_key('exoplanetas', request, 'doc', doc_id)
+            return cached_json(uncached, request, key, lambda: _load_one(collection_ref, doc_id), CORS_HEADERS)
         
         # Ruta no válida
         return (jsonify({"error": "Ruta no válida"}), 400, CORS_HEADERS)
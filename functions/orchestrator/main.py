@@ -1,6 +1,5 @@
 import functions_framework
 from flask import Request, jsonify
-from google.cloud import firestore
 import os
 import uuid
 import json
@@ -8,14 +7,16 @@ import hashlib
 
 import vertexai
 from vertexai.generative_models import GenerativeModel
-from google.cloud import storage, tasks_v2
+from google.cloud import tasks_v2
+
+from common.clients import get_firestore_client, get_storage_client, get_tasks_client
+from common.instrumentation import instrumented, phase
+from preflight import profile_csv
 
 # --- INICIALIZACIÓN DE CLIENTES (GLOBALES) ---
-# Se inicializarán de forma perezosa (solo la primera vez que se necesiten)
-storage_client = None
-tasks_client = None
+# Firestore, Storage y Cloud Tasks vienen de common/clients.py; el modelo de
+# Gemini se inicializa de forma perezosa (solo la primera vez que se necesite)
 gemini_model = None
-firestore_client = None
 
 # --- CONSTANTES ---
 UPLOAD_BUCKET_NAME = "exoplanets-nasa-models" 
@@ -75,6 +76,7 @@ def get_data_source_from_headers(headers: str) -> str:
 
 
 @functions_framework.http
+@instrumented("orchestrator")
 def orchestrator_function(request: Request):
     """
     Cloud Function #1: El Orquestador Inteligente e Idempotente con CORS.
@@ -85,21 +87,17 @@ def orchestrator_function(request: Request):
     cors_headers = {
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type',
+        'Access-Control-Allow-Headers': 'Content-Type, X-Exo-Profile',
     }
 
     # Manejar solicitud PREFLIGHT de CORS (el navegador la envía antes del POST)
     if request.method == 'OPTIONS':
         return ('', 204, cors_headers)
 
-    # --- INICIALIZACIÓN PEREZOSA DE CLIENTES ---
-    global storage_client, tasks_client, firestore_client
-    if storage_client is None:
-        storage_client = storage.Client()
-    if firestore_client is None:
-        firestore_client = firestore.Client()
-    if tasks_client is None:
-        tasks_client = tasks_v2.CloudTasksClient()
+    # --- CLIENTES COMPARTIDOS DEL PROCESO ---
+    storage_client = get_storage_client()
+    firestore_client = get_firestore_client()
+    tasks_client = get_tasks_client()
 
     try:
         # --- VALIDACIÓN DE ENTRADA ---
@@ -109,16 +107,19 @@ def orchestrator_function(request: Request):
         file = request.files['file']
         
         # --- LÓGICA DE IDEMPOTENCIA ---
-        file_content = file.read()
+        with phase("parse"):
+            file_content = file.read()
         if not file_content:
              return jsonify({"error": "El archivo enviado está vacío."}), 400, cors_headers
 
-        file_hash = hashlib.sha256(file_content).hexdigest()
+        with phase("hash"):
+            file_hash = hashlib.sha256(file_content).hexdigest()
         job_id = file_hash
         file.seek(0) # Rebobinar el archivo para poder leerlo de nuevo
 
         doc_ref = firestore_client.collection("exo_scout_models").document(job_id)
-        doc = doc_ref.get()
+        with phase("firestore_read"):
+            doc = doc_ref.get()
         if doc.exists:
             print(f"INFO: Job duplicado detectado: {job_id}. Devolviendo estado existente.")
             return jsonify(doc.to_dict()), 200, cors_headers
@@ -147,13 +148,28 @@ def orchestrator_function(request: Request):
         if not headers:
             return jsonify({"error": "No se encontró una línea de cabecera válida en el archivo."}), 400, cors_headers
         
-        data_source = get_data_source_from_headers(headers)
+        with phase("gemini"):
+            data_source = get_data_source_from_headers(headers)
         if data_source == "unknown":
             return jsonify({"error": "No se pudo determinar la fuente de datos (Kepler, TESS, K2) a partir de las columnas."}), 400, cors_headers
 
+        # --- VALIDACIÓN PREVIA (antes de subir y de gastar un entrenamiento) ---
+        with phase("preflight"):
+            preflight = profile_csv(file_content, data_source)
+        if preflight["errors"]:
+            print(f"WARN: Subida rechazada en la validación previa ({data_source}): {preflight['errors']}")
+            return jsonify({
+                "error": "El archivo no es válido para entrenar un modelo.",
+                "details": preflight["errors"],
+                "preflight": preflight,
+            }), 400, cors_headers
+        for warning in preflight["warnings"]:
+            print(f"WARN: {warning}")
+
         # --- SUBIDA A GCS Y CREACIÓN DE TAREA ---
         blob = storage_client.bucket(UPLOAD_BUCKET_NAME).blob(f"raw-uploads/{job_id}_{file.filename}")
-        blob.upload_from_file(file)
+        with phase("gcs_write"):
+            blob.upload_from_file(file)
         gcs_uri = f"gs://{UPLOAD_BUCKET_NAME}/{blob.name}"
         
         # Encolar la tarea para la segunda función
@@ -170,8 +186,11 @@ def orchestrator_function(request: Request):
             "gcs_input_uri": gcs_uri,
             "data_source": data_source,
             "algorithm": algorithm,
-            "model_name": model_name  
+            "model_name": model_name,
+            "preflight": preflight
         }
+        if "compact_model" in params:
+            task_payload["compact_model"] = bool(params["compact_model"])
         task = {
             "http_request": {
                 "http_method": tasks_v2.HttpMethod.POST,
@@ -181,10 +200,16 @@ def orchestrator_function(request: Request):
             }
         }
         parent = tasks_client.queue_path(gcp_project, gcp_location, tasks_queue)
-        tasks_client.create_task(parent=parent, task=task)
+        with phase("enqueue"):
+            tasks_client.create_task(parent=parent, task=task)
         print(f"INFO: Tarea para el job {job_id} encolada en {tasks_queue}")
         
-        return jsonify({"status": "processing", "job_id": job_id}), 202, cors_headers
+        return jsonify({
+            "status": "processing",
+            "job_id": job_id,
+            "warnings": preflight["warnings"],
+            "estimated_rows": preflight["estimated_rows"],
+        }), 202, cors_headers
 
     except Exception as e:
         print(f"ERROR CRÍTICO en la orquestación: {e}")
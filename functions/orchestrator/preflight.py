@@ -0,0 +1,155 @@
+# preflight.py
+#
+# Validación previa de un CSV antes de subirlo y encolar su entrenamiento:
+#   - la cabecera tiene la columna objetivo y features del pipeline
+#     (common/dataset_schema.py, el mismo contrato que usa el trainer),
+#   - una muestra de filas repartida por todo el archivo estima el número de
+#     filas, las clases, la tasa de nulos de cada feature y las filas que
+#     sobreviven al filtro de features mínimas.
+# Los problemas que harían fallar el entrenamiento son errores (la subida se
+# rechaza); el resto son avisos. La estimación viaja en la tarea del trainer.
+
+import csv
+from collections import Counter
+
+from common.dataset_schema import DATASET_SCHEMAS, feature_columns, min_valid_features, supported_sources, target_column
+
+SAMPLE_ROWS = 5_000            # Filas analizadas como máximo
+SAMPLE_BLOCKS = 20             # Bloques repartidos por el archivo de los que sale la muestra
+MIN_TRAINING_ROWS = 50         # Menos filas etiquetadas no dan para entrenar y evaluar
+MIN_CLASS_ROWS = 10            # Clases más pequeñas rompen el train_test_split estratificado
+EMPTY_FEATURE_NULL_RATE = 0.95 # Features prácticamente vacías
+NULL_VALUES = {"", "nan", "null", "none", "na"}
+
+def _find_header(data):
+    """Devuelve (campos_de_cabecera, inicio_de_datos) saltando los comentarios '#'."""
+    offset = 0
+    while offset < len(data):
+        end = data.find(b"\n", offset)
+        end = len(data) if end < 0 else end + 1
+        line = data[offset:end].decode("utf-8", errors="replace").strip()
+        if line and not line.startswith("#"):
+            return next(csv.reader([line])), end
+        offset = end
+    return None, len(data)
+
+def _sample_lines(data, start, total_rows, sample_rows, blocks):
+    """Líneas de datos de la muestra: todas si caben, si no bloques equiespaciados."""
+    if total_rows <= sample_rows:
+        return data[start:].decode("utf-8", errors="replace").splitlines(), True
+    per_block = max(1, sample_rows // blocks)
+    span = len(data) - start
+    lines = []
+    for block in range(blocks):
+        offset = start + span * block // blocks
+        if block:
+            # Saltar la línea parcial en la que cae el corte
+            offset = data.find(b"\n", offset)
+            if offset < 0:
+                break
+            offset += 1
+        chunk_end = offset
+        for _ in range(per_block):
+            chunk_end = data.find(b"\n", chunk_end)
+            if chunk_end < 0:
+                chunk_end = len(data)
+                break
+            chunk_end += 1
+        lines.extend(data[offset:chunk_end].decode("utf-8", errors="replace").splitlines())
+    return lines, False
+
+def _is_null(value):
+    return value.strip().lower() in NULL_VALUES
+
+def profile_csv(data, data_source, sample_rows=SAMPLE_ROWS, blocks=SAMPLE_BLOCKS):
+    """
+    Analiza los bytes del CSV para el pipeline de 'data_source'. Devuelve un
+    diccionario con la estimación y sus listas 'errors' y 'warnings'.
+    """
+    report = {"data_source": data_source, "size_bytes": len(data), "errors": [], "warnings": []}
+    errors, warnings = report["errors"], report["warnings"]
+
+    if data_source not in DATASET_SCHEMAS:
+        errors.append(f"No hay pipeline de entrenamiento para '{data_source}'. Fuentes admitidas: {supported_sources()}.")
+        return report
+
+    columns, data_start = _find_header(data)
+    if not columns:
+        errors.append("No se encontró una línea de cabecera válida en el archivo.")
+        return report
+
+    target = target_column(data_source)
+    expected = feature_columns(data_source)
+    present = [f for f in expected if f in columns]
+    missing = [f for f in expected if f not in columns]
+    report.update({"columns": len(columns), "features_present": present, "features_missing": missing})
+    if target not in columns:
+        errors.append(f"Falta la columna objetivo '{target}' para {data_source}.")
+    if not present:
+        errors.append(f"El archivo no tiene ninguna de las features de {data_source}: {expected}.")
+    elif missing:
+        warnings.append(f"Faltan {len(missing)} de {len(expected)} features de {data_source}: {missing}.")
+    if errors:
+        return report
+
+    # Filas de datos: un salto de línea por fila (los CSV del archivo de la NASA
+    # no tienen saltos de línea dentro de campos).
+    total_rows = data.count(b"\n", data_start) + (0 if data.endswith(b"\n") else 1)
+    lines, exact = _sample_lines(data, data_start, total_rows, sample_rows, blocks)
+
+    target_index = columns.index(target)
+    feature_indices = {f: columns.index(f) for f in present}
+    min_valid = min_valid_features(data_source)
+    classes, nulls = Counter(), Counter()
+    sampled = malformed = unlabeled = filtered_out = 0
+    for row in csv.reader(line for line in lines if line.strip() and not line.startswith("#")):
+        sampled += 1
+        if len(row) != len(columns):
+            malformed += 1
+            continue
+        valid_features = 0
+        for feature, index in feature_indices.items():
+            if _is_null(row[index]):
+                nulls[feature] += 1
+            else:
+                valid_features += 1
+        label = row[target_index].strip()
+        if not label:
+            unlabeled += 1
+        elif min_valid is not None and valid_features < min_valid:
+            filtered_out += 1
+        else:
+            classes[label] += 1
+
+    if exact:
+        total_rows = sampled
+    scale = total_rows / sampled if sampled else 0.0
+    parsed = sampled - malformed
+    estimated_classes = {label: int(round(count * scale)) for label, count in classes.most_common()}
+    trainable_rows = sum(estimated_classes.values())
+    report.update({
+        "estimated_rows": total_rows,
+        "sampled_rows": sampled,
+        "exact": exact,
+        "estimated_class_counts": estimated_classes,
+        "estimated_trainable_rows": trainable_rows,
+        "null_rates": {f: round(nulls[f] / parsed, 4) if parsed else None for f in present},
+        "malformed_rate": round(malformed / sampled, 4) if sampled else 0.0,
+        "unlabeled_rate": round(unlabeled / sampled, 4) if sampled else 0.0,
+    })
+
+    if trainable_rows < MIN_TRAINING_ROWS:
+        errors.append(f"Solo hay unas {trainable_rows} filas etiquetadas utilizables; el mínimo es {MIN_TRAINING_ROWS}.")
+    if len(classes) < 2:
+        errors.append(f"La columna '{target}' necesita al menos 2 clases; la muestra tiene {len(classes)}.")
+    small = [label for label, count in estimated_classes.items() if count < MIN_CLASS_ROWS]
+    if small:
+        warnings.append(f"Clases con menos de {MIN_CLASS_ROWS} filas estimadas: {small}.")
+    empty = [f for f, rate in report["null_rates"].items() if rate is not None and rate >= EMPTY_FEATURE_NULL_RATE]
+    if empty:
+        warnings.append(f"Features casi vacías (>= {EMPTY_FEATURE_NULL_RATE:.0%} nulos): {empty}.")
+    if malformed:
+        warnings.append(f"{report['malformed_rate']:.1%} de las filas de la muestra no tienen {len(columns)} campos y se ignoran.")
+    if filtered_out:
+        warnings.append(f"{filtered_out / sampled:.1%} de las filas tienen menos de {min_valid} features y el trainer las descartará.")
+    return report
@@ -0,0 +1,347 @@
+# batch_predictions.py
+#
+# Trabajos de predicción por lotes para ficheros que no caben en una petición
+# síncrona (p. ej. volver a puntuar una release completa de KOI):
+#
+#   POST /batch            crea el trabajo y encola su ejecución en Cloud Tasks
+#   GET  /batch/{id}       estado y progreso
+#   POST /batch/{id}/run   ejecución (la invoca Cloud Tasks con un token OIDC;
+#                          ruta de mantenimiento, ver common/maintenance_auth.py)
+#
+# La entrada tiene que estar en uno de los buckets de BATCH_INPUT_BUCKETS (por
+# defecto, los de subidas y modelos). El CSV se divide en rangos de bytes
+# alineados a fin de línea. Cada rango se descarga por separado, se puntúa con
+# el mismo pipeline que el predictor síncrono y se escribe como un fragmento
+# Parquet independiente bajo un prefijo fijo del bucket de modelos:
+#
+#   gs://{MODEL_BUCKET_NAME}/batch-predictions/{batch_id}/part-00000.parquet
+#   gs://{MODEL_BUCKET_NAME}/batch-predictions/{batch_id}/_manifest.json
+#
+# Los rangos se procesan en paralelo y cada rango terminado se anota en
+# Firestore, así que una ejecución interrumpida (o que agota su presupuesto de
+# tiempo y encola una continuación) solo repite los rangos pendientes. Cada
+# ejecución reclama el trabajo en una transacción ('lease_until'): una entrega
+# duplicada de la tarea mientras otra ejecución lo tiene recibe un 409 y Cloud
+# Tasks la reintenta más tarde.
+# Limitación: los CSV no pueden tener saltos de línea dentro de campos entrecomillados.
+
+import io
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.cloud import firestore, tasks_v2
+
+from common.instrumentation import phase
+
+BATCH_COLLECTION = "exo_scout_batch_predictions"
+MODEL_BUCKET_NAME = os.environ.get("MODEL_BUCKET_NAME", "exoplanets-nasa-models")
+UPLOAD_BUCKET_NAME = os.environ.get("UPLOAD_BUCKET_NAME", "exoplanets-nasa-models")
+# Buckets de los que se aceptan entradas (separados por comas). La cuenta de
+# servicio del predictor puede leer más buckets de los que debe exponer.
+INPUT_BUCKETS = {name.strip() for name in os.environ.get("BATCH_INPUT_BUCKETS", "").split(",") if name.strip()} \
+    or {UPLOAD_BUCKET_NAME, MODEL_BUCKET_NAME}
+OUTPUT_PREFIX = "batch-predictions"
+RANGE_BYTES = int(os.environ.get("EXO_BATCH_RANGE_BYTES", 16 * 1024 * 1024))
+BATCH_WORKERS = int(os.environ.get("EXO_BATCH_WORKERS", 4))
+# A partir de este tiempo de ejecución no se empiezan rangos nuevos y se encola
+# una continuación; debe quedar por debajo del timeout de la función.
+TIME_BUDGET_SECONDS = float(os.environ.get("EXO_BATCH_TIME_BUDGET_SECONDS", 480))
+# Duración del lease de una ejecución; debe cubrir el timeout de la función.
+LEASE_SECONDS = float(os.environ.get("EXO_BATCH_LEASE_SECONDS", TIME_BUDGET_SECONDS + 120))
+PROBE_BYTES = 64 * 1024
+MANIFEST_NAME = "_manifest.json"
+# Columnas identificativas que se copian de la entrada a la salida si existen
+ID_COLUMNS = ["kepid", "kepoi_name", "kepler_name", "pl_name", "hostname", "tic_id", "toi"]
+
+def _split_uri(gcs_uri):
+    bucket_name, blob_name = gcs_uri.replace("gs://", "").split("/", 1)
+    return bucket_name, blob_name
+
+def input_allowed(input_uri):
+    """True si 'input_uri' es gs://bucket/objeto en uno de los buckets de entrada permitidos."""
+    if not (input_uri or "").startswith("gs://") or "/" not in input_uri[5:]:
+        return False
+    bucket_name, blob_name = _split_uri(input_uri)
+    return bucket_name in INPUT_BUCKETS and bool(blob_name)
+
+def output_prefix(batch_id):
+    """Carpeta de salida del trabajo en el bucket de modelos."""
+    return f"{OUTPUT_PREFIX}/{batch_id}"
+
+def _batch_ref(firestore_client, batch_id):
+    return firestore_client.collection(BATCH_COLLECTION).document(batch_id)
+
+# =============================================================================
+# PLANIFICACIÓN DE RANGOS
+# =============================================================================
+
+def _next_line_start(blob, offset, size):
+    """Primer byte de la línea siguiente a 'offset' (o 'size' si no hay más líneas)."""
+    while offset < size:
+        window = blob.download_as_bytes(start=offset, end=min(offset + PROBE_BYTES, size) - 1)
+        newline = window.find(b"\n")
+        if newline >= 0:
+            return offset + newline + 1
+        offset += len(window)
+    return size
+
+def _locate_header(blob, size):
+    """Devuelve (cabecera, inicio_de_datos) saltando los comentarios '#' del archivo de la NASA."""
+    offset = 0
+    while offset < size:
+        line_end = _next_line_start(blob, offset, size)
+        line = blob.download_as_bytes(start=offset, end=line_end - 1)
+        if line.strip() and not line.startswith(b"#"):
+            return line if line.endswith(b"\n") else line + b"\n", line_end
+        offset = line_end
+    raise ValueError("El CSV de entrada no tiene cabecera.")
+
+def plan_ranges(blob, range_bytes=RANGE_BYTES):
+    """Divide el CSV en rangos [start, end) de unos 'range_bytes' que empiezan y acaban en fin de línea."""
+    blob.reload()
+    size = blob.size or 0
+    header, data_start = _locate_header(blob, size)
+    cuts = range(data_start + range_bytes, size, range_bytes)
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        boundaries = [data_start, *executor.map(lambda cut: _next_line_start(blob, cut - 1, size), cuts), size]
+    ranges = [{"start": start, "end": end} for start, end in zip(boundaries, boundaries[1:]) if end > start]
+    return header.decode("utf-8"), ranges
+
+# =============================================================================
+# CREACIÓN Y ESTADO
+# =============================================================================
+
+def _enqueue_run(tasks_client, batch_id):
+    gcp_project = os.environ.get("GCP_PROJECT")
+    gcp_location = os.environ.get("GCP_LOCATION", "us-central1")
+    predictor_function_url = os.environ.get("PREDICTOR_FUNCTION_URL")
+    tasks_queue = os.environ.get("BATCH_TASKS_QUEUE", os.environ.get("TASKS_QUEUE", "exo-scout-queue"))
+
+    if not all([gcp_project, gcp_location, predictor_function_url, tasks_queue]):
+        raise RuntimeError("Faltan variables de entorno para Cloud Tasks.")
+
+    url = f"{predictor_function_url.rstrip('/')}/batch/{batch_id}/run"
+    task = {
+        "http_request": {
+            "http_method": tasks_v2.HttpMethod.POST,
+            "url": url,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"batch_id": batch_id}).encode(),
+        }
+    }
+    invoker = os.environ.get("BATCH_INVOKER_SERVICE_ACCOUNT")
+    if invoker:
+        # Sin token, la ruta de ejecución rechaza la tarea (common/maintenance_auth.py)
+        audience = (os.environ.get("MAINTENANCE_AUDIENCE") or "").split(",")[0].strip() or url
+        task["http_request"]["oidc_token"] = {"service_account_email": invoker, "audience": audience}
+    else:
+        print("WARN: BATCH_INVOKER_SERVICE_ACCOUNT no está definida; la ejecución del batch irá sin token OIDC.")
+    parent = tasks_client.queue_path(gcp_project, gcp_location, tasks_queue)
+    with phase("enqueue"):
+        tasks_client.create_task(parent=parent, task=task)
+    print(f"INFO: Ejecución del batch {batch_id} encolada en {tasks_queue}")
+
+def create_batch(firestore_client, tasks_client, model, input_uri):
+    """
+    Registra el trabajo ('queued') y encola su ejecución. 'model' viene de
+    _resolve_model; 'input_uri' ya pasó input_allowed().
+    """
+    batch_id = uuid.uuid4().hex
+    batch = {
+        "batch_id": batch_id,
+        "status": "queued",
+        "job_id": model["job_id"],
+        "alias": model.get("alias"),
+        "data_source": model["data_source"],
+        "gcs_artifacts_path": model["gcs_uri"],
+        "input_uri": input_uri,
+        "output_uri": f"gs://{MODEL_BUCKET_NAME}/{output_prefix(batch_id)}/",
+        "completed_ranges": [],
+        "rows_scored": 0,
+        "created_at": datetime.now(),
+    }
+    with phase("firestore_write"):
+        _batch_ref(firestore_client, batch_id).set(batch)
+    _enqueue_run(tasks_client, batch_id)
+    return batch
+
+def batch_status(data):
+    """Vista pública del documento del trabajo (sin la cabecera ni la lista de rangos)."""
+    ranges_total = len(data.get("ranges") or [])
+    ranges_done = len(data.get("completed_ranges") or [])
+    status = {key: data.get(key) for key in (
+        "batch_id", "status", "job_id", "alias", "input_uri", "output_uri", "rows_scored",
+        "created_at", "started_at", "completed_at", "error_message",
+    )}
+    status.update({
+        "ranges_total": ranges_total,
+        "ranges_done": ranges_done,
+        "progress": round(ranges_done / ranges_total, 4) if ranges_total else 0.0,
+    })
+    return status
+
+def get_batch(firestore_client, batch_id):
+    with phase("firestore_read"):
+        doc = _batch_ref(firestore_client, batch_id).get()
+    return batch_status(doc.to_dict()) if doc.exists else None
+
+# =============================================================================
+# EJECUCIÓN
+# =============================================================================
+
+def _predictions_table(df, probabilities, class_names):
+    columns = {column: df[column].to_numpy() for column in ID_COLUMNS if column in df.columns}
+    columns["prediction"] = [class_names[i] for i in probabilities.argmax(axis=1)]
+    for j, class_name in enumerate(class_names):
+        columns[f"prob_{class_name}"] = probabilities[:, j].astype("float32")
+    return pa.table(columns)
+
+def _upload_parquet(blob, table):
+    sink = io.BytesIO()
+    pq.write_table(table, sink, compression="zstd")
+    blob.upload_from_string(sink.getvalue(), content_type="application/vnd.apache.parquet")
+
+class BatchBusy(Exception):
+    """Otra ejecución tiene el lease del trabajo."""
+
+@firestore.transactional
+def _claim_run(transaction, doc_ref, run_id):
+    """
+    Toma el lease del trabajo para esta ejecución. Devuelve el documento, o
+    None si no existe; BatchBusy si otra ejecución tiene un lease vigente.
+    """
+    snapshot = next(iter(transaction.get(doc_ref)))
+    if not snapshot.exists:
+        return None
+    batch = snapshot.to_dict()
+    if batch["status"] == "completed":
+        return batch
+    now = datetime.now(timezone.utc)
+    lease_until = batch.get("lease_until")
+    if lease_until and lease_until > now and batch.get("lease_owner") != run_id:
+        raise BatchBusy(f"El batch {batch['batch_id']} ya se está ejecutando (lease hasta {lease_until.isoformat()}).")
+    lease = {"status": "running", "lease_owner": run_id, "lease_until": now + timedelta(seconds=LEASE_SECONDS)}
+    transaction.update(doc_ref, {**lease, "error_message": firestore.DELETE_FIELD})
+    batch.update(lease)
+    batch.pop("error_message", None)
+    return batch
+
+@firestore.transactional
+def _record_range(transaction, doc_ref, index, rows):
+    """Anota un rango terminado. Las filas solo se suman la primera vez que se anota."""
+    snapshot = next(iter(transaction.get(doc_ref)))
+    if index in (snapshot.to_dict().get("completed_ranges") or []):
+        return False
+    transaction.update(doc_ref, {
+        "completed_ranges": firestore.ArrayUnion([index]),
+        "rows_scored": firestore.Increment(rows),
+    })
+    return True
+
+@firestore.transactional
+def _release(transaction, doc_ref, run_id, fields):
+    """Escribe 'fields' y suelta el lease si sigue siendo de esta ejecución."""
+    snapshot = next(iter(transaction.get(doc_ref)))
+    if snapshot.to_dict().get("lease_owner") == run_id:
+        fields = {**fields, "lease_owner": firestore.DELETE_FIELD, "lease_until": firestore.DELETE_FIELD}
+    if fields:
+        transaction.update(doc_ref, fields)
+
+def run_batch(firestore_client, storage_client, tasks_client, batch_id, load_artifacts, apply_pipeline, class_names):
+    """
+    Procesa los rangos pendientes del trabajo. Devuelve su estado, o None si no existe.
+    Lanza BatchBusy si otra ejecución lo tiene reclamado.
+    'load_artifacts', 'apply_pipeline' y 'class_names' son las funciones del
+    predictor síncrono, para puntuar exactamente igual.
+    """
+    doc_ref = _batch_ref(firestore_client, batch_id)
+    run_id = uuid.uuid4().hex
+    with phase("firestore_write"):
+        batch = _claim_run(firestore_client.transaction(), doc_ref, run_id)
+    if batch is None:
+        return None
+    if batch["status"] == "completed":
+        return batch_status(batch)
+
+    bucket_name, input_name = _split_uri(batch["input_uri"])
+    input_blob = storage_client.bucket(bucket_name).blob(input_name)
+    output_bucket = storage_client.bucket(MODEL_BUCKET_NAME)
+    prefix = output_prefix(batch_id)
+
+    # Primera ejecución: dividir la entrada. Las siguientes reutilizan el mismo plan.
+    if not batch.get("ranges"):
+        with phase("plan"):
+            header, ranges = plan_ranges(input_blob)
+        batch.update({"header": header, "ranges": ranges, "started_at": datetime.now()})
+        doc_ref.update({key: batch[key] for key in ("header", "ranges", "started_at")})
+        print(f"INFO: Batch {batch_id}: {len(ranges)} rangos de hasta {RANGE_BYTES} bytes.")
+
+    done = set(batch.get("completed_ranges") or [])
+    pending = [i for i in range(len(batch["ranges"])) if i not in done]
+    header = batch["header"].encode("utf-8")
+
+    with phase("unpickle"):
+        artifacts = load_artifacts(batch["gcs_artifacts_path"])
+        model, names = artifacts['model'], list(class_names(artifacts))
+    deadline = time.monotonic() + TIME_BUDGET_SECONDS
+
+    def score_range(index):
+        if time.monotonic() > deadline:
+            return None
+        byte_range = batch["ranges"][index]
+        data = input_blob.download_as_bytes(start=byte_range["start"], end=byte_range["end"] - 1)
+        df = pd.read_csv(io.BytesIO(header + data), comment='#', low_memory=False)
+        if not df.empty:
+            X_prepared = apply_pipeline(df, artifacts, batch["data_source"])
+            table = _predictions_table(df, model.predict_proba(X_prepared), names)
+            _upload_parquet(output_bucket.blob(f"{prefix}/part-{index:05d}.parquet"), table)
+        # El fragmento se sobrescribe igual si otra ejecución ya lo hizo; las filas no se cuentan dos veces
+        _record_range(firestore_client.transaction(), doc_ref, index, len(df))
+        return len(df)
+
+    with phase("predict"), ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        futures = {index: executor.submit(score_range, index) for index in pending}
+    failed = {index: future.exception() for index, future in futures.items() if future.exception() is not None}
+    skipped = [index for index, future in futures.items() if index not in failed and future.result() is None]
+
+    if failed:
+        # Cloud Tasks reintenta la ejecución, que retoma los rangos pendientes
+        index, error = next(iter(failed.items()))
+        _release(firestore_client.transaction(), doc_ref, run_id, {"status": "retrying", "error_message": f"Rango {index}: {error}"})
+        raise RuntimeError(f"Fallaron {len(failed)} rangos del batch {batch_id}; el primero ({index}): {error}")
+
+    if skipped:
+        print(f"INFO: Batch {batch_id}: presupuesto de tiempo agotado con {len(skipped)} rangos pendientes.")
+        _release(firestore_client.transaction(), doc_ref, run_id, {})
+        _enqueue_run(tasks_client, batch_id)
+        with phase("firestore_read"):
+            return batch_status(doc_ref.get().to_dict())
+
+    # Todos los rangos están hechos: escribir el manifiesto de la salida
+    with phase("firestore_read"):
+        batch = doc_ref.get().to_dict()
+    with phase("gcs_read"):
+        parts = sorted(blob.name.rsplit("/", 1)[1] for blob in storage_client.list_blobs(MODEL_BUCKET_NAME, prefix=f"{prefix}/part-"))
+    manifest = {
+        "batch_id": batch_id,
+        "job_id": batch["job_id"],
+        "input_uri": batch["input_uri"],
+        "classes": names,
+        "rows": batch.get("rows_scored", 0),
+        "parts": parts,
+        "created_at": datetime.now().isoformat(),
+    }
+    with phase("gcs_write"):
+        output_bucket.blob(f"{prefix}/{MANIFEST_NAME}").upload_from_string(json.dumps(manifest, indent=2), content_type="application/json")
+    completed = {"status": "completed", "completed_at": datetime.now()}
+    _release(firestore_client.transaction(), doc_ref, run_id, completed)
+    batch.update(completed)
+    print(f"✓ Batch {batch_id} completado: {batch.get('rows_scored', 0)} filas en {len(parts)} fragmentos.")
+    return batch_status(batch)
@@ -0,0 +1,331 @@
+# common/artifact_bundle.py
+#
+# Formato de artefactos dividido: un manifiesto pequeño más un objeto por
+# componente (model, scaler, imputer, label_encoder y, si existe, compact_model).
+# Este archivo se mantiene idéntico en el trainer (escritura) y en el predictor
+# (lectura).
+#
+#   models/{job_id}/bundle/manifest.json
+#   models/{job_id}/bundle/{componente}.pkl.zst      pickle 5 sin los arrays
+#   models/{job_id}/bundle/{componente}.buffers.zst  arrays NumPy concatenados
+#
+# Los arrays viajan fuera del pickle (buffers out-of-band del protocolo 5) para
+# poder descomprimirlos una vez en disco local y mapearlos en memoria.
+
+import base64
+import json
+import os
+import pickle
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import google_crc32c
+import numpy as np
+import zstandard
+
+from common.instrumentation import phase
+
+BUNDLE_FORMAT = "exo-bundle/1"
+MANIFEST_NAME = "manifest.json"
+COMPONENTS = ("model", "scaler", "imputer", "label_encoder", "compact_model")
+BUFFER_ALIGNMENT = 64
+ZSTD_LEVEL = 3
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+CACHE_DIR = os.environ.get("EXO_BUNDLE_CACHE_DIR", "/tmp/exo-bundles")
+# Bundles abiertos que se conservan en memoria por proceso (con sus componentes ya cargados)
+MAX_OPEN_BUNDLES = int(os.environ.get("EXO_MAX_OPEN_BUNDLES", 4))
+# /tmp en Cloud Functions es un sistema de archivos en memoria: cuenta contra la RAM de la instancia
+MAX_CACHE_BYTES = int(os.environ.get("EXO_BUNDLE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+_open_bundles = OrderedDict()
+_open_bundles_lock = threading.Lock()
+
+def _split_uri(gcs_uri):
+    bucket_name, blob_name = gcs_uri.replace("gs://", "").split("/", 1)
+    return bucket_name, blob_name
+
+def _crc32c(data):
+    return base64.b64encode(google_crc32c.Checksum(data).digest()).decode("ascii")
+
+def _compress(data):
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1, write_content_size=True).compress(data)
+
+def _decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+def _dir_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Otro hilo o proceso lo acaba de borrar
+    return size
+
+def _trim_cache(cache_root, keep, max_bytes=None):
+    """
+    Borra los directorios de bundle más antiguos de 'cache_root' hasta que el
+    total quepa en 'max_bytes'. Nunca borra 'keep' (el bundle que se está
+    cargando). Los arrays ya mapeados siguen siendo válidos tras el borrado; un
+    componente aún no cargado se vuelve a descargar si se pide.
+    """
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    try:
+        entries = [os.path.join(cache_root, name) for name in os.listdir(cache_root)]
+    except FileNotFoundError:
+        return
+    dirs = []
+    for path in entries:
+        try:
+            dirs.append((os.path.getmtime(path), path, _dir_size(path)))
+        except OSError:
+            continue
+    total = sum(size for _, _, size in dirs)
+    for _, path, size in sorted(dirs):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        print(f"INFO: Caché de bundles por encima de {max_bytes} bytes; borrado {os.path.basename(path)}.")
+
+# =============================================================================
+# ESCRITURA (trainer)
+# =============================================================================
+
+def _serialize_component(obj):
+    """Devuelve (pickle_sin_arrays, bytes_de_buffers, [(offset, longitud), ...])."""
+    buffers = []
+    payload = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    blob, layout = bytearray(), []
+    for buffer in buffers:
+        raw = buffer.raw()
+        blob.extend(b"\0" * (-len(blob) % BUFFER_ALIGNMENT))
+        layout.append((len(blob), raw.nbytes))
+        blob.extend(raw)
+    return payload, bytes(blob), layout
+
+def _default_upload(blob, data):
+    blob.upload_from_string(data, content_type="application/octet-stream")
+
+def write_bundle(bucket, prefix, artifacts, upload=_default_upload, max_workers=4):
+    """
+    Sube los artefactos como bundle bajo 'prefix' (p. ej. 'models/{job_id}/bundle').
+    Los componentes se suben en paralelo y el manifiesto al final, de modo que un
+    manifiesto visible siempre apunta a componentes completos.
+    Devuelve (manifest_uri, manifest).
+    """
+    label_encoder = artifacts.get("label_encoder")
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "bundle_id": uuid.uuid4().hex,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "classes": [str(c) for c in label_encoder.classes_] if label_encoder is not None else None,
+        "components": {},
+    }
+    if "feature_names" in artifacts:
+        manifest["feature_names"] = list(artifacts["feature_names"])
+
+    uploads = []
+    for name in COMPONENTS:
+        if name not in artifacts:
+            continue
+        payload, buffers, layout = _serialize_component(artifacts[name])
+        compressed = _compress(payload)
+        entry = {
+            "object": f"{name}.pkl.zst",
+            "size": len(compressed),
+            "raw_size": len(payload),
+            "crc32c": _crc32c(compressed),
+        }
+        uploads.append((f"{prefix}/{entry['object']}", compressed))
+        if layout:
+            compressed_buffers = _compress(buffers)
+            entry["buffers"] = {
+                "object": f"{name}.buffers.zst",
+                "size": len(compressed_buffers),
+                "raw_size": len(buffers),
+                "crc32c": _crc32c(compressed_buffers),
+                "layout": layout,
+            }
+            uploads.append((f"{prefix}/{entry['buffers']['object']}", compressed_buffers))
+        manifest["components"][name] = entry
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda item: upload(bucket.blob(item[0]), item[1]), uploads))
+
+    manifest_blob = bucket.blob(f"{prefix}/{MANIFEST_NAME}")
+    manifest_blob.upload_from_string(json.dumps(manifest), content_type="application/json")
+    return f"gs://{bucket.name}/{manifest_blob.name}", manifest
+
+def bundle_size(manifest):
+    """Bytes comprimidos y sin comprimir de todos los componentes."""
+    size = raw_size = 0
+    for entry in manifest["components"].values():
+        for part in (entry, entry.get("buffers")):
+            if part:
+                size += part["size"]
+                raw_size += part["raw_size"]
+    return size, raw_size
+
+# =============================================================================
+# LECTURA (predictor)
+# =============================================================================
+
+class ArtifactBundle:
+    """
+    Acceso perezoso a un bundle con la misma interfaz que el diccionario de
+    artefactos antiguo ('artifacts["scaler"]', KeyError si falta una clave).
+    'feature_names' y 'classes' salen del manifiesto sin descargar nada más;
+    cada componente se descarga y deserializa la primera vez que se pide.
+    """
+    def __init__(self, manifest_uri, storage_client, manifest=None, cache_dir=CACHE_DIR):
+        self.manifest_uri = manifest_uri
+        self._storage_client = storage_client
+        self._bucket_name, manifest_name = _split_uri(manifest_uri)
+        self._prefix = manifest_name.rsplit("/", 1)[0]
+        if manifest is None:
+            with phase("gcs_read"):
+                manifest = json.loads(self._blob(manifest_name).download_as_bytes())
+        self.manifest = manifest
+        if self.manifest.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"Formato de bundle no soportado: {self.manifest.get('format')}")
+        self.bundle_id = self.manifest["bundle_id"]
+        self._cache_root = cache_dir
+        self._cache_dir = os.path.join(cache_dir, self.bundle_id)
+        self._loaded = {}
+        self._locks = {name: threading.Lock() for name in self.manifest["components"]}
+
+    @property
+    def classes(self):
+        return self.manifest.get("classes")
+
+    def keys(self):
+        names = list(self.manifest["components"])
+        return names + (["feature_names"] if "feature_names" in self.manifest else [])
+
+    def __contains__(self, name):
+        return name in self.keys()
+
+    def __getitem__(self, name):
+        if name == "feature_names" and "feature_names" in self.manifest:
+            return self.manifest["feature_names"]
+        if name not in self.manifest["components"]:
+            raise KeyError(name)
+        component = self._loaded.get(name)
+        if component is None:
+            with self._locks[name]:
+                component = self._loaded.get(name)
+                if component is None:
+                    component = self._load_component(name)
+                    self._loaded[name] = component
+        return component
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def is_loaded(self, name):
+        return name in self._loaded
+
+    def release(self):
+        """Borra los componentes descomprimidos de este bundle de la caché local."""
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
+
+    def _blob(self, blob_name):
+        return self._storage_client.bucket(self._bucket_name).blob(blob_name)
+
+    def _cached_file(self, part):
+        """Descarga, verifica y descomprime 'part' en la caché local (una vez por bundle)."""
+        path = os.path.join(self._cache_dir, part["object"].removesuffix(".zst"))
+        if os.path.exists(path) and os.path.getsize(path) == part["raw_size"]:
+            return path
+        with phase("gcs_read"):
+            compressed = self._blob(f"{self._prefix}/{part['object']}").download_as_bytes()
+        if _crc32c(compressed) != part["crc32c"]:
+            raise IOError(f"CRC32C no coincide para {part['object']} del bundle {self.bundle_id}.")
+        os.makedirs(self._cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_decompress(compressed))
+        os.replace(tmp_path, path)  # Escritura atómica: otro hilo o proceso puede estar leyendo
+        _trim_cache(self._cache_root, keep=self._cache_dir)
+        return path
+
+    def _load_component(self, name):
+        entry = self.manifest["components"][name]
+        with open(self._cached_file(entry), "rb") as f:
+            payload = f.read()
+        buffers = None
+        if "buffers" in entry:
+            part = entry["buffers"]
+            path = self._cached_file(part)
+            # np.memmap no admite ficheros vacíos (todos los arrays de longitud 0)
+            mapped = np.memmap(path, mode="r", dtype=np.uint8) if part["raw_size"] else np.empty(0, dtype=np.uint8)
+            buffers = [memoryview(mapped[offset:offset + length]) for offset, length in part["layout"]]
+        with phase("unpickle"):
+            component = pickle.loads(payload, buffers=buffers)
+        print(f"✓ Componente '{name}' cargado del bundle {self.bundle_id}.")
+        return component
+
+def open_bundle(manifest_uri, storage_client):
+    """
+    Abre un bundle reutilizando el de una petición anterior si el manifiesto
+    sigue siendo el mismo. Solo se descarga el manifiesto (unos pocos KB): si el
+    job se reentrena, el 'bundle_id' cambia y se abre uno nuevo.
+    """
+    bucket_name, manifest_name = _split_uri(manifest_uri)
+    with phase("gcs_read"):
+        manifest = json.loads(storage_client.bucket(bucket_name).blob(manifest_name).download_as_bytes())
+    bundle_id = manifest.get("bundle_id")
+    evicted = []
+    with _open_bundles_lock:
+        bundle = _open_bundles.get(bundle_id)
+        if bundle is not None:
+            _open_bundles.move_to_end(bundle_id)
+            return bundle
+        bundle = ArtifactBundle(manifest_uri, storage_client, manifest=manifest)
+        _open_bundles[bundle_id] = bundle
+        while len(_open_bundles) > MAX_OPEN_BUNDLES:
+            evicted.append(_open_bundles.popitem(last=False)[1])
+    for old in evicted:
+        old.release()
+    return bundle
+
+def forget_bundles(job_id=None):
+    """
+    Descarta los bundles abiertos en memoria y sus ficheros locales: todos, o
+    con 'job_id' solo los de 'models/{job_id}/' (p. ej. tras borrar el job).
+    Devuelve cuántos se descartaron.
+    """
+    with _open_bundles_lock:
+        released = [(bundle_id, bundle) for bundle_id, bundle in _open_bundles.items()
+                    if job_id is None or f"/models/{job_id}/" in bundle.manifest_uri]
+        for bundle_id, _ in released:
+            del _open_bundles[bundle_id]
+    for _, bundle in released:
+        bundle.release()
+    return len(released)
+
+def load_artifacts(gcs_uri, storage_client):
+    """
+    Abre los artefactos de un modelo: un bundle si 'gcs_uri' es un manifiesto,
+    o el pickle completo (comprimido con zstd o el 'artifacts.pkl' antiguo).
+    """
+    if gcs_uri.endswith(f"/{MANIFEST_NAME}"):
+        return open_bundle(gcs_uri, storage_client)
+    bucket_name, blob_name = _split_uri(gcs_uri)
+    with phase("gcs_read"):
+        payload = storage_client.bucket(bucket_name).blob(blob_name).download_as_bytes()
+    with phase("unpickle"):
+        if payload.startswith(ZSTD_MAGIC):
+            payload = _decompress(payload)
+        return pickle.loads(payload)
@@ -0,0 +1,177 @@
+# common/instrumentation.py
+#
+# Medición por fases de las funciones HTTP. Cada respuesta lleva una cabecera
+# 'Server-Timing' y se escribe una línea de log estructurada (JSON) con las
+# fases. Opcionalmente se capturan perfiles de cProfile y tracemalloc.
+# Este archivo se mantiene idéntico en cada función que lo usa.
+#
+# Variables de entorno:
+#   EXO_PROFILE_SAMPLE_RATE  fracción de peticiones perfiladas (0 por defecto)
+#   EXO_PROFILE_TOKEN        si se define, 'X-Exo-Profile: <token>' perfila esa petición
+#   EXO_PROFILE_DIR          carpeta local de los perfiles (/tmp/exo-profiles)
+#   EXO_PROFILE_GCS_URI      gs://bucket/prefijo donde subir además los perfiles
+
+import contextvars
+import cProfile
+import functools
+import hmac
+import json
+import os
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+from flask import make_response
+
+PROFILE_SAMPLE_RATE = float(os.environ.get("EXO_PROFILE_SAMPLE_RATE", 0))
+PROFILE_TOKEN = os.environ.get("EXO_PROFILE_TOKEN")
+PROFILE_DIR = os.environ.get("EXO_PROFILE_DIR", "/tmp/exo-profiles")
+PROFILE_GCS_URI = os.environ.get("EXO_PROFILE_GCS_URI")
+PROFILE_HEADER = "X-Exo-Profile"
+
+_current = contextvars.ContextVar("exo_request_timings", default=None)
+# Solo puede haber un cProfile activo por proceso; las demás peticiones no se perfilan
+_profile_lock = threading.Lock()
+
+class RequestTimings:
+    """Tiempos exclusivos por fase: una fase anidada se descuenta de su padre."""
+    def __init__(self):
+        self.phases = {}
+        self._stack = []
+
+    def start(self, name):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def stop(self):
+        name, started, children = self._stack.pop()
+        elapsed = time.perf_counter() - started
+        self.phases[name] = self.phases.get(name, 0.0) + (elapsed - children) * 1000
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+@contextmanager
+def phase(name):
+    """Mide una fase de la petición en curso. Fuera de una petición no hace nada."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    timings.start(name)
+    try:
+        yield
+    finally:
+        timings.stop()
+
+def record_phase(name, ms):
+    """
+    Suma a la petición en curso una fase medida fuera de 'phase()' (p. ej. por
+    otro hilo). Si hay una fase abierta, se descuenta de ella como una anidada.
+    """
+    timings = _current.get()
+    if timings is None:
+        return
+    timings.phases[name] = timings.phases.get(name, 0.0) + ms
+    if timings._stack:
+        timings._stack[-1][2] += ms / 1000
+
+@contextmanager
+def separate_timings():
+    """Mide las fases del bloque aparte, sin sumarlas a la petición en curso. Da el RequestTimings."""
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+def _should_profile(request):
+    token = request.headers.get(PROFILE_HEADER)
+    if token and PROFILE_TOKEN and hmac.compare_digest(token, PROFILE_TOKEN):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def _save_profiles(function_name, profiler, memory_snapshot):
+    """Guarda los perfiles en PROFILE_DIR (y en GCS si está configurado). Devuelve el ID."""
+    capture_id = f"{function_name}-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    paths = [os.path.join(PROFILE_DIR, f"{capture_id}.prof")]
+    profiler.dump_stats(paths[0])
+    if memory_snapshot is not None:
+        paths.append(os.path.join(PROFILE_DIR, f"{capture_id}.tracemalloc"))
+        memory_snapshot.dump(paths[1])
+
+    if PROFILE_GCS_URI:
+        try:
+            from common.clients import get_storage_client
+            bucket_name, _, prefix = PROFILE_GCS_URI.replace("gs://", "").partition("/")
+            bucket = get_storage_client().bucket(bucket_name)
+            for path in paths:
+                bucket.blob(f"{prefix.rstrip('/')}/{os.path.basename(path)}".lstrip("/")).upload_from_filename(path)
+        except Exception as e:
+            print(f"WARN: No se pudieron subir los perfiles {capture_id} a GCS: {e}")
+    return capture_id
+
+def _server_timing(phases, total_ms):
+    entries = [f"{name.replace(' ', '_')};dur={ms:.1f}" for name, ms in phases.items()]
+    entries.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(entries)
+
+def instrumented(function_name):
+    """
+    Decorador para los handlers HTTP: mide las fases declaradas con 'phase()',
+    añade 'Server-Timing' a la respuesta y escribe un log estructurado.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(request, *args, **kwargs):
+            timings = RequestTimings()
+            token = _current.set(timings)
+
+            profiler = None
+            tracing_memory = False
+            if _should_profile(request) and _profile_lock.acquire(blocking=False):
+                profiler = cProfile.Profile()
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    tracing_memory = True
+                profiler.enable()
+
+            started = time.perf_counter()
+            try:
+                response = make_response(handler(request, *args, **kwargs))
+            finally:
+                total_ms = (time.perf_counter() - started) * 1000
+                _current.reset(token)
+                capture_id = None
+                if profiler is not None:
+                    profiler.disable()
+                    memory_snapshot = tracemalloc.take_snapshot() if tracing_memory else None
+                    if tracing_memory:
+                        tracemalloc.stop()
+                    _profile_lock.release()
+                    capture_id = _save_profiles(function_name, profiler, memory_snapshot)
+
+            response.headers["Server-Timing"] = _server_timing(timings.phases, total_ms)
+            response.headers["Timing-Allow-Origin"] = "*"
+            exposed = response.headers.get("Access-Control-Expose-Headers")
+            response.headers["Access-Control-Expose-Headers"] = f"{exposed}, Server-Timing" if exposed else "Server-Timing"
+
+            log_entry = {
+                "severity": "INFO",
+                "message": f"{function_name} {request.method} {request.path} {response.status_code} {total_ms:.1f}ms",
+                "function": function_name,
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "total_ms": round(total_ms, 2),
+                "phases_ms": {name: round(ms, 2) for name, ms in timings.phases.items()},
+            }
+            if capture_id:
+                log_entry["profile_id"] = capture_id
+            print(json.dumps(log_entry))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,165 @@
+# common/response_cache.py
+#
+# Caché de respuestas en memoria (por instancia) para las APIs de lectura.
+# Este archivo se mantiene idéntico en cada función que lo usa, porque cada
+# Cloud Function se despliega con su propia carpeta --source.
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, current_app
+
+from common.instrumentation import phase
+
+class CacheEntry:
+    """Cuerpo JSON serializado, su ETag y lo que costó generarlo."""
+    __slots__ = ("body", "etag", "expires_at", "fill_ms")
+
+    def __init__(self, body, etag, expires_at, fill_ms):
+        self.body = body
+        self.etag = etag
+        self.expires_at = expires_at
+        self.fill_ms = fill_ms
+
+class ResponseCache:
+    """
+    Caché LRU con TTL y límite de entradas y de bytes.
+    Las claves llevan un prefijo de espacio de nombres ('exoplanetas:', 'jobs:')
+    para poder invalidar todo lo relacionado con una colección tras una escritura.
+    """
+    def __init__(self, ttl_seconds=30.0, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "not_modified": 0, "evictions": 0, "invalidations": 0, "saved_ms": 0.0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ttl_seconds=float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 30)),
+            max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 256)),
+            max_bytes=int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+        )
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            self._stats["saved_ms"] += entry.fill_ms
+            return entry
+
+    def put(self, key, body, etag, fill_ms):
+        if self.ttl_seconds <= 0 or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CacheEntry(body, etag, time.monotonic() + self.ttl_seconds, fill_ms)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, prefix=""):
+        """Elimina las entradas cuya clave empieza por 'prefix' (todas si está vacío)."""
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(key)
+            self._stats["invalidations"] += 1
+
+    def record_not_modified(self):
+        with self._lock:
+            self._stats["not_modified"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "saved_ms": round(self._stats["saved_ms"], 1),
+                "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+
+def compute_etag(snapshots):
+    """
+    ETag fuerte a partir del ID y el 'update_time' de los documentos.
+    Cambia si cualquier documento se modifica, se añade o se elimina.
+    """
+    digest = hashlib.sha256()
+    for snapshot in snapshots:
+        update_time = snapshot.update_time
+        stamp = update_time.isoformat() if update_time is not None else ""
+        digest.update(f"{snapshot.id}@{stamp};".encode())
+    return digest.hexdigest()[:32]
+
+def _json_response(body, status, headers, etag, cache_status):
+    response = Response(body, status=status, mimetype="application/json", headers=headers)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Cache"] = cache_status
+    return response
+
+def _not_modified(headers, etag, cache_status):
+    response = Response(status=304, headers=headers)
+    response.set_etag(etag)
+    response.headers["X-Cache"] = cache_status
+    return response
+
+def cached_json(cache, request, key, loader, headers):
+    """
+    Sirve una respuesta JSON de lectura pasando por la caché.
+    'loader()' consulta Firestore y devuelve (payload, status, etag); solo se
+    guardan en caché las respuestas 200. Si el cliente envía un 'If-None-Match'
+    que coincide con el ETag actual se responde 304 sin cuerpo.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        if request.if_none_match.contains(entry.etag):
+            cache.record_not_modified()
+            return _not_modified(headers, entry.etag, "HIT")
+        return _json_response(entry.body, 200, headers, entry.etag, "HIT")
+
+    started = time.perf_counter()
+    with phase("firestore_read"):
+        payload, status, etag = loader()
+    # Misma serialización que jsonify(), para que HIT y MISS sean idénticos.
+    with phase("serialize"):
+        body = current_app.json.response(payload).get_data()
+    fill_ms = (time.perf_counter() - started) * 1000
+    if status != 200:
+        return Response(body, status=status, mimetype="application/json", headers=headers)
+
+    cache.put(key, body, etag, fill_ms)
+    if request.if_none_match.contains(etag):
+        cache.record_not_modified()
+        return _not_modified(headers, etag, "MISS")
+    return _json_response(body, 200, headers, etag, "MISS")
+
+def cache_key(namespace, request, *parts):
+    """Clave estable: espacio de nombres, partes de la ruta y query string ordenada."""
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+    return ":".join([namespace, *parts]) + (f"?{query}" if query else "")
+
+# Instancia compartida por todas las peticiones que atiende este proceso.
+response_cache = ResponseCache.from_env()
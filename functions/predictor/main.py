@@ -1,49 +1,61 @@
 import functions_framework
-from flask import Request, jsonify
-from google.cloud import firestore, storage
+from flask import Request, Response, jsonify
+import numpy as np
 import pandas as pd
-import pickle
 import io
+import time
 
-# --- INICIALIZACIÓN PEREZOSA (sin cambios) ---
-firestore_client = None
-storage_client = None
+import batch_predictions
+import microbatch
+import prediction_cache
+from common import maintenance_auth
+from common.artifact_bundle import forget_bundles, load_artifacts
+from common.clients import get_firestore_client, get_storage_client, get_tasks_client
+from common.instrumentation import instrumented, phase
+from common.model_routing import is_alias, route_cache, serving_variants
 
 # --- MANEJO DE CORS (sin cambios) ---
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
-    'Access-Control-Allow-Methods': 'POST, OPTIONS',
-    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Cache-Control, X-Exo-Profile, X-Exo-Admin-Token',
+    'Access-Control-Expose-Headers': 'X-Cache, X-Microbatch-Size',
 }
+# Variantes de modelo: 'full' (el entrenado) o 'fast' (compacto, destilado por el trainer)
+VARIANTS = ('full', 'fast')
+VARIANT_COMPONENTS = {'full': 'model', 'fast': 'compact_model'}
+
+if microbatch.batcher.enabled:
+    print(f"INFO: Micro-batching activo: ventana de {microbatch.WINDOW_MS} ms, hasta {microbatch.MAX_ROWS} filas por lote.")
 
 def _get_clients():
-    global firestore_client, storage_client
-    if firestore_client is None:
-        firestore_client = firestore.Client()
-    if storage_client is None:
-        storage_client = storage.Client()
-    return firestore_client, storage_client
+    # Clientes compartidos del proceso (common/clients.py)
+    return get_firestore_client(), get_storage_client()
 
 def _load_artifacts_from_gcs(gcs_uri):
-    # (Esta función no necesita cambios)
+    """
+    Abre los artefactos del modelo. Con un bundle ('.../bundle/manifest.json')
+    solo se descarga el manifiesto; cada componente se carga al usarse. Los
+    'artifacts.pkl' antiguos (y los comprimidos con zstd) se cargan enteros.
+    """
     print(f"Cargando artefactos desde: {gcs_uri}")
     _, storage_client = _get_clients()
-    bucket_name, blob_name = gcs_uri.replace("gs://", "").split("/", 1)
-    blob = storage_client.bucket(bucket_name).blob(blob_name)
-    artifacts = pickle.loads(blob.download_as_bytes())
+    artifacts = load_artifacts(gcs_uri, storage_client)
     print("✓ Artefactos cargados exitosamente.")
     return artifacts
 
-def _apply_pipeline(new_data_df, artifacts, data_source):
+def _class_names(artifacts):
+    """Nombres de clase sin cargar el label_encoder si el manifiesto ya los tiene."""
+    classes = getattr(artifacts, "classes", None)
+    return classes if classes is not None else artifacts['label_encoder'].classes_
+
+def _engineer_features(new_data_df, artifacts, data_source):
     """
-    Aplica el pipeline de preprocesamiento y feature engineering a los nuevos datos.
-    Ahora es retrocompatible con modelos antiguos.
+    Feature engineering de los nuevos datos, con las columnas en el orden que
+    espera el modelo. Ahora es retrocompatible con modelos antiguos.
     """
     print("Aplicando pipeline de preprocesamiento...")
     
-    scaler = artifacts['scaler']
-    imputer = artifacts['imputer']
-    
     # --- CORRECCIÓN DE RETROCOMPATIBILIDAD ---
     try:
         # Intenta obtener la lista de features directamente (método nuevo y preferido)
@@ -53,7 +65,7 @@ def _apply_pipeline(new_data_df, artifacts, data_source):
         # Fallback para modelos antiguos: obtener las features desde el scaler
         print("WARN: 'feature_names' no se encontró. Infiriendo desde el objeto 'scaler'.")
         # Esta función devuelve los nombres de las columnas con los que se entrenó el scaler
-        feature_names = scaler.get_feature_names_out()
+        feature_names = artifacts['scaler'].get_feature_names_out()
     # -----------------------------------------
 
     X_new = new_data_df.copy()
@@ -76,16 +88,153 @@ def _apply_pipeline(new_data_df, artifacts, data_source):
             X_new['density_proxy'] = X_new['pl_rade'] / (X_new['pl_orbper'] ** (1/3))
 
     # Asegurarse de que el DataFrame final tenga exactamente las mismas columnas que el modelo espera
-    X_reindexed = X_new.reindex(columns=feature_names, fill_value=0)
+    return X_new.reindex(columns=feature_names, fill_value=0)
 
-    # Aplicar imputer y scaler
-    X_imputed = pd.DataFrame(imputer.transform(X_reindexed), columns=feature_names)
-    X_scaled = pd.DataFrame(scaler.transform(X_imputed), columns=feature_names)
-    
+def _transform(X_reindexed, artifacts):
+    """Aplica el imputer y el scaler (fila a fila: se puede hacer sobre varias peticiones a la vez)."""
+    feature_names = X_reindexed.columns
+    X_imputed = pd.DataFrame(artifacts['imputer'].transform(X_reindexed), columns=feature_names)
+    return pd.DataFrame(artifacts['scaler'].transform(X_imputed), columns=feature_names)
+
+def _apply_pipeline(new_data_df, artifacts, data_source):
+    """
+    Aplica el pipeline de preprocesamiento y feature engineering a los nuevos datos.
+    """
+    X_scaled = _transform(_engineer_features(new_data_df, artifacts, data_source), artifacts)
     print("✓ Pipeline aplicado.")
     return X_scaled
 
+def _score(artifacts, variant, parts):
+    """
+    Probabilidades de las filas de 'parts' (salidas de _engineer_features, de
+    una o de varias peticiones agrupadas por microbatch.py) en su orden.
+    """
+    X_features = parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+    with phase("transform"):
+        X_prepared = _transform(X_features, artifacts)
+    with phase("predict"):
+        if variant == 'fast':
+            # El modelo compacto se entrenó con arrays float32 (ver pipelines/compact_model.py del trainer)
+            X_prepared = X_prepared.to_numpy(dtype=np.float32)
+        return artifacts[VARIANT_COMPONENTS[variant]].predict_proba(X_prepared)
+
+def _forget_job(job_id):
+    """Descarta lo que esta instancia guarda de un job eliminado: predicciones en memoria y bundles abiertos."""
+    prediction_cache.memory_tier.invalidate(f"{job_id}:")
+    if forget_bundles(job_id):
+        print(f"INFO: Bundles del job eliminado {job_id} descartados de la caché local.")
+
+def _resolve_model(firestore_client, model_ref):
+    """
+    Resuelve un job_id o un alias ('kepler:best', 'k2:latest'). Los alias salen
+    de la tabla de enrutado en memoria, sin leer el documento del job; los
+    job_id, de Firestore. Devuelve (modelo, None) o (None, (mensaje, status)).
+    Antes se aplican las lápidas de la tabla (jobs eliminados desde la Jobs API).
+    """
+    route_cache.routes(firestore_client)
+    for deleted_job_id in route_cache.take_deleted():
+        _forget_job(deleted_job_id)
+
+    alias = model_ref if is_alias(model_ref) else None
+    if alias:
+        route = route_cache.resolve(firestore_client, alias)
+        if route is None:
+            return None, (f"No hay ningún modelo para el alias '{alias}'.", 404)
+        job_id = route["job_id"]
+        gcs_uri = route.get("gcs_artifacts_path")
+        data_source = route.get("data_source")
+        completed_at = route.get("completed_at")
+        variants = route.get("variants") or ["full"]
+    else:
+        job_id = model_ref
+        doc_ref = firestore_client.collection("exo_scout_models").document(job_id)
+        with phase("firestore_read"):
+            doc = doc_ref.get()
+        if not doc.exists:
+            _forget_job(job_id)
+            return None, (f"El modelo con job_id '{job_id}' no fue encontrado.", 404)
+
+        metadata = doc.to_dict()
+        status = metadata.get("status")
+        if status != "completed":
+            # Mientras se suben los artefactos la ruta ya está en el documento, pero el bundle no
+            return None, (f"El modelo '{job_id}' aún no está listo (estado: {status}).", 409)
+        gcs_uri = metadata.get("results", {}).get("gcs_artifacts_path")
+        data_source = metadata.get("params", {}).get("data_source") # Obtenemos el data_source original
+        completed_at = metadata.get("completed_at")
+        variants = serving_variants(metadata.get("results", {}))
+
+    if not gcs_uri or not data_source:
+        return None, ("Metadatos incompletos para el modelo. Falta la ruta o la fuente de datos.", 500)
+    return {
+        "job_id": job_id,
+        "alias": alias,
+        "gcs_uri": gcs_uri,
+        "data_source": data_source,
+        "version": prediction_cache.model_version(completed_at),
+        "variants": variants,
+    }, None
+
+def _handle_batch(request, path_parts):
+    """
+    Rutas de predicción por lotes (batch_predictions.py):
+      POST /batch {"input_uri": "gs://...", "job_id" | "alias": ...}
+      GET  /batch/{batch_id}
+      POST /batch/{batch_id}/run   (Cloud Tasks; ruta de mantenimiento)
+    """
+    firestore_client, storage_client = _get_clients()
+
+    if path_parts == ['batch'] and request.method == 'POST':
+        request_json = request.get_json(silent=True) or {}
+        input_uri = request_json.get("input_uri")
+        model_ref = request_json.get("job_id") or request_json.get("alias")
+        if not model_ref or not (input_uri or "").startswith("gs://") or "/" not in input_uri[5:]:
+            return (jsonify({"error": "Petición inválida. Se requiere 'input_uri' (gs://bucket/objeto) y 'job_id' o 'alias'."}), 400, CORS_HEADERS)
+        if not batch_predictions.input_allowed(input_uri):
+            allowed = ", ".join(sorted(batch_predictions.INPUT_BUCKETS))
+            return (jsonify({"error": f"'input_uri' debe estar en uno de estos buckets: {allowed}."}), 400, CORS_HEADERS)
+        model, error = _resolve_model(firestore_client, model_ref)
+        if error:
+            return (jsonify({"error": error[0]}), error[1], CORS_HEADERS)
+        batch = batch_predictions.create_batch(firestore_client, get_tasks_client(), model, input_uri)
+        return (jsonify(batch_predictions.batch_status(batch)), 202, CORS_HEADERS)
+
+    if len(path_parts) == 2 and request.method == 'GET':
+        status = batch_predictions.get_batch(firestore_client, path_parts[1])
+        if status is None:
+            return (jsonify({"error": f"El batch '{path_parts[1]}' no fue encontrado."}), 404, CORS_HEADERS)
+        return (jsonify(status), 200, CORS_HEADERS)
+
+    if len(path_parts) == 3 and path_parts[2] == 'run' and request.method == 'POST':
+        denied = maintenance_auth.authorize(request)
+        if denied:
+            return (jsonify({"error": denied[0]}), denied[1], CORS_HEADERS)
+        try:
+            status = batch_predictions.run_batch(
+                firestore_client, storage_client, get_tasks_client(), path_parts[1],
+                load_artifacts=_load_artifacts_from_gcs, apply_pipeline=_apply_pipeline, class_names=_class_names,
+            )
+        except batch_predictions.BatchBusy as e:
+            # Cloud Tasks reintenta la tarea más tarde
+            return (jsonify({"error": str(e)}), 409, CORS_HEADERS)
+        if status is None:
+            return (jsonify({"error": f"El batch '{path_parts[1]}' no fue encontrado."}), 404, CORS_HEADERS)
+        return (jsonify(status), 200 if status["status"] == "completed" else 202, CORS_HEADERS)
+
+    return (jsonify({"error": "Ruta no encontrada"}), 404, CORS_HEADERS)
+
+def _predictions_response(model_info, predictions_json, cache_status, batch_size=None):
+    with phase("serialize"):
+        body = prediction_cache.response_body(model_info, predictions_json)
+    response = Response(body, status=200, mimetype="application/json", headers=CORS_HEADERS)
+    response.headers["X-Cache"] = cache_status
+    if batch_size is not None:
+        # Peticiones puntuadas juntas en el micro-lote (1 = sola)
+        response.headers["X-Microbatch-Size"] = str(batch_size)
+    return response
+
 @functions_framework.http
+@instrumented("predictor")
 def predictor_function(request: Request):
     """
     Función de Inferencia. Recibe un archivo CSV y un job_id, y devuelve las probabilidades.
@@ -94,51 +243,91 @@ def predictor_function(request: Request):
         return ('', 204, CORS_HEADERS)
 
     try:
+        path_parts = [part for part in request.path.strip('/').split('/') if part]
+        if path_parts[:1] == ['batch']:
+            return _handle_batch(request, path_parts)
+
         firestore_client, storage_client = _get_clients()
         
         # --- CAMBIO 1: Manejar entrada como 'multipart/form-data' ---
-        if 'file' not in request.files or 'job_id' not in request.form:
-            return (jsonify({"error": "Petición inválida. Se requiere un archivo 'file' y un campo 'job_id'."}), 400, CORS_HEADERS)
+        # El modelo se indica con su 'job_id' o con un alias ('kepler:best', 'k2:latest')
+        # en 'job_id' o en 'alias'.
+        model_ref = request.form.get('job_id') or request.form.get('alias')
+        if 'file' not in request.files or not model_ref:
+            return (jsonify({"error": "Petición inválida. Se requiere un archivo 'file' y un campo 'job_id' o 'alias'."}), 400, CORS_HEADERS)
+        variant = request.form.get('variant', 'full')
+        if variant not in VARIANTS:
+            return (jsonify({"error": f"Variante no válida. Opciones: {list(VARIANTS)}"}), 400, CORS_HEADERS)
         
-        job_id = request.form['job_id']
         file = request.files['file']
-        
-        # Leemos el CSV subido directamente en un DataFrame
-        new_data_df = pd.read_csv(io.BytesIO(file.read()), comment='#', engine='python', delimiter=',')
+        raw_data = file.read()
 
-        # 1. Buscar metadatos del modelo en Firestore
-        doc_ref = firestore_client.collection("exo_scout_models").document(job_id)
-        doc = doc_ref.get()
-        if not doc.exists:
-            return (jsonify({"error": f"El modelo con job_id '{job_id}' no fue encontrado."}), 404, CORS_HEADERS)
-        
-        metadata = doc.to_dict()
-        gcs_uri = metadata.get("results", {}).get("gcs_artifacts_path")
-        data_source = metadata.get("params", {}).get("data_source") # Obtenemos el data_source original
+        # 1. Resolver el modelo (job_id o alias)
+        model, error = _resolve_model(firestore_client, model_ref)
+        if error:
+            return (jsonify({"error": error[0]}), error[1], CORS_HEADERS)
+        job_id, alias = model["job_id"], model["alias"]
+        gcs_uri, data_source = model["gcs_uri"], model["data_source"]
+        # Los jobs sin modelo compacto sirven 'fast' con el completo; la respuesta
+        # indica la variante usada.
+        variant = variant if variant in model["variants"] else "full"
+        model_info = {"job_id": job_id, "alias": alias} if alias else {"job_id": job_id}
+        model_info["variant"] = variant
+
+        # Caché de resultados: mismo modelo y mismo CSV (por SHA-256) -> mismas
+        # probabilidades, sin parsear ni cargar el modelo. 'Cache-Control: no-cache'
+        # fuerza el cálculo (y refresca la entrada).
+        started = time.perf_counter()
+        digest = prediction_cache.content_digest(raw_data)
+        if not request.cache_control.no_cache:
+            cached, tier = prediction_cache.lookup(storage_client, job_id, model["version"], variant, digest)
+            if cached is not None:
+                return _predictions_response(model_info, cached, f"HIT-{tier.upper()}")
         
-        if not gcs_uri or not data_source:
-             return (jsonify({"error": "Metadatos incompletos para el modelo. Falta la ruta o la fuente de datos."}), 500, CORS_HEADERS)
+        # Leemos el CSV subido directamente en un DataFrame
+        with phase("parse"):
+            new_data_df = pd.read_csv(io.BytesIO(raw_data), comment='#', engine='python', delimiter=',')
 
-        # 2. Cargar los artefactos del modelo
-        artifacts = _load_artifacts_from_gcs(gcs_uri)
-        model = artifacts['model']
-        label_encoder = artifacts['label_encoder']
+        # 2. Abrir los artefactos del modelo (el modelo en sí se carga al puntuar)
+        try:
+            artifacts = _load_artifacts_from_gcs(gcs_uri)
+        except Exception:
+            if alias:
+                # La tabla de alias en memoria puede apuntar a un job ya eliminado
+                # (y limpiado): la siguiente petición la vuelve a leer.
+                route_cache.invalidate()
+            raise
+        if new_data_df.empty:
+            return (jsonify({**model_info, "predictions": []}), 200, CORS_HEADERS)
 
         # 3. Preparar los nuevos datos aplicando el pipeline correcto
-        X_prepared = _apply_pipeline(new_data_df, artifacts, data_source)
+        with phase("transform"):
+            X_features = _engineer_features(new_data_df, artifacts, data_source)
 
         # --- CAMBIO 2: Usar predict_proba para obtener probabilidades ---
-        probabilities = model.predict_proba(X_prepared)
-        class_names = label_encoder.classes_
+        # Con el micro-batching activo, las peticiones concurrentes al mismo
+        # modelo y variante se transforman y puntúan juntas (microbatch.py).
+        probabilities, batch_size = microbatch.batcher.submit(
+            (job_id, model["version"], variant), X_features,
+            lambda parts: _score(artifacts, variant, parts),
+        )
+        class_names = _class_names(artifacts)
 
         # 4. Formatear la respuesta para que sea fácil de usar en el frontend
-        results = []
-        for i, prediction_probs in enumerate(probabilities):
-            # Crea un diccionario legible: {'CANDIDATE': 0.8, 'CONFIRMED': 0.1, ...}
-            prob_dict = {class_names[j]: round(prob, 4) for j, prob in enumerate(prediction_probs)}
-            results.append(prob_dict)
-        
-        return (jsonify({"job_id": job_id, "predictions": results}), 200, CORS_HEADERS)
+        with phase("serialize"):
+            results = []
+            for i, prediction_probs in enumerate(probabilities):
+                # Crea un diccionario legible: {'CANDIDATE': 0.8, 'CONFIRMED': 0.1, ...}
+                prob_dict = {class_names[j]: round(float(prob), 4) for j, prob in enumerate(prediction_probs)}
+                results.append(prob_dict)
+            predictions_json = prediction_cache.serialize_predictions(results)
+
+        prediction_cache.store(
+            storage_client, job_id, model["version"], variant, digest, predictions_json,
+            fill_ms=(time.perf_counter() - started) * 1000,
+        )
+        return _predictions_response(model_info, predictions_json, "MISS",
+                                     batch_size if microbatch.batcher.enabled else None)
 
     except Exception as e:
         print(f"Error en la predicción: {e}")
@@ -0,0 +1,118 @@
+# microbatch.py
+#
+# Micro-batching de las predicciones interactivas (opcional). Casi todas las
+# llamadas al predictor puntúan una o pocas filas, y con ese tamaño domina el
+# coste fijo de cada llamada a imputer.transform, scaler.transform y
+# predict_proba. En una instancia con varios hilos (gunicorn --threads),
+# las peticiones concurrentes para el mismo modelo y variante se agrupan:
+#   - la primera que llega abre un lote y es su líder: espera como mucho
+#     PREDICT_MICROBATCH_WINDOW_MS o a que el lote junte PREDICT_MICROBATCH_MAX_ROWS filas,
+#   - las que llegan mientras tanto añaden sus filas y esperan al líder,
+#   - el líder puntúa todas las filas con una sola transformación y una sola
+#     llamada a predict_proba, y cada petición se queda con sus filas.
+# Las transformaciones y los modelos puntúan cada fila por separado, así que el
+# resultado es el mismo que sin agrupar. Las fases del lote ('transform',
+# 'predict') se miden aparte y se suman al Server-Timing de cada petición del
+# lote, líder o no: todas esperaron ese tiempo. En las demás, 'batch_wait' es la
+# espera sin contar la puntuación. Las peticiones con MAX_ROWS filas o
+# más no esperan. Con PREDICT_MICROBATCH_WINDOW_MS=0 (por defecto) está desactivado.
+
+import os
+import threading
+import time
+
+import numpy as np
+
+from common.instrumentation import phase, record_phase, separate_timings
+
+WINDOW_MS = float(os.environ.get("PREDICT_MICROBATCH_WINDOW_MS", 0))
+MAX_ROWS = int(os.environ.get("PREDICT_MICROBATCH_MAX_ROWS", 256))
+
+class _Batch:
+    def __init__(self):
+        self.parts = []
+        self.rows = 0
+        self.closed = threading.Event()   # No admite más peticiones
+        self.done = threading.Event()     # Resultados (o error) disponibles
+        self.results = None
+        self.error = None
+        self.phases = {}                  # ms por fase de la puntuación del lote
+
+class MicroBatcher:
+    """Agrupa las llamadas a submit() con la misma clave que llegan dentro de la ventana."""
+    def __init__(self, window_ms=WINDOW_MS, max_rows=MAX_ROWS):
+        self.window_seconds = window_ms / 1000
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._open = {}
+
+    @property
+    def enabled(self):
+        return self.window_seconds > 0 and self.max_rows > 1
+
+    def _close(self, key, batch):
+        # Llamar con el lock tomado
+        if self._open.get(key) is batch:
+            del self._open[key]
+        batch.closed.set()
+
+    def submit(self, key, part, score):
+        """
+        Puntúa 'part' (DataFrame o array con una fila por fila de entrada) junto
+        con las demás peticiones de la misma 'key'. El líder llama a
+        'score(partes)', que devuelve un array con una fila de resultado por
+        fila de entrada, en el mismo orden. Devuelve (resultados de 'part',
+        número de peticiones del lote).
+        """
+        rows = len(part)
+        if not self.enabled or rows >= self.max_rows:
+            return score([part]), 1
+
+        with self._lock:
+            batch = self._open.get(key)
+            if batch is not None and batch.rows + rows > self.max_rows:
+                self._close(key, batch)
+                batch = None
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            index = len(batch.parts)
+            batch.parts.append(part)
+            batch.rows += rows
+            if batch.rows >= self.max_rows:
+                self._close(key, batch)
+
+        if leader:
+            with phase("batch_wait"):
+                batch.closed.wait(self.window_seconds)
+                with self._lock:
+                    self._close(key, batch)
+            self._run(batch, score)
+        else:
+            started = time.perf_counter()
+            batch.done.wait()
+            waited_ms = (time.perf_counter() - started) * 1000
+            record_phase("batch_wait", max(0.0, waited_ms - sum(batch.phases.values())))
+        for name, ms in batch.phases.items():
+            record_phase(name, ms)
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index], len(batch.parts)
+
+    @staticmethod
+    def _run(batch, score):
+        try:
+            with separate_timings() as timings:
+                try:
+                    results = score(batch.parts)
+                finally:
+                    batch.phases = dict(timings.phases)
+            offsets = np.cumsum([len(part) for part in batch.parts])[:-1]
+            batch.results = np.split(results, offsets)
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+batcher = MicroBatcher()
@@ -0,0 +1,123 @@
+# prediction_cache.py
+#
+# Caché de resultados del predictor. La clave es el modelo (job_id, versión y
+# variante 'full' o 'fast') más el SHA-256 del CSV subido, así que volver a enviar el mismo archivo (una
+# recarga de la página, un enlace compartido) devuelve las probabilidades
+# guardadas sin parsear el CSV ni cargar el modelo. Dos niveles:
+#   - memoria: LRU por instancia (ResponseCache de common/response_cache.py),
+#   - GCS: 'prediction-cache/{job_id}/{versión}/{variante}/{sha256}.json.gz',
+#     compartido entre instancias y despliegues. Un objeto con más de
+#     PREDICTION_CACHE_DURABLE_TTL_SECONDS se trata como un fallo y se borra al
+#     leerlo; los que nadie vuelve a pedir los borra la regla de ciclo de vida
+#     del bucket (ver README).
+# La versión es la fecha de finalización del job: si se vuelve a entrenar un
+# job con el mismo job_id, las entradas antiguas dejan de coincidir. La Jobs API
+# borra 'prediction-cache/{job_id}/' al eliminar el job.
+#
+# Lo que se guarda es la lista 'predictions' ya serializada; la respuesta se
+# compone alrededor sin volver a parsearla (ver response_body).
+
+import gzip
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from common.instrumentation import phase
+from common.response_cache import ResponseCache
+
+CACHE_PREFIX = "prediction-cache"
+CACHE_BUCKET = os.environ.get("PREDICTION_CACHE_BUCKET", os.environ.get("MODEL_BUCKET_NAME", "exoplanets-nasa-models"))
+# Con 'false' solo se usa el nivel en memoria
+DURABLE_TIER = os.environ.get("PREDICTION_CACHE_DURABLE", "true").lower() not in ("0", "false", "no")
+# Antigüedad máxima de un objeto del nivel GCS (7 días por defecto; 0 = sin límite)
+DURABLE_TTL_SECONDS = float(os.environ.get("PREDICTION_CACHE_DURABLE_TTL_SECONDS", 7 * 24 * 3600))
+
+memory_tier = ResponseCache(
+    ttl_seconds=float(os.environ.get("PREDICTION_CACHE_TTL_SECONDS", 3600)),
+    max_entries=int(os.environ.get("PREDICTION_CACHE_MAX_ENTRIES", 128)),
+    max_bytes=int(os.environ.get("PREDICTION_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+)
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def model_version(completed_at):
+    """Milisegundos desde epoch de la finalización del job ('0' si no se conoce)."""
+    if completed_at is None:
+        return "0"
+    if completed_at.tzinfo is None:
+        completed_at = completed_at.replace(tzinfo=timezone.utc)
+    return str(int(completed_at.timestamp() * 1000))
+
+def cache_key(job_id, version, variant, digest):
+    return f"{job_id}:{version}:{variant}:{digest}"
+
+def _blob_name(job_id, version, variant, digest):
+    return f"{CACHE_PREFIX}/{job_id}/{version}/{variant}/{digest}.json.gz"
+
+def lookup(storage_client, job_id, version, variant, digest):
+    """Devuelve (predictions_json, 'memory' | 'storage') o (None, None)."""
+    key = cache_key(job_id, version, variant, digest)
+    entry = memory_tier.get(key)
+    if entry is not None:
+        return entry.body, "memory"
+    if not DURABLE_TIER:
+        return None, None
+
+    started = time.perf_counter()
+    with phase("cache_read"):
+        try:
+            blob = storage_client.bucket(CACHE_BUCKET).get_blob(_blob_name(job_id, version, variant, digest))
+            if blob is None:
+                return None, None
+            if _expired(blob):
+                _delete_stale(blob)
+                return None, None
+            body = gzip.decompress(blob.download_as_bytes())
+        except Exception:  # Cualquier fallo de lectura: se calcula de nuevo
+            return None, None
+    memory_tier.put(key, body, digest, (time.perf_counter() - started) * 1000)
+    return body, "storage"
+
+def _expired(blob):
+    if not DURABLE_TTL_SECONDS or blob.time_created is None:
+        return False
+    return (datetime.now(timezone.utc) - blob.time_created).total_seconds() > DURABLE_TTL_SECONDS
+
+def _delete_stale(blob):
+    try:
+        blob.delete()
+    except Exception as e:  # Otra instancia lo borró o lo reescribió antes
+        print(f"WARN: No se pudo borrar la entrada caducada {blob.name} de la caché de GCS: {e}")
+
+def store(storage_client, job_id, version, variant, digest, body, fill_ms):
+    """Guarda la lista 'predictions' serializada en ambos niveles. Un fallo en GCS no es fatal."""
+    memory_tier.put(cache_key(job_id, version, variant, digest), body, digest, fill_ms)
+    if not DURABLE_TIER:
+        return
+    blob = storage_client.bucket(CACHE_BUCKET).blob(_blob_name(job_id, version, variant, digest))
+    with phase("cache_write"):
+        try:
+            blob.upload_from_string(gzip.compress(body, compresslevel=6), content_type="application/gzip")
+        except Exception as e:
+            print(f"WARN: No se pudo guardar la predicción en la caché de GCS: {e}")
+
+def serialize_predictions(predictions):
+    return json.dumps(predictions, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+def response_body(model_info, predictions_json):
+    """
+    Cuerpo '{"alias":...,"job_id":...,"predictions":[...]}' idéntico al de
+    jsonify() (claves ordenadas, sin espacios y con salto de línea final),
+    montado sin volver a parsear 'predictions'.
+    """
+    def members(keys):
+        return json.dumps({key: model_info[key] for key in keys}, separators=(",", ":"), sort_keys=True)[1:-1]
+
+    before = members(key for key in model_info if key < "predictions")
+    after = members(key for key in model_info if key > "predictions")
+    head = "{" + before + ("," if before else "") + '"predictions":'
+    tail = ("," + after if after else "") + "}\n"
+    return head.encode("utf-8") + predictions_json + tail.encode("utf-8")
@@ -0,0 +1,202 @@
+# common/exoplanet_stats.py
+#
+# Agregados materializados de la colección 'exoplanetas' (recuentos por
+# disposición y por misión, histogramas de radio y de periodo) para que los
+# paneles no tengan que descargar la colección entera. Este archivo se mantiene
+# idéntico en save_exoplanets (escritura) y en get_exoplanets (lectura).
+#
+#   exoplanetas_stats/shard-{n}   contadores parciales; cada escritura suma su
+#                                 delta con Increment en un shard al azar, en el
+#                                 mismo WriteBatch (o transacción) que los documentos
+#   exoplanetas_stats/rollup      suma de todos los shards: lo que sirve /_stats
+#
+# Los shards reparten las escrituras (Firestore admite pocas escrituras
+# sostenidas por documento). El rollup se recalcula a partir de ellos cuando
+# tiene más de STATS_ROLLUP_MAX_AGE_SECONDS. Los histogramas usan bins fijos,
+# así que sumar y restar contribuciones es exacto: una reingesta resta la
+# contribución del documento que sobrescribe. rebuild_stats recalcula todo
+# desde la colección (backfills o para corregir deriva).
+
+import os
+import random
+from collections import Counter
+from datetime import datetime, timezone
+
+from google.cloud import firestore
+
+from common.instrumentation import phase
+
+STATS_COLLECTION = "exoplanetas_stats"
+ROLLUP_DOCUMENT = "rollup"
+SHARD_PREFIX = "shard-"
+NUM_SHARDS = int(os.environ.get("EXO_STATS_SHARDS", 10))
+ROLLUP_MAX_AGE_SECONDS = float(os.environ.get("STATS_ROLLUP_MAX_AGE_SECONDS", 60))
+UNKNOWN = "desconocido"
+MISSING_BIN = "missing"
+MAX_CATEGORY_LENGTH = 100
+
+# Dimensiones categóricas: se usa el primer campo presente de cada lista
+CATEGORIES = {
+    "disposition": ("disposition", "koi_disposition", "tfopwg_disp"),
+    "mission": ("mission", "mision", "disc_facility"),
+    "tipo": ("tipo",),
+}
+# Sin campo de misión, se deduce de los identificadores propios de cada catálogo
+MISSION_ID_FIELDS = (("kepid", "Kepler"), ("kepoi_name", "Kepler"), ("epic_hostname", "K2"),
+                     ("k2_name", "K2"), ("tid", "TESS"), ("toi", "TESS"))
+# Histogramas de bins fijos: el bin i es [edges[i], edges[i+1]) y el último no tiene límite superior
+HISTOGRAMS = {
+    "radius_earth": {"fields": ("pl_rade", "koi_prad"), "edges": [0, 0.5, 1, 1.25, 1.5, 2, 3, 4, 6, 10, 15, 25]},
+    "period_days": {"fields": ("pl_orbper", "koi_period"), "edges": [0, 1, 3, 10, 30, 100, 365, 1000, 10000]},
+}
+
+def _stats_ref(firestore_client, document):
+    return firestore_client.collection(STATS_COLLECTION).document(document)
+
+def _first_present(record, fields):
+    for field in fields:
+        value = record.get(field)
+        if value is not None and str(value).strip() != "":
+            return value
+    return None
+
+def _category(record, name):
+    value = _first_present(record, CATEGORIES[name])
+    if value is None and name == "mission":
+        value = next((mission for field, mission in MISSION_ID_FIELDS if record.get(field) is not None), None)
+    if value is None:
+        return UNKNOWN
+    label = str(value).strip()[:MAX_CATEGORY_LENGTH]
+    # Los nombres '__...__' están reservados en Firestore
+    return UNKNOWN if label.startswith("__") and label.endswith("__") else label
+
+def _bin(record, spec):
+    value = _first_present(record, spec["fields"])
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return MISSING_BIN
+    edges = spec["edges"]
+    if not edges[0] <= value < float("inf"):
+        return MISSING_BIN
+    index = sum(1 for edge in edges[1:] if value >= edge)
+    return f"b{index:02d}"
+
+def contribution(record):
+    """Contadores (ruta -> 1) con los que un documento participa en los agregados."""
+    if not record:
+        return {}
+    counters = {("total",): 1}
+    for name in CATEGORIES:
+        counters[("by", name, _category(record, name))] = 1
+    for name, spec in HISTOGRAMS.items():
+        counters[("hist", name, _bin(record, spec))] = 1
+    return counters
+
+def delta(old_record, new_record):
+    """Cambio en los contadores al sustituir 'old_record' por 'new_record' (None si no existía)."""
+    counters = Counter(contribution(new_record))
+    counters.subtract(contribution(old_record))
+    return {path: count for path, count in counters.items() if count}
+
+def _nest(counters, leaf=lambda value: value):
+    nested = {}
+    for path, value in counters.items():
+        target = nested
+        for part in path[:-1]:
+            target = target.setdefault(part, {})
+        target[path[-1]] = leaf(value)
+    return nested
+
+def _sum_into(total, data):
+    for key, value in data.items():
+        if isinstance(value, dict):
+            _sum_into(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[key] = total.get(key, 0) + value
+
+def add_to_batch(batch, firestore_client, counters):
+    """Añade al lote el incremento de 'counters' sobre un shard al azar (nada si no hay cambios)."""
+    counters = {path: count for path, count in counters.items() if count}
+    if not counters:
+        return
+    shard = _stats_ref(firestore_client, f"{SHARD_PREFIX}{random.randrange(NUM_SHARDS)}")
+    batch.set(shard, _nest(counters, firestore.Increment), merge=True)
+
+# =============================================================================
+# ROLLUP (get_exoplanets)
+# =============================================================================
+
+def fold_shards(firestore_client):
+    """Suma todos los shards (los que haya, aunque cambie EXO_STATS_SHARDS) y reescribe el rollup."""
+    totals, shards = {}, 0
+    with phase("firestore_read"):
+        for doc in firestore_client.collection(STATS_COLLECTION).stream():
+            if doc.id.startswith(SHARD_PREFIX):
+                _sum_into(totals, doc.to_dict() or {})
+                shards += 1
+    with phase("firestore_write"):
+        _stats_ref(firestore_client, ROLLUP_DOCUMENT).set({**totals, "shards": shards, "updated_at": firestore.SERVER_TIMESTAMP})
+    print(f"✓ Rollup de estadísticas recalculado a partir de {shards} shards.")
+
+def read_rollup(firestore_client, max_age=ROLLUP_MAX_AGE_SECONDS):
+    """Snapshot del rollup, recalculándolo antes si no existe o tiene más de 'max_age' segundos."""
+    rollup_ref = _stats_ref(firestore_client, ROLLUP_DOCUMENT)
+    with phase("firestore_read"):
+        snapshot = rollup_ref.get()
+    if snapshot.exists and (datetime.now(timezone.utc) - snapshot.update_time).total_seconds() < max_age:
+        return snapshot
+    fold_shards(firestore_client)
+    with phase("firestore_read"):
+        return rollup_ref.get()
+
+def summary(rollup):
+    """Respuesta de /_stats: recuentos por dimensión e histogramas con sus límites."""
+    by = rollup.get("by", {})
+    hist = rollup.get("hist", {})
+    histograms = {}
+    for name, spec in HISTOGRAMS.items():
+        counts, edges = hist.get(name, {}), spec["edges"]
+        histograms[name] = {
+            "fields": list(spec["fields"]),
+            "bins": [{"min": edges[i], "max": edges[i + 1] if i + 1 < len(edges) else None, "count": counts.get(f"b{i:02d}", 0)}
+                     for i in range(len(edges))],
+            "missing": counts.get(MISSING_BIN, 0),
+        }
+    updated_at = rollup.get("updated_at")
+    return {
+        "total": rollup.get("total", 0),
+        **{f"by_{name}": dict(sorted(by.get(name, {}).items(), key=lambda item: -item[1])) for name in CATEGORIES},
+        "histograms": histograms,
+        "shards": rollup.get("shards", 0),
+        "updated_at": updated_at.isoformat() if updated_at is not None else None,
+    }
+
+# =============================================================================
+# RECONSTRUCCIÓN COMPLETA (save_exoplanets)
+# =============================================================================
+
+def rebuild_stats(firestore_client, collection="exoplanetas"):
+    """
+    Recalcula los agregados recorriendo toda la colección: el total queda en el
+    primer shard, el resto se vacían y el rollup se reescribe. Las escrituras
+    que lleguen durante la reconstrucción pueden contarse dos veces o perderse;
+    conviene lanzarla sin cargas en curso.
+    """
+    counters, documents = Counter(), 0
+    with phase("firestore_read"):
+        for doc in firestore_client.collection(collection).stream():
+            counters.update(contribution(doc.to_dict()))
+            documents += 1
+    totals = _nest(counters)
+
+    with phase("firestore_write"):
+        batch = firestore_client.batch()
+        for doc in firestore_client.collection(STATS_COLLECTION).stream():
+            if doc.id.startswith(SHARD_PREFIX) and doc.id != f"{SHARD_PREFIX}0":
+                batch.delete(doc.reference)
+        batch.set(_stats_ref(firestore_client, f"{SHARD_PREFIX}0"), totals)
+        batch.set(_stats_ref(firestore_client, ROLLUP_DOCUMENT), {**totals, "shards": 1, "updated_at": firestore.SERVER_TIMESTAMP})
+        batch.commit()
+    print(f"✓ Estadísticas reconstruidas a partir de {documents} documentos.")
+    return {"documents": documents, "total": totals.get("total", 0)}
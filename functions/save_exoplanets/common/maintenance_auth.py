@@ -0,0 +1,61 @@
+# common/maintenance_auth.py
+#
+# Autorización de las rutas de mantenimiento (reconstrucciones, limpiezas y
+# borrados definitivos). Se acepta una de estas dos credenciales:
+#   - 'X-Exo-Admin-Token: <token>' igual a EXO_ADMIN_TOKEN (operadores).
+#   - 'Authorization: Bearer <token OIDC>' firmado por Google para una de las
+#     cuentas de servicio de MAINTENANCE_INVOKERS (Cloud Scheduler y Cloud
+#     Tasks, con --oidc-service-account-email / oidc_token).
+# Si no hay ninguna configurada, las rutas quedan cerradas.
+# Este archivo se mantiene idéntico en cada función que lo usa.
+#
+# Variables de entorno:
+#   EXO_ADMIN_TOKEN        token de administración
+#   MAINTENANCE_INVOKERS   emails de las cuentas de servicio autorizadas, separados por comas
+#   MAINTENANCE_AUDIENCE   audiencias aceptadas del token OIDC, separadas por comas (por defecto, la URL
+#                          de la petición con y sin query); conviene fijarla a la URL de la función
+
+import hmac
+import os
+
+ADMIN_TOKEN = os.environ.get("EXO_ADMIN_TOKEN")
+MAINTENANCE_INVOKERS = {email.strip().lower() for email in os.environ.get("MAINTENANCE_INVOKERS", "").split(",") if email.strip()}
+MAINTENANCE_AUDIENCES = [audience.strip() for audience in os.environ.get("MAINTENANCE_AUDIENCE", "").split(",") if audience.strip()]
+ADMIN_TOKEN_HEADER = "X-Exo-Admin-Token"
+
+def _verify_oidc_token(token, audience):
+    """Claims del token OIDC si la firma, la caducidad y una de las audiencias son válidas; si no, ValueError."""
+    from google.auth.transport import requests as google_requests
+    from google.oauth2 import id_token
+    return id_token.verify_oauth2_token(token, google_requests.Request(), audience=audience)
+
+def _oidc_caller(request):
+    """Email verificado de la cuenta de servicio que firma la petición, o None."""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    audience = MAINTENANCE_AUDIENCES or [request.url, request.base_url]
+    try:
+        claims = _verify_oidc_token(token.strip(), audience)
+    except Exception as e:
+        print(f"WARN: Token OIDC rechazado en {request.path}: {e}")
+        return None
+    if not claims.get("email_verified"):
+        return None
+    return (claims.get("email") or "").lower() or None
+
+def authorize(request):
+    """None si la petición puede usar las rutas de mantenimiento; si no, (mensaje, código HTTP)."""
+    if not ADMIN_TOKEN and not MAINTENANCE_INVOKERS:
+        return ("Ruta de mantenimiento deshabilitada: define EXO_ADMIN_TOKEN o MAINTENANCE_INVOKERS.", 403)
+    admin_token = request.headers.get(ADMIN_TOKEN_HEADER)
+    has_bearer = request.headers.get("Authorization", "").lower().startswith("bearer ")
+    if not admin_token and not has_bearer:
+        return ("Se requiere autenticación de mantenimiento.", 401)
+    if admin_token and ADMIN_TOKEN and hmac.compare_digest(admin_token.encode(), ADMIN_TOKEN.encode()):
+        return None
+    if has_bearer and MAINTENANCE_INVOKERS:
+        caller = _oidc_caller(request)
+        if caller in MAINTENANCE_INVOKERS:
+            return None
+    return ("Credenciales de mantenimiento no válidas.", 403)
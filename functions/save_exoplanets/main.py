@@ -1,23 +1,233 @@
+import csv
+import hashlib
+import io
+import json
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
 import functions_framework
 from flask import Request, jsonify
 from google.cloud import firestore
 
-firestore_client = None
+from common import exoplanet_stats, maintenance_auth
+from common.clients import get_firestore_client
+from common.instrumentation import instrumented, phase
 
 # Cabeceras CORS para permitir el acceso desde cualquier origen
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'POST, OPTIONS',
-    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Exo-Profile, X-Exo-Admin-Token',
 }
 
+# --- CARGA MASIVA ---
+BATCH_SIZE = 500              # Máximo de escrituras por WriteBatch o transacción en Firestore
+DOCS_PER_BATCH = BATCH_SIZE - 1  # Una escritura de cada lote es la de los contadores (common/exoplanet_stats.py)
+MAX_CONCURRENT_BATCHES = 4    # Lotes confirmados en paralelo
+MAX_REPORTED_ERRORS = 200     # Límite de errores por fila incluidos en la respuesta
+# Marca de escritura: get_exoplanets la usa para refrescar su instantánea de forma
+# incremental y para revalidar su caché de respuestas
+UPDATED_AT_FIELD = 'updated_at'
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines')
+CSV_CONTENT_TYPES = ('text/csv', 'application/csv')
+LEADING_ZERO = re.compile(r'^[+-]?0\d')   # '007', '-012.5': IDs, no números
+
+
+def _parse_csv_value(value):
+    """
+    Convierte los valores de texto de un CSV a número cuando la conversión no
+    pierde información. Los IDs con ceros a la izquierda ('007', '00123.5') y
+    los textos que Python acepta pero no son números de CSV ('1_000', '+5') se
+    quedan como texto.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value == '':
+        return None
+    if '_' in value or LEADING_ZERO.match(value):
+        return value
+    try:
+        number = int(value)
+        return number if str(number) == value else value
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def _parse_bulk_body(request: Request):
+    """
+    Interpreta el cuerpo de una carga masiva.
+    Devuelve (rows, errors): 'rows' es una lista de (número_de_fila, dict) y
+    'errors' los errores de parseo por fila. Devuelve None si el cuerpo no es
+    una carga masiva (un único objeto JSON).
+    """
+    content_type = (request.mimetype or '').lower()
+    body = request.get_data(cache=True)
+    rows, errors = [], []
+
+    if content_type in NDJSON_CONTENT_TYPES:
+        for row_number, line in enumerate(body.decode('utf-8').splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append((row_number, json.loads(line)))
+            except json.JSONDecodeError as e:
+                errors.append({"row": row_number, "error": f"JSON no válido: {e.msg}"})
+        return rows, errors
+
+    if content_type in CSV_CONTENT_TYPES:
+        lines = (line for line in io.StringIO(body.decode('utf-8-sig')) if not line.startswith('#'))
+        reader = csv.DictReader(lines)
+        for row_number, record in enumerate(reader, start=1):
+            if None in record:
+                errors.append({"row": row_number, "error": "La fila tiene más columnas que la cabecera."})
+                continue
+            rows.append((row_number, {k: _parse_csv_value(v) for k, v in record.items()}))
+        return rows, errors
+
+    data = request.get_json(silent=True)
+    if isinstance(data, list):
+        return list(enumerate(data, start=1)), errors
+    return None
+
+def _document_id(record, id_field, idempotent):
+    """
+    ID determinista para reingestas idempotentes:
+    - 'id_field': usa el valor de ese campo del registro.
+    - 'idempotent': SHA-256 del contenido canónico del registro.
+    Devuelve None para que Firestore genere el ID.
+    """
+    if id_field:
+        value = record.get(id_field)
+        if value is None or str(value).strip() == '':
+            raise ValueError(f"Falta el campo '{id_field}' para generar el ID.")
+        doc_id = str(value).strip()
+        if '/' in doc_id or doc_id in ('.', '..') or (doc_id.startswith('__') and doc_id.endswith('__')):
+            raise ValueError(f"'{doc_id}' no es un ID de documento válido.")
+        return doc_id
+    if idempotent:
+        canonical = json.dumps(record, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    return None
+
+@firestore.transactional
+def _commit_in_transaction(transaction, firestore_client, writes, known_ids):
+    """
+    Lee los documentos que se van a sobrescribir y escribe el lote con su
+    cambio en las estadísticas en la misma transacción: dos reingestas
+    concurrentes de los mismos IDs se serializan y cada una resta la
+    contribución que de verdad sustituye.
+    """
+    with phase("firestore_read"):
+        refs = [doc_ref for doc_ref, _ in writes if doc_ref.id in known_ids]
+        previous = {snapshot.id: snapshot.to_dict() for snapshot in transaction.get_all(refs) if snapshot.exists}
+    counters = Counter()
+    for doc_ref, record in writes:
+        transaction.set(doc_ref, {**record, UPDATED_AT_FIELD: firestore.SERVER_TIMESTAMP})
+        counters.update(exoplanet_stats.delta(previous.get(doc_ref.id), record))
+    exoplanet_stats.add_to_batch(transaction, firestore_client, counters)
+
+def _commit_batch(collection_ref, chunk):
+    """
+    Confirma un lote de (número_de_fila, doc_id, registro) junto con el cambio
+    en las estadísticas agregadas. Devuelve los errores. Con IDs deterministas
+    (posibles sobrescrituras) el lote va en una transacción; con IDs
+    generados basta un WriteBatch.
+    """
+    firestore_client = get_firestore_client()
+    writes = [(collection_ref.document(doc_id) if doc_id else collection_ref.document(), record) for _, doc_id, record in chunk]
+    known_ids = {doc_id for _, doc_id, _ in chunk if doc_id}
+    try:
+        if known_ids:
+            _commit_in_transaction(firestore_client.transaction(), firestore_client, writes, known_ids)
+            return []
+        batch = firestore_client.batch()
+        counters = Counter()
+        for doc_ref, record in writes:
+            batch.set(doc_ref, {**record, UPDATED_AT_FIELD: firestore.SERVER_TIMESTAMP})
+            counters.update(exoplanet_stats.contribution(record))
+        exoplanet_stats.add_to_batch(batch, firestore_client, counters)
+        batch.commit()
+        return []
+    except Exception as e:
+        print(f"Error al confirmar un lote de {len(chunk)} filas: {e}")
+        return [{"row": row_number, "error": f"Fallo al escribir el lote: {e}"} for row_number, _, _ in chunk]
+
+def _bulk_save(request: Request, rows, errors):
+    """Escribe las filas en lotes de BATCH_SIZE, confirmando varios lotes en paralelo."""
+    started = time.perf_counter()
+    id_field = request.args.get('id_field')
+    idempotent = request.args.get('idempotent', '').lower() in ('1', 'true', 'yes')
+    collection_ref = get_firestore_client().collection('exoplanetas')
+
+    received = len(rows) + len(errors)
+    prepared, by_doc_id, valid = [], {}, 0
+    for row_number, record in rows:
+        if not isinstance(record, dict) or not record:
+            errors.append({"row": row_number, "error": "Cada fila debe ser un objeto JSON no vacío."})
+            continue
+        try:
+            doc_id = _document_id(record, id_field, idempotent)
+        except ValueError as e:
+            errors.append({"row": row_number, "error": str(e)})
+            continue
+        valid += 1
+        if doc_id is None:
+            prepared.append((row_number, doc_id, record))
+        else:
+            # Con IDs deterministas, la última fila repetida gana (igual que una reingesta).
+            by_doc_id[doc_id] = (row_number, doc_id, record)
+    prepared.extend(sorted(by_doc_id.values(), key=lambda item: item[0]))
+
+    duplicates = valid - len(prepared)
+    chunks = [prepared[i:i + DOCS_PER_BATCH] for i in range(0, len(prepared), DOCS_PER_BATCH)]
+    written = len(prepared)
+    if chunks:
+        # Los lotes se confirman en otros hilos: la fase se mide desde este
+        with phase("firestore_write"), ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_BATCHES, len(chunks))) as executor:
+            for chunk_errors in executor.map(lambda chunk: _commit_batch(collection_ref, chunk), chunks):
+                written -= len(chunk_errors)
+                errors.extend(chunk_errors)
+
+    elapsed = time.perf_counter() - started
+    errors.sort(key=lambda e: e["row"])
+    summary = {
+        "status": "éxito" if not errors else ("parcial" if written else "error"),
+        "received": received,
+        "written": written,
+        "duplicates": duplicates,
+        "failed": len(errors),
+        "batches": len(chunks),
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(written / elapsed, 1) if elapsed > 0 else None,
+        "errors": errors[:MAX_REPORTED_ERRORS],
+        "errors_truncated": len(errors) > MAX_REPORTED_ERRORS,
+    }
+    print(f"Carga masiva: {written} filas escritas, {len(errors)} con error, "
+          f"{summary['rows_per_second']} filas/s en {len(chunks)} lotes.")
+
+    status_code = 201 if not errors else (207 if written else 400)
+    return (jsonify(summary), status_code, CORS_HEADERS)
+
 @functions_framework.http
+@instrumented("save_exoplanets")
 def save_exoplanet(request: Request):
     """
-    Guarda un objeto JSON en la colección 'exoplanetas' de Firestore.
+    Guarda documentos en la colección 'exoplanetas' de Firestore.
+    - Un objeto JSON: se guarda como un documento (Firestore genera el ID).
+    - Un array JSON, NDJSON (application/x-ndjson) o CSV (text/csv): carga masiva
+      en lotes. Con ?id_field=<campo> o ?idempotent=true los IDs son
+      deterministas y una reingesta sobrescribe en lugar de duplicar.
+    - POST /_stats/rebuild: recalcula las estadísticas agregadas desde la colección
+      (ruta de mantenimiento: token de administración u OIDC, common/maintenance_auth.py).
+    Cada escritura actualiza en el mismo lote las estadísticas agregadas que
+    sirve get_exoplanets/_stats.
     """
-    global firestore_client
-
     # Manejar la petición PREFLIGHT de CORS
     if request.method == 'OPTIONS':
         return ('', 204, CORS_HEADERS)
@@ -27,9 +237,25 @@ def save_exoplanet(request: Request):
         return (jsonify({"error": "Método no permitido"}), 405, CORS_HEADERS)
 
     try:
-        # Inicialización perezosa del cliente de Firestore
-        if firestore_client is None:
-            firestore_client = firestore.Client()
+        path_parts = [part for part in request.path.strip('/').split('/') if part]
+        if path_parts[-2:] == ['_stats', 'rebuild']:
+            denied = maintenance_auth.authorize(request)
+            if denied:
+                message, status_code = denied
+                return (jsonify({"error": message}), status_code, CORS_HEADERS)
+            result = exoplanet_stats.rebuild_stats(get_firestore_client())
+            return (jsonify({"status": "éxito", **result}), 200, CORS_HEADERS)
+
+        try:
+            with phase("parse"):
+                bulk = _parse_bulk_body(request)
+        except UnicodeDecodeError:
+            return (jsonify({"error": "El cuerpo de la petición debe estar codificado en UTF-8."}), 400, CORS_HEADERS)
+        if bulk is not None:
+            rows, errors = bulk
+            if not rows and not errors:
+                return (jsonify({"error": "La carga masiva no contiene filas."}), 400, CORS_HEADERS)
+            return _bulk_save(request, rows, errors)
 
         # Obtener el JSON del cuerpo de la petición
         data = request.get_json(silent=True)
@@ -37,7 +263,14 @@ def save_exoplanet(request: Request):
             return (jsonify({"error": "No se proporcionó un JSON válido en el cuerpo de la petición."}), 400, CORS_HEADERS)
 
         # Añadir el documento a la colección 'exoplanetas' (Firestore genera el ID)
-        update_time, doc_ref = firestore_client.collection('exoplanetas').add(data)
+        # junto con su contribución a las estadísticas agregadas
+        firestore_client = get_firestore_client()
+        doc_ref = firestore_client.collection('exoplanetas').document()
+        batch = firestore_client.batch()
+        batch.set(doc_ref, {**data, UPDATED_AT_FIELD: firestore.SERVER_TIMESTAMP})
+        exoplanet_stats.add_to_batch(batch, firestore_client, exoplanet_stats.contribution(data))
+        with phase("firestore_write"):
+            batch.commit()
         
         print(f"Documento {doc_ref.id} creado en la colección 'exoplanetas'.")
         
@@ -47,4 +280,3 @@ def save_exoplanet(request: Request):
     except Exception as e:
         print(f"Error al guardar en Firestore: {e}")
         return (jsonify({"error": "Ocurrió un error interno al guardar los datos."}), 500, CORS_HEADERS)
-
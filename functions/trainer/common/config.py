@@ -26,7 +26,6 @@ class ModelConfig:
     imputation_strategy = 'median'
     
     # --- ¡NUEVO! Parámetros específicos de K2 ---
-    min_valid_features = 5       # Mínimo de features no-nulas para incluir una fila
     remove_controversial = False # Si True, elimina planetas controversiales
     
     # === PARÁMETROS DE MODELOS ===
@@ -42,4 +41,18 @@ class ModelConfig:
     
     # === PARÁMETROS DE EVALUACIÓN ===
     cv_splits = 5
-    top_features_to_show = 20
\ No newline at end of file
+    top_features_to_show = 20
+
+    # === ENTRENAMIENTO FUERA DE MEMORIA ===
+    ooc_chunk_rows = 50_000      # Filas por chunk al leer el CSV y por fragmento en disco
+    ooc_median_bins = 1024       # Bins por nivel del histograma de la mediana (error <= rango / bins²)
+    ooc_max_bin = 256            # 'max_bin' de XGBoost para la matriz cuantizada externa
+
+    # === MODELO COMPACTO DE SERVICIO (variante 'fast' del predictor) ===
+    compact_candidates = ((20, 3), (50, 4), (100, 5))  # (árboles, profundidad), de menor a mayor coste
+    compact_learning_rate = 0.3
+    compact_latency_ms = 2.0          # Latencia máxima por fila (predict_proba de una fila)
+    compact_max_bytes = 512 * 1024    # Tamaño máximo del modelo serializado
+    compact_min_agreement = 0.95      # Concordancia mínima con el modelo completo en test
+    compact_distill_rows = 200_000    # Filas como máximo para destilar y para medir la fidelidad
+    compact_latency_samples = 50      # Llamadas de una fila para medir la latencia
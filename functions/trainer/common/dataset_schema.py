@@ -0,0 +1,47 @@
+# common/dataset_schema.py
+#
+# Contrato de columnas de cada pipeline de entrenamiento: la columna objetivo,
+# los grupos de features que usa '_select_columns' y el mínimo de features no
+# nulas por fila. Los pipelines del trainer
+# leen de aquí sus features y el orquestador valida con lo mismo las subidas
+# antes de encolar el entrenamiento. Este archivo se mantiene idéntico en el
+# trainer y en el orquestador.
+
+DATASET_SCHEMAS = {
+    "kepler": {
+        "target": "koi_disposition",
+        "feature_groups": {
+            'flags': ['koi_fpflag_nt', 'koi_fpflag_ss', 'koi_fpflag_co', 'koi_fpflag_ec', 'koi_score'],
+            'planeta': ['koi_period', 'koi_prad', 'koi_teq', 'koi_insol', 'koi_sma', 'koi_eccen', 'koi_incl'],
+            'transito': ['koi_duration', 'koi_depth', 'koi_ror', 'koi_impact', 'koi_model_snr'],
+            'estrella': ['koi_steff', 'koi_slogg', 'koi_srad', 'koi_smass', 'koi_smet'],
+            'calidad': ['koi_count', 'koi_num_transits']
+        },
+        # Filas con menos features no nulas se descartan (None: no se filtra)
+        "min_valid_features": None,
+    },
+    "k2": {
+        "target": "disposition",
+        "feature_groups": {
+            'planeta': ['pl_orbper', 'pl_rade', 'pl_radj', 'pl_bmasse', 'pl_bmassj', 'pl_orbeccen', 'pl_orbsmax', 'pl_insol', 'pl_eqt'],
+            'estrella': ['st_teff', 'st_rad', 'st_mass', 'st_met', 'st_logg'],
+            'flags_calidad': ['pl_controv_flag', 'ttv_flag']
+        },
+        "min_valid_features": 5,
+    },
+}
+
+def supported_sources():
+    return sorted(DATASET_SCHEMAS)
+
+def target_column(data_source):
+    return DATASET_SCHEMAS[data_source]["target"]
+
+def feature_columns(data_source):
+    """Features candidatas en el orden de los grupos."""
+    groups = DATASET_SCHEMAS[data_source]["feature_groups"]
+    return [feature for group in groups.values() for feature in group]
+
+def min_valid_features(data_source):
+    """Mínimo de features no nulas para conservar una fila (None: no se filtra)."""
+    return DATASET_SCHEMAS[data_source]["min_valid_features"]
@@ -1,38 +1,149 @@
 # common/gcp_utils.py
 
-import pickle
-from google.cloud import storage, firestore
+import base64
+import gzip
+import json
+import tempfile
+import time
 from datetime import datetime
 
+import google_crc32c
+from google.cloud.storage import transfer_manager
+
+from common import artifact_bundle
+from common.clients import get_firestore_client, get_storage_client
+
+# --- SUBIDA DE ARTEFACTOS ---
+PARALLEL_UPLOAD_THRESHOLD = 32 * 1024 * 1024   # Por encima, subida en partes paralelas
+PARALLEL_UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+PARALLEL_UPLOAD_WORKERS = 8
+
+# Tipos que se guardan tal cual en el documento del job; todo lo demás
+# (classification_report, feature_importance, ...) va al sidecar en GCS.
+HEADLINE_TYPES = (bool, int, float, str, type(None))
+
+def bundle_prefix(job_id):
+    return f"models/{job_id}/bundle"
+
+def artifacts_uri(bucket_name, job_id):
+    """URI del manifiesto de artefactos de un job (se conoce antes de subirlos)."""
+    return f"gs://{bucket_name}/{bundle_prefix(job_id)}/{artifact_bundle.MANIFEST_NAME}"
+
+def _crc32c_base64(data):
+    return base64.b64encode(google_crc32c.Checksum(data).digest()).decode("ascii")
+
+def upload_bytes(blob, data, content_type="application/octet-stream"):
+    """
+    Sube 'data' verificando su CRC32C. Los objetos grandes se suben en partes
+    paralelas (XML multipart) y se comprueba el CRC32C del objeto final.
+    """
+    expected_crc32c = _crc32c_base64(data)
+    if len(data) < PARALLEL_UPLOAD_THRESHOLD:
+        blob.upload_from_string(data, content_type=content_type, checksum="crc32c")
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".part") as tmp:
+        tmp.write(data)
+        tmp.flush()
+        transfer_manager.upload_chunks_concurrently(
+            tmp.name, blob,
+            content_type=content_type,
+            chunk_size=PARALLEL_UPLOAD_CHUNK_SIZE,
+            worker_type=transfer_manager.THREAD,
+            max_workers=PARALLEL_UPLOAD_WORKERS,
+            checksum="crc32c",
+        )
+    blob.reload()
+    if blob.crc32c != expected_crc32c:
+        raise IOError(f"CRC32C no coincide tras subir {blob.name}: esperado {expected_crc32c}, obtenido {blob.crc32c}.")
+
 def save_artifacts_to_gcs(bucket_name, job_id, artifacts):
-    """Sube el diccionario de artefactos a GCS."""
+    """
+    Sube los artefactos como bundle dividido (manifiesto + un objeto comprimido
+    por componente), con los componentes en paralelo y verificados por CRC32C.
+    Devuelve (gcs_uri_del_manifiesto, upload_info) con tamaños y tiempos.
+    """
     print("💾 Guardando artefactos del modelo en Cloud Storage...")
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    gcs_path = f"models/{job_id}/artifacts.pkl"
-    blob = bucket.blob(gcs_path)
-
-    with blob.open("wb") as f:
-        pickle.dump(artifacts, f)
-        
-    gcs_uri = f"gs://{bucket_name}/{blob.name}"
-    print(f"✓ Artefactos guardados en: {gcs_uri}")
-    return gcs_uri
-
-def update_firestore_metadata(job_id, gcs_uri, metadata):
-    """Actualiza el documento de un job en Firestore con los resultados."""
+    bucket = get_storage_client().bucket(bucket_name)
+
+    started = time.perf_counter()
+    gcs_uri, manifest = artifact_bundle.write_bundle(bucket, bundle_prefix(job_id), artifacts, upload=upload_bytes)
+    elapsed = time.perf_counter() - started
+    size, raw_size = artifact_bundle.bundle_size(manifest)
+
+    upload_info = {
+        "artifact_format": artifact_bundle.BUNDLE_FORMAT,
+        "artifact_compression": "zstd",
+        "artifact_size_bytes": size,
+        "artifact_raw_size_bytes": raw_size,
+        "artifact_upload_seconds": round(elapsed, 3),
+    }
+    print(f"✓ Artefactos guardados en: {gcs_uri} ({raw_size} -> {size} bytes en {elapsed:.2f}s)")
+    return gcs_uri, upload_info
+
+def save_results_sidecar(bucket_name, job_id, metadata):
+    """
+    Sube los resultados completos del entrenamiento como JSON comprimido
+    junto a los artefactos. Devuelve la URI del sidecar.
+    """
+    storage_client = get_storage_client()
+    blob = storage_client.bucket(bucket_name).blob(f"models/{job_id}/results.json.gz")
+    payload = gzip.compress(json.dumps(metadata, default=str).encode("utf-8"))
+    blob.upload_from_string(payload, content_type="application/gzip")
+    sidecar_uri = f"gs://{bucket_name}/{blob.name}"
+    print(f"✓ Resultados completos guardados en: {sidecar_uri} ({len(payload)} bytes)")
+    return sidecar_uri
+
+def headline_metrics(metadata):
+    """Métricas escalares que se quedan en Firestore para listados y consultas rápidas."""
+    headline = {k: v for k, v in metadata.items() if isinstance(v, HEADLINE_TYPES)}
+    report = metadata.get("classification_report") or {}
+    if "accuracy" in report:
+        headline["accuracy"] = report["accuracy"]
+    if "f1-score" in report.get("macro avg", {}):
+        headline["macro_f1"] = report["macro avg"]["f1-score"]
+    return headline
+
+def update_firestore_metadata(job_id, gcs_uri, metadata, bucket_name=None, status="completed"):
+    """
+    Actualiza el documento de un job en Firestore con los resultados.
+    Si se indica 'bucket_name', los resultados pesados se guardan en un sidecar
+    en GCS y el documento solo conserva las métricas principales y su ruta.
+    Con un 'status' distinto de 'completed' (p. ej. mientras los artefactos aún
+    se están subiendo) no se marca la fecha de finalización.
+    """
     print("📝 Guardando metadatos en Firestore...")
-    firestore_client = firestore.Client()
+    firestore_client = get_firestore_client()
     doc_ref = firestore_client.collection("exo_scout_models").document(job_id)
-    
-    final_metadata = {
-        "status": "completed",
-        "completed_at": datetime.now(),
-        "results": {
+
+    if bucket_name:
+        results = {
             "gcs_artifacts_path": gcs_uri,
-            **metadata
+            "results_sidecar_path": save_results_sidecar(bucket_name, job_id, metadata),
+            **headline_metrics(metadata)
         }
+    else:
+        results = {"gcs_artifacts_path": gcs_uri, **metadata}
+
+    final_metadata = {
+        "status": status,
+        "results": results
     }
+    if status == "completed":
+        final_metadata["completed_at"] = datetime.now()
     doc_ref.update(final_metadata)
     print(f"✓ Metadatos actualizados para el job: {job_id}")
-    return final_metadata
\ No newline at end of file
+    return final_metadata
+
+def mark_job_completed(job_id, upload_info):
+    """
+    Marca el job como completado una vez que los artefactos están en GCS y
+    registra el tamaño comprimido y los tiempos de la subida.
+    """
+    doc_ref = get_firestore_client().collection("exo_scout_models").document(job_id)
+    completed_at = datetime.now()
+    update = {"status": "completed", "completed_at": completed_at}
+    update.update({f"results.{key}": value for key, value in upload_info.items()})
+    doc_ref.update(update)
+    print(f"✓ Job {job_id} completado.")
+    return completed_at
@@ -0,0 +1,146 @@
+# common/memory_guard.py
+#
+# Techo de memoria para el entrenamiento fuera de memoria. Lo que se limita y
+# lo que se mide es lo mismo: la memoria residente (RSS) del proceso, que es lo
+# que cuenta para el OOM de la instancia.
+#   - Un hilo de sondeo lee la RSS cada EXO_TRAINER_MEMORY_POLL_SECONDS y
+#     registra el pico, también durante las llamadas largas a NumPy o XGBoost.
+#   - 'check()' compara la RSS con el límite en cada chunk (y con el pico que
+#     vio el sondeo desde la comprobación anterior) y aborta con un error claro
+#     antes de que la instancia muera por OOM. Es cooperativo: el entrenamiento
+#     solo se interrumpe en esos puntos.
+#   - Con EXO_TRAINER_HARD_MEMORY_LIMIT=true el techo es además duro: el
+#     entrenamiento va a un subproceso con setrlimit(RLIMIT_DATA)
+#     (run_with_memory_limit): una reserva por encima del límite falla con
+#     MemoryError en ese proceso, sin tocar los límites de la instancia ni las
+#     demás peticiones.
+
+import multiprocessing
+import os
+import resource
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+MEMORY_LIMIT_MB = int(os.environ.get("EXO_TRAINER_MEMORY_LIMIT_MB", 0)) or None
+HARD_MEMORY_LIMIT = os.environ.get("EXO_TRAINER_HARD_MEMORY_LIMIT", "").lower() in ("1", "true", "yes")
+POLL_SECONDS = float(os.environ.get("EXO_TRAINER_MEMORY_POLL_SECONDS", 0.05))
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+class MemoryCeilingExceeded(MemoryError):
+    pass
+
+def current_rss_mb():
+    """Memoria residente actual del proceso (MB). Fuera de Linux, el pico."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB en Linux
+
+class MemoryGuard:
+    """
+    Uso:
+        with MemoryGuard(limit_mb=2048) as guard:
+            for chunk in chunks:
+                ...
+                guard.check("lectura")
+    """
+    def __init__(self, limit_mb=MEMORY_LIMIT_MB, poll_seconds=POLL_SECONDS):
+        self.limit_mb = limit_mb
+        self.poll_seconds = poll_seconds
+        self.peak_mb = current_rss_mb()
+        self.exceeded = None  # Mensaje de error si el sondeo vio la RSS por encima del límite
+        self._stop = threading.Event()
+        self._poller = None
+
+    def __enter__(self):
+        self.exceeded = None
+        self._stop.clear()
+        self._poller = threading.Thread(target=self._poll, name="memory-guard", daemon=True)
+        self._poller.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        if self._poller is not None:
+            self._poller.join()
+            self._poller = None
+        self.check_peak()
+        return False
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_seconds):
+            rss_mb = current_rss_mb()
+            self.peak_mb = max(self.peak_mb, rss_mb)
+            if self.limit_mb and rss_mb > self.limit_mb and self.exceeded is None:
+                self.exceeded = self._message(rss_mb, "sondeo")
+
+    def _message(self, rss_mb, stage):
+        return (f"Memoria residente de {rss_mb:.0f} MB en '{stage}', por encima del límite de {self.limit_mb} MB. "
+                "Reduce 'ooc_chunk_rows' o aumenta el límite.")
+
+    def check(self, stage):
+        rss_mb = current_rss_mb()
+        self.peak_mb = max(self.peak_mb, rss_mb)
+        if self.limit_mb and rss_mb > self.limit_mb:
+            raise MemoryCeilingExceeded(self._message(rss_mb, stage))
+        if self.exceeded:
+            # El pico entre dos comprobaciones también cuenta
+            raise MemoryCeilingExceeded(self.exceeded)
+        return rss_mb
+
+    def check_peak(self):
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+        return self.peak_mb
+
+def current_data_mb():
+    """Memoria privada de escritura del proceso (MB), la que limita RLIMIT_DATA."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[5]) * _PAGE_SIZE / 2**20
+
+def limit_data_segment(limit_mb):
+    """
+    Techo duro para el resto de la vida del proceso: setrlimit(RLIMIT_DATA)
+    con el margen que aún queda hasta 'limit_mb' de RSS sumado a la memoria
+    privada actual. Desde Linux 4.7 RLIMIT_DATA cuenta todas las reservas
+    privadas (malloc, mmap anónimo), no solo el heap, y al contrario que
+    RLIMIT_AS no incluye las bibliotecas ni las reservas sin escribir. Solo
+    para subprocesos.
+    """
+    headroom_mb = max(limit_mb - current_rss_mb(), 0)
+    limit_bytes = int((current_data_mb() + headroom_mb) * 2**20)
+    resource.setrlimit(resource.RLIMIT_DATA, (limit_bytes, limit_bytes))
+    return limit_bytes / 2**20
+
+def _prepare_subprocess():
+    # El pool por defecto de Arrow (jemalloc) reserva cientos de MB que cuentan para
+    # RLIMIT_DATA sin llegar a usarse; con el de malloc el techo se parece a la RSS.
+    os.environ.setdefault("ARROW_DEFAULT_MEMORY_POOL", "system")
+
+def _call_with_memory_limit(limit_mb, function, args):
+    limit_data_segment(limit_mb)
+    return function(*args)
+
+def run_with_memory_limit(function, args, limit_mb):
+    """
+    Ejecuta 'function(*args)' en un subproceso nuevo ('spawn': no hereda los
+    hilos ni los clientes de la petición) con limit_data_segment(limit_mb).
+    'function', 'args' y el resultado deben poder enviarse con pickle. Un fallo
+    de memoria en el subproceso llega como MemoryCeilingExceeded.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_prepare_subprocess) as executor:
+        try:
+            return executor.submit(_call_with_memory_limit, limit_mb, function, args).result()
+        except MemoryCeilingExceeded:
+            raise
+        except MemoryError as e:
+            raise MemoryCeilingExceeded(f"El entrenamiento superó el límite duro de {limit_mb} MB de memoria: {e}") from None
+        except BrokenProcessPool:
+            raise MemoryCeilingExceeded(
+                f"El subproceso de entrenamiento terminó de forma abrupta (límite duro de {limit_mb} MB).") from None
@@ -0,0 +1,241 @@
+# common/model_routing.py
+#
+# Tabla de enrutado de modelos: alias como 'kepler:best' o 'k2:latest' que
+# apuntan al job_id del modelo correspondiente, para que los clientes puedan
+# predecir sin conocer el job_id ni listar /jobs. Este archivo se mantiene
+# idéntico en el trainer, el predictor y crud_jobs.
+#
+#   exo_scout_routing/aliases = {
+#       "routes": {"kepler:best": {"job_id": ..., "data_source": ..., "gcs_artifacts_path": ..., ...}, ...},
+#       "version": 12,
+#       "updated_at": ...,
+#       "deleted_jobs": {job_id: segundos desde epoch, ...}
+#   }
+#
+# Todas las rutas viven en un único documento para que el predictor las lea con
+# una sola lectura y para que cada cambio sea una transacción sobre ese documento:
+#   - el trainer publica cada job al completarlo (publish_job),
+#   - la Jobs API retira los alias de un job eliminado y los reasigna (unpublish_job),
+#   - rebuild_routes recalcula la tabla entera a partir de los jobs completados.
+# 'deleted_jobs' son lápidas de los últimos jobs eliminados: el predictor las ve
+# al recargar la tabla y descarta lo que guardaba en memoria y en disco de ellos.
+
+import os
+import threading
+import time
+from datetime import timezone
+
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from common.instrumentation import phase
+
+ROUTING_COLLECTION = "exo_scout_routing"
+ALIASES_DOCUMENT = "aliases"
+MODELS_COLLECTION = "exo_scout_models"
+# Tipos de alias por fuente de datos: '{data_source}:{tipo}'
+ALIAS_KINDS = ("best", "latest")
+ROUTING_CACHE_TTL_SECONDS = float(os.environ.get("ROUTING_CACHE_TTL_SECONDS", 30))
+# Intervalo mínimo entre recargas forzadas por un alias desconocido
+ROUTING_MISS_REFRESH_SECONDS = 1.0
+# Lápidas de jobs eliminados que se conservan en la tabla (las más recientes)
+MAX_DELETED_JOBS = 200
+# Campos de los jobs que se leen para recalcular las rutas
+JOB_FIELDS = ["params.data_source", "params.algorithm", "results.gcs_artifacts_path", "results.f1_score",
+              "results.compact_model_agreement", "completed_at"]
+
+def is_alias(name):
+    """True si 'name' tiene la forma '{data_source}:{tipo}' (los job_id son hashes hexadecimales)."""
+    data_source, separator, kind = (name or "").rpartition(":")
+    return bool(separator and data_source) and kind in ALIAS_KINDS
+
+def serving_variants(results):
+    """Variantes que admite el predictor para un job: 'full' y, si el trainer la construyó, 'fast'."""
+    return ["full", "fast"] if results.get("compact_model_agreement") is not None else ["full"]
+
+def _aliases_ref(firestore_client):
+    return firestore_client.collection(ROUTING_COLLECTION).document(ALIASES_DOCUMENT)
+
+def _timestamp(value):
+    """Segundos desde epoch; las fechas sin zona (datetime.now() del trainer) se tratan como UTC."""
+    if value is None:
+        return 0.0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def _route_from_job(job_id, data):
+    params = data.get("params") or {}
+    results = data.get("results") or {}
+    return {
+        "job_id": job_id,
+        "data_source": params.get("data_source"),
+        "algorithm": params.get("algorithm"),
+        "gcs_artifacts_path": results.get("gcs_artifacts_path"),
+        "f1_score": results.get("f1_score"),
+        "variants": serving_variants(results),
+        "completed_at": data.get("completed_at"),
+    }
+
+def _rank(kind, route):
+    """Clave de orden de una ruta para un tipo de alias (mayor es mejor)."""
+    completed_at = _timestamp(route.get("completed_at"))
+    if kind == "best":
+        f1 = route.get("f1_score")
+        return (f1 if f1 is not None else -1.0, completed_at)
+    return (completed_at,)
+
+def _improves(kind, route, current):
+    if not route.get("data_source") or not route.get("gcs_artifacts_path"):
+        return False
+    return current is None or current.get("job_id") == route["job_id"] or _rank(kind, route) > _rank(kind, current)
+
+def _routes_for(candidates, routes=None):
+    """Aplica las rutas candidatas sobre 'routes'. Devuelve (rutas, alias_cambiados)."""
+    routes, changed = dict(routes or {}), []
+    for route in candidates:
+        for kind in ALIAS_KINDS:
+            alias = f"{route.get('data_source')}:{kind}"
+            if _improves(kind, route, routes.get(alias)):
+                routes[alias] = route
+                changed.append(alias)
+    return routes, changed
+
+def _completed_jobs(transaction, firestore_client, data_source=None):
+    query = firestore_client.collection(MODELS_COLLECTION).where(filter=FieldFilter("status", "==", "completed"))
+    if data_source:
+        query = query.where(filter=FieldFilter("params.data_source", "==", data_source))
+    snapshots = transaction.get(query.select(JOB_FIELDS))
+    return [_route_from_job(doc.id, doc.to_dict() or {}) for doc in snapshots]
+
+def _read_routes(transaction, aliases_ref):
+    snapshot = next(iter(transaction.get(aliases_ref)))
+    data = (snapshot.to_dict() if snapshot.exists else None) or {}
+    return dict(data.get("routes") or {}), data.get("version", 0), dict(data.get("deleted_jobs") or {})
+
+def _write_routes(transaction, aliases_ref, routes, version, deleted_jobs):
+    if len(deleted_jobs) > MAX_DELETED_JOBS:
+        deleted_jobs = dict(sorted(deleted_jobs.items(), key=lambda item: item[1])[-MAX_DELETED_JOBS:])
+    transaction.set(aliases_ref, {"routes": routes, "version": version + 1, "updated_at": firestore.SERVER_TIMESTAMP,
+                                  "deleted_jobs": deleted_jobs})
+
+@firestore.transactional
+def _publish_in_transaction(transaction, aliases_ref, route):
+    routes, version, deleted_jobs = _read_routes(transaction, aliases_ref)
+    routes, changed = _routes_for([route], routes)
+    if changed:
+        _write_routes(transaction, aliases_ref, routes, version, deleted_jobs)
+    return changed
+
+def publish_job(firestore_client, job_id, job_data):
+    """
+    Apunta a este job los alias de su fuente de datos que mejora. 'job_data'
+    es el documento del job (o al menos params, results y completed_at).
+    Devuelve la lista de alias actualizados.
+    """
+    route = _route_from_job(job_id, job_data)
+    with phase("firestore_write"):
+        changed = _publish_in_transaction(firestore_client.transaction(), _aliases_ref(firestore_client), route)
+    if changed:
+        print(f"✓ Alias actualizados para el job {job_id}: {', '.join(sorted(changed))}")
+    return changed
+
+@firestore.transactional
+def _unpublish_in_transaction(transaction, firestore_client, aliases_ref, job_id, deleted):
+    routes, version, deleted_jobs = _read_routes(transaction, aliases_ref)
+    removed = sorted(alias for alias, route in routes.items() if route.get("job_id") == job_id)
+    if deleted:
+        deleted_jobs[job_id] = time.time()
+    elif not removed:
+        return removed, []
+    for alias in removed:
+        del routes[alias]
+    # Reasignar los alias retirados al siguiente mejor job de la misma fuente de datos
+    for data_source in {alias.rpartition(":")[0] for alias in removed}:
+        candidates = [r for r in _completed_jobs(transaction, firestore_client, data_source) if r["job_id"] != job_id]
+        for alias, route in _routes_for(candidates)[0].items():
+            if alias in removed:
+                routes[alias] = route
+    _write_routes(transaction, aliases_ref, routes, version, deleted_jobs)
+    return removed, sorted(alias for alias in removed if alias in routes)
+
+def unpublish_job(firestore_client, job_id, deleted=False):
+    """
+    Retira los alias que apuntan a un job y los reasigna al siguiente candidato
+    si lo hay. Con 'deleted' deja además la lápida del job en la tabla.
+    Devuelve (alias_retirados, alias_reasignados).
+    """
+    with phase("firestore_write"):
+        removed, reassigned = _unpublish_in_transaction(
+            firestore_client.transaction(), firestore_client, _aliases_ref(firestore_client), job_id, deleted
+        )
+    if removed:
+        print(f"INFO: Alias retirados del job {job_id}: {', '.join(removed)} (reasignados: {', '.join(reassigned) or 'ninguno'})")
+    return removed, reassigned
+
+@firestore.transactional
+def _rebuild_in_transaction(transaction, firestore_client, aliases_ref):
+    _, version, deleted_jobs = _read_routes(transaction, aliases_ref)
+    routes, _ = _routes_for(_completed_jobs(transaction, firestore_client))
+    _write_routes(transaction, aliases_ref, routes, version, deleted_jobs)
+    return routes
+
+def rebuild_routes(firestore_client):
+    """Recalcula la tabla completa a partir de los jobs completados (migración o reparación)."""
+    with phase("firestore_write"):
+        routes = _rebuild_in_transaction(firestore_client.transaction(), firestore_client, _aliases_ref(firestore_client))
+    print(f"✓ Tabla de enrutado reconstruida con {len(routes)} alias.")
+    return routes
+
+class RouteCache:
+    """
+    Copia en memoria de la tabla de enrutado (una lectura de Firestore por TTL).
+    Un alias desconocido fuerza una recarga, como mucho una por
+    ROUTING_MISS_REFRESH_SECONDS, para que los alias nuevos se vean enseguida.
+    Las lápidas nuevas de cada recarga se entregan una vez con take_deleted().
+    """
+    def __init__(self, ttl_seconds=ROUTING_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._routes = None
+        self._loaded_at = 0.0
+        self._deleted_jobs = set()
+        self._pending_deleted = set()
+        self._lock = threading.Lock()
+
+    def _load(self, firestore_client):
+        with phase("firestore_read"):
+            snapshot = _aliases_ref(firestore_client).get()
+        data = (snapshot.to_dict() if snapshot.exists else None) or {}
+        self._routes = data.get("routes") or {}
+        self._loaded_at = time.monotonic()
+        # (job_id, fecha): un job recreado y eliminado otra vez cuenta como lápida nueva
+        deleted_jobs = set((data.get("deleted_jobs") or {}).items())
+        self._pending_deleted |= {job_id for job_id, _ in deleted_jobs - self._deleted_jobs}
+        self._deleted_jobs = deleted_jobs
+        return self._routes
+
+    def routes(self, firestore_client, max_age=None):
+        max_age = self.ttl_seconds if max_age is None else max_age
+        with self._lock:
+            if self._routes is None or time.monotonic() - self._loaded_at > max_age:
+                return self._load(firestore_client)
+            return self._routes
+
+    def resolve(self, firestore_client, alias):
+        """Ruta del alias ({'job_id', 'data_source', 'gcs_artifacts_path', ...}) o None."""
+        route = self.routes(firestore_client).get(alias)
+        if route is None:
+            route = self.routes(firestore_client, max_age=ROUTING_MISS_REFRESH_SECONDS).get(alias)
+        return route
+
+    def take_deleted(self):
+        """job_id eliminados que han aparecido desde la última llamada."""
+        with self._lock:
+            pending, self._pending_deleted = self._pending_deleted, set()
+        return pending
+
+    def invalidate(self):
+        with self._lock:
+            self._routes = None
+
+route_cache = RouteCache()
@@ -9,8 +9,8 @@ import xgboost as xgb
 import pickle
 from datetime import datetime
 
-# --- Importaciones de Google Cloud ---
-from google.cloud import storage, firestore
+# --- Clientes de Google Cloud compartidos ---
+from common.clients import get_firestore_client, get_storage_client
 
 # =============================================================================
 # CLASE DE CONFIGURACIÓN (Tu código original, sin cambios)
@@ -162,9 +162,9 @@ def train_and_save_model(job_id, df, algorithm, bucket_name):
     """
     print("🚀 INICIANDO PIPELINE DE ENTRENAMIENTO EN LA NUBE 🚀")
     
-    # Inicializar clientes de GCP
-    storage_client = storage.Client()
-    firestore_client = firestore.Client()
+    # Clientes de GCP compartidos (se crean una sola vez por proceso)
+    storage_client = get_storage_client()
+    firestore_client = get_firestore_client()
     
     # Configurar y ejecutar el pipeline
     config = ModelConfig()
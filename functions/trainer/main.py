@@ -2,18 +2,52 @@
 
 import functions_framework
 from flask import Request, jsonify
+from google.cloud import firestore
 import pandas as pd
 import io
-from google.cloud import storage, firestore
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Importar el pipeline específico que necesitamos
 from pipelines.kepler_pipeline import KeplerTrainingPipeline
 from pipelines.k2_pipeline import K2TrainingPipeline 
+from pipelines.out_of_core import OutOfCoreTrainingPipeline, SourceFile
 
-from common import gcp_utils
+from common import gcp_utils, model_routing
+from common.clients import get_firestore_client, get_storage_client
+from common.memory_guard import HARD_MEMORY_LIMIT, MEMORY_LIMIT_MB
+from common.instrumentation import instrumented, phase
+
+# Por encima de este tamaño de CSV se entrena fuera de memoria (también se puede
+# forzar con "out_of_core": true/false en la petición).
+OUT_OF_CORE_THRESHOLD_BYTES = int(os.environ.get("OUT_OF_CORE_THRESHOLD_BYTES", 512 * 1024 * 1024))
+# Variante compacta de servicio ('variant=fast' en el predictor). Desactivada por
+# defecto: destilar y medir los candidatos alarga cada entrenamiento. Se pide por
+# job con "compact_model": true en la petición o para todos con COMPACT_MODEL_DEFAULT=true.
+COMPACT_MODEL_DEFAULT = os.environ.get("COMPACT_MODEL_DEFAULT", "false").lower() in ("1", "true", "yes")
+PIPELINES = {
+    'kepler': KeplerTrainingPipeline,
+    'k2': K2TrainingPipeline,
+}
+
+def _use_out_of_core(request_json, blob):
+    requested = request_json.get("out_of_core")
+    if requested is not None:
+        return bool(requested)
+    # El orquestador ya midió el CSV en la validación previa; si no, se consulta a GCS
+    size_bytes = (request_json.get("preflight") or {}).get("size_bytes")
+    if size_bytes is None:
+        blob.reload()
+        size_bytes = blob.size or 0
+    return size_bytes > OUT_OF_CORE_THRESHOLD_BYTES
+
+def _use_compact_model(request_json):
+    requested = request_json.get("compact_model")
+    return COMPACT_MODEL_DEFAULT if requested is None else bool(requested)
 
 @functions_framework.http
+@instrumented("trainer")
 def trainer_function(request: Request):
     """
     Cloud Function Orquestadora.
@@ -33,7 +67,7 @@ def trainer_function(request: Request):
         return ("Error: Faltan parámetros.", 400)
 
     MODEL_BUCKET_NAME = "exoplanets-nasa-models"
-    doc_ref = firestore.Client().collection("exo_scout_models").document(job_id)
+    doc_ref = get_firestore_client().collection("exo_scout_models").document(job_id)
     
     try:
         # Registrar inicio del job
@@ -49,7 +83,12 @@ def trainer_function(request: Request):
             },
             "gcs_artifacts_path": gcs_artifacts_path
         }
-        doc_ref.set(initial_metadata)
+        # Estimación de la validación previa del orquestador (filas, clases, nulos)
+        preflight = request_json.get("preflight")
+        if preflight:
+            initial_metadata["preflight"] = preflight
+        with phase("firestore_write"):
+            doc_ref.set(initial_metadata)
         print(f"INFO: Job {job_id} ({model_name}) registrado en Firestore con estado 'training'.")
 
     except Exception as e:
@@ -58,31 +97,77 @@ def trainer_function(request: Request):
     
     try:
         # Descargar datos
-        storage_client = storage.Client()
+        storage_client = get_storage_client()
         bucket_name, file_name = gcs_input_uri.replace("gs://", "").split("/", 1)
         blob = storage_client.bucket(bucket_name).blob(file_name)
-        df = pd.read_csv(io.BytesIO(blob.download_as_bytes()), comment='#')
-        
+
         # --- ORQUESTACIÓN ---
         # Elige el pipeline correcto basado en la fuente de datos
-        if data_source == 'kepler':
-            pipeline = KeplerTrainingPipeline(df=df, algorithm=algorithm)
-        elif data_source == 'k2': # <-- ¡NUEVO!
-            pipeline = K2TrainingPipeline(df=df, algorithm=algorithm)
-        else:
+        pipeline_class = PIPELINES.get(data_source)
+        if pipeline_class is None:
             raise NotImplementedError(f"El pipeline para '{data_source}' no está implementado.")
+
+        if _use_out_of_core(request_json, blob):
+            # El CSV se lee en streaming desde GCS; solo XGBoost admite memoria externa.
+            # La sustitución queda en 'params' (alias, listados y filtros leen 'params.algorithm').
+            if algorithm != 'xgboost':
+                print(f"WARN: El modo fuera de memoria entrena con xgboost en lugar de '{algorithm}'.")
+                initial_metadata["params"].update(algorithm='xgboost', requested_algorithm=algorithm)
+                with phase("firestore_write"):
+                    doc_ref.update({"params.algorithm": 'xgboost', "params.requested_algorithm": algorithm})
+            pipeline = OutOfCoreTrainingPipeline(
+                open_source=SourceFile(gcs_input_uri),
+                feature_pipeline=pipeline_class(df=None, algorithm='xgboost'),
+                job_id=job_id,
+                compact_model=_use_compact_model(request_json),
+            )
+        else:
+            with phase("gcs_read"):
+                raw_data = blob.download_as_bytes()
+            with phase("parse"):
+                df = pd.read_csv(io.BytesIO(raw_data), comment='#')
+            pipeline = pipeline_class(df=df, algorithm=algorithm, compact_model=_use_compact_model(request_json))
         
         # Ejecutar el pipeline
-        artifacts, metadata = pipeline.run()
+        with phase("train"):
+            if isinstance(pipeline, OutOfCoreTrainingPipeline) and HARD_MEMORY_LIMIT and MEMORY_LIMIT_MB:
+                artifacts, metadata = pipeline.run_in_subprocess()
+            else:
+                artifacts, metadata = pipeline.run()
         
-        # Guardar resultados
-        gcs_uri = gcp_utils.save_artifacts_to_gcs(MODEL_BUCKET_NAME, job_id, artifacts)
-        final_results = gcp_utils.update_firestore_metadata(job_id, gcs_uri, metadata)
+        # Guardar resultados: la subida de artefactos y la escritura de metadatos
+        # (con su sidecar) van en paralelo. El job solo pasa a 'completed' cuando
+        # ambas terminan, para que el predictor nunca vea una ruta sin artefactos.
+        gcs_uri = gcp_utils.artifacts_uri(MODEL_BUCKET_NAME, job_id)
+        with phase("save_results"), ThreadPoolExecutor(max_workers=2) as executor:
+            upload_future = executor.submit(gcp_utils.save_artifacts_to_gcs, MODEL_BUCKET_NAME, job_id, artifacts)
+            metadata_future = executor.submit(
+                gcp_utils.update_firestore_metadata, job_id, gcs_uri, metadata,
+                bucket_name=MODEL_BUCKET_NAME, status="uploading_artifacts"
+            )
+            _, upload_info = upload_future.result()
+            final_results = metadata_future.result()
+        with phase("firestore_write"):
+            final_results["completed_at"] = gcp_utils.mark_job_completed(job_id, upload_info)
+        final_results["status"] = "completed"
+        final_results["results"].update(upload_info)
+
+        # Publicar el modelo en la tabla de alias ('kepler:latest', 'kepler:best', ...).
+        # Un fallo aquí no invalida el entrenamiento: la tabla se puede reconstruir.
+        try:
+            final_results["aliases"] = model_routing.publish_job(
+                get_firestore_client(), job_id, {**initial_metadata, **final_results}
+            )
+        except Exception as e:
+            print(f"WARN: No se pudieron actualizar los alias del job {job_id}: {e}")
 
         return jsonify(final_results), 200
 
     except Exception as e:
         print(f"ERROR CRÍTICO en el job {job_id}: {e}")
-        error_payload = {"status": "error", "error_message": str(e), "failed_at": datetime.now()}
+        error_payload = {"status": "error", "error_message": str(e), "failed_at": datetime.now(),
+                         # La ruta se escribe mientras se suben los artefactos; si la subida
+                         # falla no debe quedar apuntando a un bundle incompleto
+                         "results.gcs_artifacts_path": firestore.DELETE_FIELD}
         doc_ref.update(error_payload)
         return (f"Ocurrió un error en el job {job_id}. Revisa Firestore.", 500)
\ No newline at end of file
@@ -8,15 +8,17 @@ import xgboost as xgb
 from sklearn.metrics import f1_score, classification_report
 
 from common.config import ModelConfig
+from .compact_model import attach_compact_model
 
 class BaseTrainingPipeline(ABC):
     """
     Clase base para todos los pipelines de entrenamiento.
     Define la estructura y contiene la lógica común.
     """
-    def __init__(self, df, algorithm):
+    def __init__(self, df, algorithm, compact_model=False):
         self.df = df
         self.algorithm = algorithm
+        self.compact_model = compact_model  # Construir también la variante compacta de servicio
         self.config = ModelConfig()
         self.artifacts = {}
         self.metadata = {}
@@ -36,6 +38,15 @@ class BaseTrainingPipeline(ABC):
         """Método abstracto para preprocesar. Debe ser implementado por cada subclase."""
         pass
 
+    def prepare_chunk(self, df):
+        """
+        Selección y feature engineering sobre un fragmento cualquiera del dataset,
+        sin tocar el estado del pipeline. Lo usa el entrenamiento fuera de memoria;
+        las subclases implementan '_select_columns(df)' y '_add_features(X)'.
+        """
+        X, y = self._select_columns(df)
+        return self._add_features(X), y
+
     def _train_and_evaluate(self):
         """Lógica de entrenamiento y evaluación, común para todos."""
         print(f"PASO 4: ENTRENANDO MODELO: {self.algorithm}")
@@ -71,6 +82,11 @@ class BaseTrainingPipeline(ABC):
             
         print(f"✓ Entrenamiento completo. F1-Score: {self.metadata['f1_score']:.4f}")
 
+        if self.compact_model:
+            max_rows = self.config.compact_distill_rows
+            X_distill = X_train.sample(n=max_rows, random_state=self.config.random_state) if len(X_train) > max_rows else X_train
+            attach_compact_model(self.artifacts, self.metadata, model, X_distill, X_test.iloc[:max_rows], y_test[:max_rows], self.config)
+
     def run(self):
         """Ejecuta el pipeline completo en orden."""
         self.select_features()
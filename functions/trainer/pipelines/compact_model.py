@@ -0,0 +1,158 @@
+# pipelines/compact_model.py
+#
+# Variante compacta de servicio. Los modelos completos se ajustan solo por F1
+# (bosques de 200 árboles de profundidad 20, boosters de 200 rondas) y puntuar
+# una sola fila con ellos cuesta mucho más de lo que necesita el predictor
+# interactivo. Aquí se destila el modelo completo en un XGBoost pequeño:
+#   - cada fila de entrenamiento se replica una vez por clase con peso igual a
+#     la probabilidad que le da el modelo completo (entropía cruzada contra sus
+#     probabilidades, no contra las etiquetas),
+#   - se prueban configuraciones de menor a mayor coste (ModelConfig.compact_candidates)
+#     y se elige la primera que cumple la latencia por fila, el tamaño y la
+#     concordancia mínima; si ninguna llega a la concordancia, la más fiel de
+#     las que caben en el presupuesto.
+# Las filas de evaluación se dividen en dos mitades disjuntas: con una se elige
+# el candidato y con la otra se mide la fidelidad que se publica (concordancia
+# con el modelo completo, diferencia media de probabilidades y F1 de ambos), para
+# que la cifra no salga de las mismas filas que decidieron la selección.
+# El modelo compacto se entrena y se llama con arrays float32 en lugar de
+# DataFrames: con una sola fila, la conversión desde pandas de XGBoost cuesta
+# más que recorrer los árboles.
+
+import pickle
+import time
+
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import f1_score
+
+def _soft_targets(teacher, X):
+    """(X replicado, clases, pesos) para ajustar las probabilidades del modelo completo."""
+    proba = teacher.predict_proba(X)
+    n_rows, n_classes = proba.shape
+    X_repeated = np.repeat(np.asarray(X, dtype=np.float32), n_classes, axis=0)
+    y_repeated = np.tile(np.arange(n_classes), n_rows)
+    # Un peso mínimo mantiene todas las clases aunque el modelo completo no prediga alguna
+    weights = np.maximum(proba.ravel(), 1e-6)
+    return X_repeated, y_repeated, weights
+
+def _latency_ms(model, X, repeats, as_array=False):
+    """Mediana de milisegundos por llamada a predict_proba con una sola fila (como el predictor)."""
+    rows = [X.iloc[[i % len(X)]] for i in range(repeats)]
+    if as_array:
+        rows = [row.to_numpy(dtype=np.float32) for row in rows]
+    model.predict_proba(rows[0])  # Calentamiento
+    timings = []
+    for row in rows:
+        started = time.perf_counter()
+        model.predict_proba(row)
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings))
+
+def _size_bytes(model):
+    return len(pickle.dumps(model, protocol=5))
+
+def _evaluate(model, X_eval, y_eval, full_proba, full_pred, repeats):
+    proba = model.predict_proba(X_eval.to_numpy(dtype=np.float32))
+    pred = proba.argmax(axis=1)
+    return {
+        "agreement": round(float(np.mean(pred == full_pred)), 4),
+        "mean_abs_proba_diff": round(float(np.mean(np.abs(proba - full_proba))), 4),
+        "f1_score": round(float(f1_score(y_eval, pred, average='weighted')), 4),
+        "latency_ms_per_row": round(_latency_ms(model, X_eval, repeats, as_array=True), 3),
+        "size_bytes": _size_bytes(model),
+    }
+
+def _split_selection(X_eval, y_eval, random_state):
+    """Divide las filas de evaluación en ((X, y) de selección, (X, y) de informe), disjuntas y a partes iguales."""
+    order = np.random.default_rng(random_state).permutation(len(X_eval))
+    half = len(order) // 2
+    if half == 0:
+        raise ValueError(f"Se necesitan al menos 2 filas de evaluación; hay {len(X_eval)}.")
+    y_eval = np.asarray(y_eval)
+    selection, held_out = np.sort(order[:half]), np.sort(order[half:])
+    return (X_eval.iloc[selection], y_eval[selection]), (X_eval.iloc[held_out], y_eval[held_out])
+
+def build_compact_model(teacher, X_distill, X_eval, y_eval, config):
+    """
+    Destila 'teacher' con las filas de 'X_distill', elige el candidato con una
+    mitad de 'X_eval' y mide la fidelidad en la otra. Devuelve (modelo_compacto o None, informe).
+    """
+    (X_select, y_select), (X_report, y_report) = _split_selection(X_eval, y_eval, config.random_state)
+    select_proba = teacher.predict_proba(X_select)
+    report_proba = teacher.predict_proba(X_report)
+    report = {
+        "method": "distilled_xgboost",
+        "latency_budget_ms": config.compact_latency_ms,
+        "max_size_bytes": config.compact_max_bytes,
+        "min_agreement": config.compact_min_agreement,
+        "distill_rows": int(len(X_distill)),
+        "selection_rows": int(len(X_select)),
+        "eval_rows": int(len(X_report)),
+        "full": {
+            "f1_score": round(float(f1_score(y_report, report_proba.argmax(axis=1), average='weighted')), 4),
+            "latency_ms_per_row": round(_latency_ms(teacher, X_report, config.compact_latency_samples), 3),
+            "size_bytes": _size_bytes(teacher),
+        },
+        "candidates": [],
+    }
+
+    X_repeated, y_repeated, weights = _soft_targets(teacher, X_distill)
+    best = None
+    for n_estimators, max_depth in config.compact_candidates:
+        model = xgb.XGBClassifier(
+            n_estimators=n_estimators, max_depth=max_depth, learning_rate=config.compact_learning_rate,
+            tree_method='hist', n_jobs=1, random_state=config.random_state, eval_metric='mlogloss',
+        )
+        model.fit(X_repeated, y_repeated, sample_weight=weights)
+        # Los candidatos se comparan solo en la mitad de selección
+        stats = {"n_estimators": n_estimators, "max_depth": max_depth,
+                 **_evaluate(model, X_select, y_select, select_proba, select_proba.argmax(axis=1),
+                             config.compact_latency_samples)}
+        report["candidates"].append(stats)
+        print(f"INFO: Candidato compacto {n_estimators}x{max_depth}: concordancia {stats['agreement']:.4f}, "
+              f"{stats['latency_ms_per_row']:.2f} ms/fila, {stats['size_bytes']} bytes.")
+
+        if stats["latency_ms_per_row"] > config.compact_latency_ms or stats["size_bytes"] > config.compact_max_bytes:
+            continue
+        if best is None or stats["agreement"] > best[1]["agreement"]:
+            best = (model, stats)
+        if stats["agreement"] >= config.compact_min_agreement:
+            break
+
+    if best is None:
+        report["status"] = "over_budget"
+        return None, report
+    model, stats = best
+    held_out = _evaluate(model, X_report, y_report, report_proba, report_proba.argmax(axis=1), config.compact_latency_samples)
+    report["selected"] = {"n_estimators": stats["n_estimators"], "max_depth": stats["max_depth"], **held_out,
+                          "selection_agreement": stats["agreement"]}
+    report["status"] = "ok" if held_out["agreement"] >= config.compact_min_agreement else "low_fidelity"
+    return model, report
+
+def attach_compact_model(artifacts, metadata, teacher, X_distill, X_eval, y_eval, config):
+    """
+    Construye la variante compacta y la añade a los artefactos ('compact_model')
+    y a los metadatos. Un fallo no invalida el entrenamiento: el job se queda
+    solo con el modelo completo.
+    """
+    print("PASO 5: CONSTRUYENDO MODELO COMPACTO DE SERVICIO")
+    try:
+        model, report = build_compact_model(teacher, X_distill, X_eval, y_eval, config)
+    except Exception as e:
+        print(f"WARN: No se pudo construir el modelo compacto: {e}")
+        metadata['compact_model'] = {"status": "error", "error": str(e)}
+        return
+    metadata['compact_model'] = report
+    if model is None:
+        print(f"WARN: Ningún candidato compacto cumple {config.compact_latency_ms} ms/fila y {config.compact_max_bytes} bytes.")
+        return
+
+    selected = report["selected"]
+    artifacts['compact_model'] = model
+    # Escalares para el documento del job (y para la tabla de alias)
+    metadata['compact_model_agreement'] = selected["agreement"]
+    metadata['compact_model_latency_ms'] = selected["latency_ms_per_row"]
+    metadata['full_model_latency_ms'] = report["full"]["latency_ms_per_row"]
+    print(f"✓ Modelo compacto: concordancia {selected['agreement']:.4f}, "
+          f"{selected['latency_ms_per_row']:.2f} ms/fila frente a {report['full']['latency_ms_per_row']:.2f} ms/fila.")
@@ -5,36 +5,37 @@ from sklearn.impute import SimpleImputer
 
 # Importamos la clase base para heredar su funcionalidad
 from .base_pipeline import BaseTrainingPipeline
+from common.dataset_schema import feature_columns, min_valid_features, target_column
 
 class K2TrainingPipeline(BaseTrainingPipeline):
     """
     Pipeline de entrenamiento específico para los datos de K2.
     """
-    def select_features(self):
-        print("PASO 1: SELECCIÓN DE FEATURES K2")
-        k2_feature_groups = {
-            'planeta': ['pl_orbper', 'pl_rade', 'pl_radj', 'pl_bmasse', 'pl_bmassj', 'pl_orbeccen', 'pl_orbsmax', 'pl_insol', 'pl_eqt'],
-            'estrella': ['st_teff', 'st_rad', 'st_mass', 'st_met', 'st_logg'],
-            'flags_calidad': ['pl_controv_flag', 'ttv_flag']
-        }
-        selected_features = [f for group in k2_feature_groups.values() for f in group]
-        available_features = [f for f in selected_features if f in self.df.columns]
+    def _select_columns(self, df):
+        selected_features = feature_columns('k2')
+        available_features = [f for f in selected_features if f in df.columns]
         
         # Filtramos filas con demasiados valores nulos
-        valid_counts = self.df[available_features].notna().sum(axis=1)
-        df_filtered = self.df[valid_counts >= self.config.min_valid_features].copy()
-        
-        self.X = df_filtered[available_features].copy()
-        self.y = df_filtered['disposition'].copy()
+        valid_counts = df[available_features].notna().sum(axis=1)
+        df_filtered = df[valid_counts >= min_valid_features('k2')]
+        return df_filtered[available_features].copy(), df_filtered[target_column('k2')].copy()
+
+    def _add_features(self, X):
+        if 'pl_rade' in X.columns and 'st_rad' in X.columns:
+            X['planet_star_ratio'] = X['pl_rade'] / (X['st_rad'] * 109.1)
+        if 'pl_rade' in X.columns and 'pl_orbper' in X.columns:
+            X['density_proxy'] = X['pl_rade'] / (X['pl_orbper'] ** (1/3))
+        return X
+
+    def select_features(self):
+        print("PASO 1: SELECCIÓN DE FEATURES K2")
+        self.X, self.y = self._select_columns(self.df)
         print(f"✓ Usando {self.X.shape[1]} features disponibles. Dataset final: {self.X.shape[0]} filas.")
 
     def engineer_features(self):
         print("PASO 2: FEATURE ENGINEERING K2")
         # Usamos self.X que fue creado en el paso anterior
-        if 'pl_rade' in self.X.columns and 'st_rad' in self.X.columns:
-            self.X['planet_star_ratio'] = self.X['pl_rade'] / (self.X['st_rad'] * 109.1)
-        if 'pl_rade' in self.X.columns and 'pl_orbper' in self.X.columns:
-            self.X['density_proxy'] = self.X['pl_rade'] / (self.X['pl_orbper'] ** (1/3))
+        self.X = self._add_features(self.X)
         print("✓ Features de ingeniería para K2 creadas.")
 
     def preprocess_data(self):
@@ -4,35 +4,33 @@ import pandas as pd
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.impute import SimpleImputer
 from .base_pipeline import BaseTrainingPipeline
+from common.dataset_schema import feature_columns, target_column
 
 class KeplerTrainingPipeline(BaseTrainingPipeline):
     """Pipeline de entrenamiento específico para datos de Kepler."""
 
+    def _select_columns(self, df):
+        selected_features = feature_columns('kepler')
+        available_features = [f for f in selected_features if f in df.columns]
+        return df[available_features].copy(), df[target_column('kepler')].copy()
+
+    def _add_features(self, X):
+        X_eng = X.copy()
+        if 'koi_prad' in X.columns and 'koi_srad' in X.columns:
+            X_eng['planet_star_ratio'] = X_eng['koi_prad'] / (X_eng['koi_srad'] * 109.1)
+        if 'koi_prad' in X.columns and 'koi_period' in X.columns:
+            X_eng['density_proxy'] = X_eng['koi_prad'] / (X_eng['koi_period'] ** (1/3))
+        # ... más features ...
+        return X_eng
+
     def select_features(self):
         print("PASO 1 (Kepler): SELECCIÓN DE FEATURES")
-        feature_groups = {
-            'flags': ['koi_fpflag_nt', 'koi_fpflag_ss', 'koi_fpflag_co', 'koi_fpflag_ec', 'koi_score'],
-            'planeta': ['koi_period', 'koi_prad', 'koi_teq', 'koi_insol', 'koi_sma', 'koi_eccen', 'koi_incl'],
-            'transito': ['koi_duration', 'koi_depth', 'koi_ror', 'koi_impact', 'koi_model_snr'],
-            'estrella': ['koi_steff', 'koi_slogg', 'koi_srad', 'koi_smass', 'koi_smet'],
-            'calidad': ['koi_count', 'koi_num_transits']
-        }
-        selected_features = [f for group in feature_groups.values() for f in group]
-        available_features = [f for f in selected_features if f in self.df.columns]
-        
-        self.X = self.df[available_features].copy()
-        self.y = self.df['koi_disposition'].copy()
+        self.X, self.y = self._select_columns(self.df)
         print(f"✓ Usando {self.X.shape[1]} features de Kepler.")
 
     def engineer_features(self):
         print("PASO 2 (Kepler): FEATURE ENGINEERING")
-        X_eng = self.X.copy()
-        if 'koi_prad' in self.X.columns and 'koi_srad' in self.X.columns:
-            X_eng['planet_star_ratio'] = X_eng['koi_prad'] / (X_eng['koi_srad'] * 109.1)
-        if 'koi_prad' in self.X.columns and 'koi_period' in self.X.columns:
-            X_eng['density_proxy'] = X_eng['koi_prad'] / (X_eng['koi_period'] ** (1/3))
-        # ... más features ...
-        self.X = X_eng
+        self.X = self._add_features(self.X)
         print("✓ Features de Kepler creadas.")
     
     def preprocess_data(self):
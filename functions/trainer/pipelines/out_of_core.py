@@ -0,0 +1,337 @@
+# pipelines/out_of_core.py
+
+import os
+import shutil
+import tempfile
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xgboost as xgb
+from sklearn.impute import SimpleImputer
+from sklearn.metrics import f1_score, classification_report
+from sklearn.preprocessing import StandardScaler, LabelEncoder
+
+from common.config import ModelConfig
+from common.clients import get_storage_client
+from common.memory_guard import MemoryGuard, run_with_memory_limit
+from .compact_model import attach_compact_model
+
+# Carpeta para los fragmentos Parquet y la caché de XGBoost. En Cloud Functions
+# /tmp vive en memoria: para datasets realmente grandes debe apuntar a un volumen.
+SPILL_DIR = os.environ.get("EXO_SPILL_DIR", os.path.join(tempfile.gettempdir(), "exo-spill"))
+LABEL_COLUMN = "__label__"
+TEST_COLUMN = "__test__"
+
+class SourceFile:
+    """Abre el CSV de entrada ('gs://bucket/objeto' o ruta local). Se puede enviar a un subproceso."""
+    def __init__(self, uri):
+        self.uri = uri
+
+    def __call__(self):
+        if self.uri.startswith("gs://"):
+            bucket_name, file_name = self.uri[len("gs://"):].split("/", 1)
+            return get_storage_client().bucket(bucket_name).blob(file_name).open("rb")
+        return open(self.uri, "rb")
+
+class StreamingMedian:
+    """
+    Mediana aproximada por columna en dos pasadas: un histograma entre el
+    mínimo y el máximo y otro dentro del bin que contiene la mediana. El error
+    es como mucho (max - min) / bins². Los NaN e infinitos no cuentan.
+    """
+    def __init__(self, n_columns, bins):
+        self.bins = bins
+        self.count = np.zeros(n_columns, dtype=np.int64)
+        self.low = np.full(n_columns, np.inf)
+        self.high = np.full(n_columns, -np.inf)
+        self._ranges = None
+
+    def observe(self, X):
+        """Primera pasada (junto a la lectura): cuenta y rango de cada columna."""
+        finite = np.isfinite(X)
+        self.count += finite.sum(axis=0)
+        self.low = np.minimum(self.low, np.where(finite, X, np.inf).min(axis=0, initial=np.inf))
+        self.high = np.maximum(self.high, np.where(finite, X, -np.inf).max(axis=0, initial=-np.inf))
+
+    def start_level(self):
+        """Prepara el siguiente histograma: el grueso la primera vez, el fino después."""
+        n_columns = len(self.count)
+        if self._ranges is None:
+            self._rank = (self.count - 1) / 2
+            self._below = np.zeros(n_columns, dtype=np.int64)
+            self._closed = np.ones(n_columns, dtype=bool)  # El último bin incluye su borde superior
+            self._ranges = np.stack([self.low, self.high], axis=1)
+        else:
+            self._zoom()
+        self._hist = np.zeros((n_columns, self.bins), dtype=np.int64)
+
+    def add(self, X):
+        for j in range(X.shape[1]):
+            lo, hi = self._ranges[j]
+            if self.count[j] == 0 or lo >= hi:
+                continue
+            column = X[:, j]
+            column = column[np.isfinite(column)]
+            self._below[j] += np.count_nonzero(column < lo)
+            inside = column[(column >= lo) & ((column <= hi) if self._closed[j] else (column < hi))]
+            self._hist[j] += np.histogram(inside, bins=self.bins, range=(lo, hi))[0]
+
+    def _target_bin(self, j):
+        cumulative = np.cumsum(self._hist[j])
+        target = self._rank[j] - self._below[j]
+        b = min(int(np.searchsorted(cumulative, target, side="right")), self.bins - 1)
+        before = cumulative[b - 1] if b > 0 else 0
+        return b, before, target
+
+    def _zoom(self):
+        for j in range(len(self.count)):
+            lo, hi = self._ranges[j]
+            if self.count[j] == 0 or lo >= hi:
+                continue
+            b, _, _ = self._target_bin(j)
+            width = (hi - lo) / self.bins
+            self._ranges[j] = (lo + b * width, lo + (b + 1) * width)
+            self._below[j] = 0  # add() vuelve a contar los valores por debajo del nuevo rango
+            self._closed[j] = self._closed[j] and b == self.bins - 1
+
+    def result(self):
+        medians = np.full(len(self.count), np.nan)
+        for j in range(len(self.count)):
+            lo, hi = self._ranges[j]
+            if self.count[j] == 0:
+                continue
+            if lo >= hi:
+                medians[j] = lo
+                continue
+            b, before, target = self._target_bin(j)
+            width = (hi - lo) / self.bins
+            in_bin = max(self._hist[j][b], 1)
+            fraction = min(max((target - before + 0.5) / in_bin, 0.0), 1.0)
+            medians[j] = min(max(lo + (b + fraction) * width, self.low[j]), self.high[j])
+        return medians
+
+class _ShardIterator(xgb.DataIter):
+    """Entrega a XGBoost los fragmentos de entrenamiento ya imputados y escalados, uno a uno."""
+    def __init__(self, pipeline, cache_prefix):
+        self._pipeline = pipeline
+        self._index = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        shards = self._pipeline.shards
+        while self._index < len(shards):
+            X, y = self._pipeline._load_shard(shards[self._index], test=False)
+            self._index += 1
+            if len(X):
+                input_data(data=X, label=y)
+                self._pipeline.guard.check("entrenamiento XGBoost")
+                return True
+        return False
+
+    def reset(self):
+        self._index = 0
+
+class OutOfCoreTrainingPipeline:
+    """
+    Entrenamiento para datasets que no caben en memoria. Nunca hay más de un
+    chunk del CSV en memoria:
+      1. Lee el CSV por chunks, aplica la selección y el feature engineering del
+         pipeline de la fuente y guarda cada chunk como fragmento Parquet
+         (columnar) con su etiqueta y su partición train/test.
+      2. Mediana aproximada de cada feature (StreamingMedian, dos pasadas).
+      3. StandardScaler.partial_fit sobre los fragmentos imputados.
+      4. XGBoost desde un iterador de memoria externa (ExtMemQuantileDMatrix).
+      5. Evaluación fragmento a fragmento sobre la partición de test.
+    Los artefactos son los mismos que los del pipeline en memoria, así que el
+    predictor no distingue entre ambos.
+    """
+    def __init__(self, open_source, feature_pipeline, job_id="local", guard=None, spill_dir=SPILL_DIR, compact_model=False):
+        self.open_source = open_source              # Devuelve un fichero binario con el CSV
+        self.feature_pipeline = feature_pipeline    # KeplerTrainingPipeline, K2TrainingPipeline, ...
+        self.compact_model = compact_model          # Construir también la variante compacta de servicio
+        self.config = ModelConfig()
+        self.guard = guard or MemoryGuard()
+        self.job_id = job_id
+        self.spill_dir = spill_dir
+        self.work_dir = os.path.join(spill_dir, f"{job_id}-{uuid.uuid4().hex[:8]}")
+        self.shards = []
+        self.feature_names = None
+        self.artifacts = {}
+        self.metadata = {}
+
+    def _write_shards(self):
+        print(f"PASO 1 (fuera de memoria): LECTURA EN CHUNKS DE {self.config.ooc_chunk_rows} FILAS")
+        os.makedirs(self.work_dir, exist_ok=True)
+        rng = np.random.default_rng(self.config.random_state)
+        class_counts = {}
+        with self.open_source() as source:
+            for index, chunk in enumerate(pd.read_csv(source, comment='#', chunksize=self.config.ooc_chunk_rows)):
+                X, y = self.feature_pipeline.prepare_chunk(chunk)
+                del chunk
+                labelled = y.notna().to_numpy()
+                X, y = X[labelled], y[labelled]
+                if self.feature_names is None:
+                    self.feature_names = X.columns.tolist()
+                    self._median = StreamingMedian(len(self.feature_names), self.config.ooc_median_bins)
+                X = X.reindex(columns=self.feature_names).astype("float64").replace([np.inf, -np.inf], np.nan)
+                self._median.observe(X.to_numpy())
+
+                X[LABEL_COLUMN] = y.to_numpy()
+                X[TEST_COLUMN] = rng.random(len(X)) < self.config.test_size
+                path = os.path.join(self.work_dir, f"part-{index:05d}.parquet")
+                pq.write_table(pa.Table.from_pandas(X, preserve_index=False), path)
+                self.shards.append(path)
+                for label, count in y.value_counts().items():
+                    class_counts[label] = class_counts.get(label, 0) + int(count)
+                self.guard.check(f"lectura del chunk {index}")
+
+        total_rows = sum(class_counts.values())
+        if total_rows < self.config.cv_splits:
+            raise ValueError(f"Datos insuficientes ({total_rows} filas) para continuar con el entrenamiento.")
+        self.metadata['rows_total'] = total_rows
+        self.metadata['chunks'] = len(self.shards)
+        print(f"✓ {total_rows} filas en {len(self.shards)} fragmentos, {len(self.feature_names)} features.")
+        return class_counts
+
+    def _read_features(self, path):
+        return pq.read_table(path, columns=self.feature_names).to_pandas()
+
+    def _load_shard(self, path, test):
+        """Features imputadas y escaladas (DataFrame) y etiquetas codificadas de una partición del fragmento."""
+        frame = pq.read_table(path).to_pandas()
+        frame = frame[frame[TEST_COLUMN] == test]
+        X = frame[self.feature_names]
+        X_imputed = pd.DataFrame(self.artifacts['imputer'].transform(X), columns=self.feature_names)
+        X_scaled = pd.DataFrame(self.artifacts['scaler'].transform(X_imputed), columns=self.feature_names)
+        y = self.artifacts['label_encoder'].transform(frame[LABEL_COLUMN])
+        return X_scaled, y
+
+    def _fit_preprocessing(self, class_counts):
+        print("PASO 2 (fuera de memoria): IMPUTACIÓN Y ESCALADO EN STREAMING")
+        le = LabelEncoder().fit(list(class_counts))
+
+        for level in range(2):
+            self._median.start_level()
+            for path in self.shards:
+                self._median.add(self._read_features(path).to_numpy())
+                self.guard.check(f"histograma de la mediana (nivel {level + 1})")
+        medians = self._median.result()
+
+        # Ajustar con una sola fila de medianas deja 'statistics_' igual a las
+        # medianas; las columnas sin ningún valor se conservan y se imputan a 0.
+        imputer = SimpleImputer(strategy=self.config.imputation_strategy, keep_empty_features=True)
+        imputer.fit(pd.DataFrame([medians], columns=self.feature_names))
+
+        scaler = StandardScaler()
+        for path in self.shards:
+            X_imputed = pd.DataFrame(imputer.transform(self._read_features(path)), columns=self.feature_names)
+            scaler.partial_fit(X_imputed)
+            self.guard.check("ajuste del scaler")
+
+        self.artifacts['label_encoder'] = le
+        self.artifacts['imputer'] = imputer
+        self.artifacts['scaler'] = scaler
+        self.artifacts['feature_names'] = list(self.feature_names)
+        print("✓ Preprocesamiento en streaming completo.")
+
+    def _train_and_evaluate(self):
+        print("PASO 3 (fuera de memoria): ENTRENANDO XGBOOST CON MEMORIA EXTERNA")
+        n_classes = len(self.artifacts['label_encoder'].classes_)
+        params = {
+            'objective': 'multi:softprob',
+            'num_class': n_classes,
+            'tree_method': 'hist',
+            'max_depth': self.config.xgb_max_depth,
+            'learning_rate': self.config.xgb_learning_rate,
+            'max_bin': self.config.ooc_max_bin,
+            'seed': self.config.random_state,
+            'eval_metric': 'mlogloss',
+        }
+        iterator = _ShardIterator(self, cache_prefix=os.path.join(self.work_dir, "xgb-cache"))
+        external_matrix = getattr(xgb, "ExtMemQuantileDMatrix", None)
+        if external_matrix is not None:
+            dtrain = external_matrix(iterator, max_bin=self.config.ooc_max_bin)
+        else:  # XGBoost < 3.0
+            dtrain = xgb.DMatrix(iterator)
+        booster = xgb.train(params, dtrain, num_boost_round=self.config.xgb_n_estimators)
+        del dtrain
+
+        # Mismo tipo de modelo que el pipeline en memoria (predict_proba en el predictor)
+        model = xgb.XGBClassifier()
+        model.load_model(bytearray(booster.save_raw("ubj")))
+
+        y_test, y_pred = [], []
+        for path in self.shards:
+            X, y = self._load_shard(path, test=True)
+            if len(X):
+                y_test.append(y)
+                y_pred.append(model.predict(X))
+            self.guard.check("evaluación")
+        y_test, y_pred = np.concatenate(y_test), np.concatenate(y_pred)
+
+        self.artifacts['model'] = model
+        self.metadata['f1_score'] = f1_score(y_test, y_pred, average='weighted')
+        self.metadata['classification_report'] = classification_report(y_test, y_pred, output_dict=True)
+        self.metadata['feature_importance'] = pd.DataFrame({
+            'Feature': self.feature_names,
+            'Importance': model.feature_importances_
+        }).sort_values('Importance', ascending=False).head(self.config.top_features_to_show).to_dict('records')
+        self.metadata['rows_test'] = int(len(y_test))
+        self.metadata['rows_train'] = self.metadata['rows_total'] - int(len(y_test))
+        print(f"✓ Entrenamiento completo. F1-Score: {self.metadata['f1_score']:.4f}")
+
+    def _sample_shards(self, test, max_rows):
+        """Hasta 'max_rows' filas preprocesadas de los fragmentos, repartidas entre todos ellos."""
+        per_shard = max(1, max_rows // max(1, len(self.shards)))
+        X_parts, y_parts = [], []
+        for path in self.shards:
+            X, y = self._load_shard(path, test=test)
+            X_parts.append(X.iloc[:per_shard])
+            y_parts.append(y[:per_shard])
+            self.guard.check("muestra para el modelo compacto")
+        return pd.concat(X_parts, ignore_index=True), np.concatenate(y_parts)
+
+    def _build_compact_model(self):
+        X_distill, _ = self._sample_shards(test=False, max_rows=self.config.compact_distill_rows)
+        X_eval, y_eval = self._sample_shards(test=True, max_rows=self.config.compact_distill_rows)
+        attach_compact_model(self.artifacts, self.metadata, self.artifacts['model'], X_distill, X_eval, y_eval, self.config)
+
+    def run(self):
+        """Ejecuta el pipeline completo. Devuelve (artifacts, metadata) como BaseTrainingPipeline."""
+        try:
+            with self.guard:
+                class_counts = self._write_shards()
+                self._fit_preprocessing(class_counts)
+                self._train_and_evaluate()
+                if self.compact_model:
+                    self._build_compact_model()
+        finally:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+        self.metadata['training_mode'] = 'out_of_core'
+        self.metadata['trained_algorithm'] = 'xgboost'
+        self.metadata['peak_rss_mb'] = round(self.guard.peak_mb, 1)
+        if self.guard.limit_mb:
+            self.metadata['memory_limit_mb'] = self.guard.limit_mb
+        return self.artifacts, self.metadata
+
+    def run_in_subprocess(self):
+        """
+        run() en un subproceso con un techo duro de guard.limit_mb (setrlimit en
+        ese proceso, ver common/memory_guard.py). 'open_source' y
+        'feature_pipeline' deben poder enviarse con pickle (SourceFile, no una lambda).
+        """
+        return run_with_memory_limit(
+            _run_pipeline,
+            (self.open_source, self.feature_pipeline, self.job_id, self.spill_dir, self.compact_model,
+             self.guard.limit_mb, self.guard.poll_seconds),
+            self.guard.limit_mb,
+        )
+
+def _run_pipeline(open_source, feature_pipeline, job_id, spill_dir, compact_model, limit_mb, poll_seconds):
+    guard = MemoryGuard(limit_mb=limit_mb, poll_seconds=poll_seconds)
+    pipeline = OutOfCoreTrainingPipeline(open_source, feature_pipeline, job_id=job_id, guard=guard,
+                                         spill_dir=spill_dir, compact_model=compact_model)
+    return pipeline.run()
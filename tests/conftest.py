@@ -0,0 +1,94 @@
+# tests/conftest.py
+#
+# Cada Cloud Function se despliega con su propia carpeta (main.py, common/,
+# módulos propios), así que todas tienen un 'main' y un paquete 'common'. El
+# fixture load_function carga los módulos de una función a la vez: retira de
+# sys.modules los que se cargaron de otra carpeta de functions/ y registra los
+# dobles en memoria de tools/fake_gcp.py en common/clients.py.
+#
+# Las variables de entorno se leen al importar los módulos: fíjalas con
+# monkeypatch.setenv antes de llamar a load_function.
+
+import importlib
+import os
+import sys
+
+import pytest
+from flask import Flask, request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FUNCTIONS_DIR = os.path.join(ROOT, "functions")
+sys.path[:0] = [os.path.join(ROOT, "tools"), os.path.join(ROOT, "tools", "loadtest")]
+
+import datasets  # noqa: E402
+import fake_gcp  # noqa: E402
+
+def _purge_function_modules():
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None) or ""
+        if path.startswith(FUNCTIONS_DIR + os.sep):
+            del sys.modules[name]
+        elif name == "common" or name.startswith("common."):
+            del sys.modules[name]
+
+@pytest.fixture
+def fakes():
+    return {
+        "firestore": fake_gcp.FakeFirestoreClient(),
+        "storage": fake_gcp.FakeStorageClient(),
+        "tasks": fake_gcp.FakeTasksClient(),
+    }
+
+@pytest.fixture
+def load_function(fakes, monkeypatch, tmp_path):
+    """load_function('crud_jobs') -> módulo main; load_function('predictor', 'microbatch') -> ese módulo."""
+    monkeypatch.setenv("EXO_BUNDLE_CACHE_DIR", str(tmp_path / "bundles"))
+    monkeypatch.setenv("EXO_PROFILE_DIR", str(tmp_path / "profiles"))
+    monkeypatch.delenv("EXO_CLIENT_BACKEND", raising=False)
+
+    def load(function_name, module="main"):
+        _purge_function_modules()
+        folder = os.path.join(FUNCTIONS_DIR, function_name)
+        sys.path[:] = [p for p in sys.path if not p.startswith(FUNCTIONS_DIR)]
+        sys.path.insert(0, folder)
+        loaded = importlib.import_module(module)
+        clients = importlib.import_module("common.clients")
+        clients.reset()
+        clients.install_backend(**fakes)
+        return loaded
+
+    yield load
+    _purge_function_modules()
+    sys.path[:] = [p for p in sys.path if not p.startswith(FUNCTIONS_DIR)]
+
+@pytest.fixture
+def call():
+    """call(handler, method=..., path=..., json=..., data=...) -> flask.Response."""
+    app = Flask("exo-tests")
+
+    def invoke(handler, **kwargs):
+        with app.test_request_context(**kwargs):
+            return app.make_response(handler(request))
+
+    return invoke
+
+@pytest.fixture
+def train_job(load_function, fakes, call):
+    """
+    Entrena un modelo con el trainer real sobre un CSV sintético de
+    tools/loadtest/datasets.py y devuelve la respuesta. El módulo main del
+    trainer queda cargado hasta la siguiente llamada a load_function;
+    prepare(trainer) permite parchearlo antes de entrenar.
+    """
+    def train(job_id="job-1", data_source="kepler", rows=600, algorithm="xgboost", prepare=None, **params):
+        trainer = load_function("trainer")
+        if prepare:
+            prepare(trainer)
+        blob_name = f"raw-uploads/{job_id}_{data_source}.csv"
+        fakes["storage"].bucket("uploads").blob(blob_name).upload_from_string(
+            datasets.csv_payload(data_source, rows, seed=1))
+        payload = {"job_id": job_id, "gcs_input_uri": f"gs://uploads/{blob_name}",
+                   "data_source": data_source, "algorithm": algorithm, **params}
+        return call(trainer.trainer_function, method="POST", json=payload)
+
+    return train
@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pytest
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+@pytest.fixture
+def bundles(load_function):
+    module = load_function("predictor", "common.artifact_bundle")
+    module.forget_bundles()
+    yield module
+    module.forget_bundles()
+
+def _artifacts(seed=0):
+    rng = np.random.default_rng(seed)
+    scaler = StandardScaler().fit(rng.normal(size=(50, 3)))
+    encoder = LabelEncoder().fit(["CANDIDATE", "CONFIRMED", "FALSE POSITIVE"])
+    return {"scaler": scaler, "label_encoder": encoder, "feature_names": ["a", "b", "c"]}
+
+def _write(bundles, fakes, job_id, seed=0):
+    bucket = fakes["storage"].bucket("models")
+    uri, manifest = bundles.write_bundle(bucket, f"models/{job_id}/bundle", _artifacts(seed))
+    return uri, manifest
+
+def _cached_dirs(bundles):
+    return sorted(os.listdir(bundles.CACHE_DIR)) if os.path.isdir(bundles.CACHE_DIR) else []
+
+def test_round_trip_loads_components_lazily(bundles, fakes):
+    uri, manifest = _write(bundles, fakes, "job-1")
+    bundle = bundles.load_artifacts(uri, fakes["storage"])
+    assert bundle["feature_names"] == ["a", "b", "c"] and bundle.classes[0] == "CANDIDATE"
+    assert not bundle.is_loaded("scaler")
+    np.testing.assert_array_equal(bundle["scaler"].mean_, _artifacts()["scaler"].mean_)
+    assert bundle.is_loaded("scaler") and not bundle.is_loaded("label_encoder")
+    assert "model" not in bundle and bundle.get("model") is None
+    assert bundles.load_artifacts(uri, fakes["storage"]) is bundle
+    assert _cached_dirs(bundles) == [manifest["bundle_id"]]
+
+def test_corrupted_component_is_rejected(bundles, fakes):
+    uri, _ = _write(bundles, fakes, "job-1")
+    fakes["storage"].bucket("models").blob("models/job-1/bundle/scaler.pkl.zst").upload_from_string(b"basura")
+    with pytest.raises(IOError):
+        bundles.load_artifacts(uri, fakes["storage"])["scaler"]
+
+def test_evicted_and_forgotten_bundles_remove_their_files(bundles, fakes, monkeypatch):
+    monkeypatch.setattr(bundles, "MAX_OPEN_BUNDLES", 1)
+    first_uri, first = _write(bundles, fakes, "job-1")
+    second_uri, second = _write(bundles, fakes, "job-2", seed=1)
+    bundles.load_artifacts(first_uri, fakes["storage"])["scaler"]
+    bundles.load_artifacts(second_uri, fakes["storage"])["scaler"]
+    assert _cached_dirs(bundles) == [second["bundle_id"]]
+    bundles.forget_bundles()
+    assert _cached_dirs(bundles) == []
+
+def test_cache_dir_is_capped_by_bytes(bundles, fakes, monkeypatch):
+    uris = [_write(bundles, fakes, f"job-{i}", seed=i) for i in range(3)]
+    bundle = bundles.load_artifacts(uris[0][0], fakes["storage"])
+    bundle["scaler"]
+    one_bundle = bundles._dir_size(bundles.CACHE_DIR)
+    os.utime(os.path.join(bundles.CACHE_DIR, uris[0][1]["bundle_id"]), (1, 1))
+    monkeypatch.setattr(bundles, "MAX_CACHE_BYTES", one_bundle + 1)
+    for uri, _ in uris[1:]:
+        bundles.load_artifacts(uri, fakes["storage"])["scaler"]
+    assert _cached_dirs(bundles) == [uris[2][1]["bundle_id"]]
+    # Lo ya cargado sigue en memoria y lo borrado se vuelve a descargar al pedirlo
+    assert bundle.is_loaded("scaler") and list(bundle["label_encoder"].classes_)[0] == "CANDIDATE"
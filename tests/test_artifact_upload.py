@@ -0,0 +1,68 @@
+import io
+
+import pytest
+
+def test_small_upload_sends_crc32c(load_function, fakes):
+    gcp_utils = load_function("trainer", "common.gcp_utils")
+    calls = []
+    blob = fakes["storage"].bucket("models").blob("a.bin")
+    original = blob.upload_from_string
+    blob.upload_from_string = lambda data, **kwargs: calls.append(kwargs) or original(data, **kwargs)
+    gcp_utils.upload_bytes(blob, b"x" * 100)
+    assert calls[0]["checksum"] == "crc32c"
+    assert blob.download_as_bytes() == b"x" * 100
+
+@pytest.mark.parametrize("corrupt", [False, True])
+def test_parallel_upload_verifies_the_final_crc32c(load_function, fakes, monkeypatch, corrupt):
+    gcp_utils = load_function("trainer", "common.gcp_utils")
+    monkeypatch.setattr(gcp_utils, "PARALLEL_UPLOAD_THRESHOLD", 10)
+
+    def fake_upload_chunks(filename, blob, **kwargs):
+        with open(filename, "rb") as f:
+            data = f.read()
+        blob.upload_from_string(data)
+        blob.crc32c = gcp_utils._crc32c_base64(data + (b"!" if corrupt else b""))
+
+    monkeypatch.setattr(gcp_utils.transfer_manager, "upload_chunks_concurrently", fake_upload_chunks)
+    blob = fakes["storage"].bucket("models").blob("big.bin")
+    if corrupt:
+        with pytest.raises(IOError):
+            gcp_utils.upload_bytes(blob, b"y" * 100)
+    else:
+        gcp_utils.upload_bytes(blob, b"y" * 100)
+        assert blob.download_as_bytes() == b"y" * 100
+
+def _job(fakes, job_id):
+    return fakes["firestore"].collection("exo_scout_models").document(job_id).get().to_dict()
+
+def test_completed_job_points_at_an_uploaded_bundle(train_job, fakes):
+    response = train_job("ok-job")
+    assert response.status_code == 200
+    job = _job(fakes, "ok-job")
+    assert job["status"] == "completed"
+    manifest_uri = job["results"]["gcs_artifacts_path"]
+    bucket_name, blob_name = manifest_uri[5:].split("/", 1)
+    assert fakes["storage"].bucket(bucket_name).blob(blob_name).exists()
+    assert job["results"]["artifact_size_bytes"] < job["results"]["artifact_raw_size_bytes"]
+
+def test_failed_upload_clears_the_artifacts_path(train_job, fakes, monkeypatch):
+    def failing_upload(*args, **kwargs):
+        raise IOError("subida interrumpida")
+
+    response = train_job("bad", prepare=lambda trainer: monkeypatch.setattr(
+        trainer.gcp_utils, "save_artifacts_to_gcs", failing_upload))
+    assert response.status_code == 500
+    job = _job(fakes, "bad")
+    assert job["status"] == "error"
+    assert "gcs_artifacts_path" not in job.get("results", {})
+
+@pytest.mark.parametrize("status", ["training", "uploading_artifacts", "error"])
+def test_predictor_refuses_jobs_that_are_not_completed(load_function, fakes, call, status):
+    fakes["firestore"].collection("exo_scout_models").document("pending").set({
+        "status": status, "params": {"data_source": "kepler"},
+        "results": {"gcs_artifacts_path": "gs://models/models/pending/bundle/manifest.json"}})
+    predictor = load_function("predictor")
+    response = call(predictor.predictor_function, method="POST",
+                    data={"job_id": "pending", "file": (io.BytesIO(b"koi_score\n0.5\n"), "a.csv")})
+    assert response.status_code == 409
+    assert status in response.get_json()["error"]
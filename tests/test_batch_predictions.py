@@ -0,0 +1,175 @@
+import io
+import threading
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import datasets
+
+RANGE_BYTES = 2048
+INVOKER = "batch@proyecto.iam.gserviceaccount.com"
+ADMIN = {"X-Exo-Admin-Token": "secreto"}
+OUTPUT_BUCKET = "exoplanets-nasa-models"
+
+@pytest.fixture
+def batch_env(monkeypatch):
+    monkeypatch.setenv("GCP_PROJECT", "exo-local")
+    monkeypatch.setenv("PREDICTOR_FUNCTION_URL", "https://predictor.test")
+    monkeypatch.setenv("EXO_BATCH_RANGE_BYTES", str(RANGE_BYTES))
+    monkeypatch.setenv("BATCH_INPUT_BUCKETS", "inputs")
+    monkeypatch.setenv("BATCH_INVOKER_SERVICE_ACCOUNT", INVOKER)
+    monkeypatch.setenv("EXO_ADMIN_TOKEN", "secreto")
+
+def _upload(fakes, name, payload):
+    fakes["storage"].bucket("inputs").blob(name).upload_from_string(payload)
+    return f"gs://inputs/{name}"
+
+def test_ranges_cover_the_data_on_line_boundaries(batch_env, load_function, fakes):
+    batch_predictions = load_function("predictor", "batch_predictions")
+    payload = datasets.csv_payload("kepler", 120, seed=4, labels=False)
+    _upload(fakes, "koi.csv", payload)
+    header, ranges = batch_predictions.plan_ranges(fakes["storage"].bucket("inputs").blob("koi.csv"))
+    assert not header.startswith("#") and header.endswith("\n") and "kepoi_name" in header
+    data_start = payload.index(header.encode()) + len(header)
+    assert len(ranges) > 3 and ranges[0]["start"] == data_start and ranges[-1]["end"] == len(payload)
+    for previous, current in zip(ranges, ranges[1:]):
+        assert previous["end"] == current["start"] and payload[current["start"] - 1:current["start"]] == b"\n"
+
+@pytest.fixture
+def predictor(batch_env, train_job, load_function):
+    assert train_job("job-1").status_code == 200
+    return load_function("predictor")
+
+def _post(call, predictor, path, json=None, headers=None):
+    return call(predictor.predictor_function, method="POST", path=path, json=json, headers=headers)
+
+def _run(call, predictor, batch_id):
+    return _post(call, predictor, f"/batch/{batch_id}/run", headers=ADMIN)
+
+def _read_output(fakes, prefix):
+    bucket = fakes["storage"].bucket(OUTPUT_BUCKET)
+    parts = sorted(b.name for b in bucket.list_blobs(prefix=f"{prefix}/part-"))
+    return pd.concat([pq.read_table(io.BytesIO(bucket.blob(name).download_as_bytes())).to_pandas() for name in parts],
+                     ignore_index=True)
+
+def test_batch_output_matches_the_synchronous_predictor(predictor, fakes, call):
+    payload = datasets.csv_payload("kepler", 60, seed=5, labels=False)
+    input_uri = _upload(fakes, "runs/koi.csv", payload)
+    created = _post(call, predictor, "/batch", {"input_uri": input_uri, "alias": "kepler:best"})
+    assert created.status_code == 202 and created.get_json()["job_id"] == "job-1"
+    batch_id = created.get_json()["batch_id"]
+    task = fakes["tasks"].tasks[-1].task["http_request"]
+    assert task["url"] == f"https://predictor.test/batch/{batch_id}/run"
+    assert task["oidc_token"] == {"service_account_email": INVOKER, "audience": task["url"]}
+    assert created.get_json()["output_uri"] == f"gs://{OUTPUT_BUCKET}/batch-predictions/{batch_id}/"
+
+    done = _run(call, predictor, batch_id)
+    assert done.status_code == 200
+    status = call(predictor.predictor_function, method="GET", path=f"/batch/{batch_id}").get_json()
+    assert status["status"] == "completed" and status["rows_scored"] == 60 and status["progress"] == 1.0
+
+    output = _read_output(fakes, f"batch-predictions/{batch_id}")
+    sync = call(predictor.predictor_function, method="POST",
+                data={"job_id": "job-1", "file": (io.BytesIO(payload), "koi.csv")}).get_json()["predictions"]
+    assert list(output["kepoi_name"]) == list(pd.read_csv(io.BytesIO(payload), comment="#")["kepoi_name"])
+    for row, expected in zip(output.to_dict("records"), sync):
+        assert {name: pytest.approx(row[f"prob_{name}"], abs=1e-4) for name in expected} == expected
+    assert fakes["storage"].bucket(OUTPUT_BUCKET).blob(f"batch-predictions/{batch_id}/_manifest.json").exists()
+    # Nada se escribe junto a la entrada
+    assert [blob.name for blob in fakes["storage"].bucket("inputs").list_blobs(prefix="")] == ["runs/koi.csv"]
+
+def test_failed_and_unfinished_runs_resume_only_pending_ranges(predictor, fakes, call, monkeypatch):
+    batch_predictions = predictor.batch_predictions
+    input_uri = _upload(fakes, "koi.csv", datasets.csv_payload("kepler", 60, seed=6, labels=False))
+    batch_id = _post(call, predictor, "/batch", {"input_uri": input_uri, "job_id": "job-1"}).get_json()["batch_id"]
+
+    # Sin presupuesto de tiempo no se empieza ningún rango y se encola una continuación
+    budget = batch_predictions.TIME_BUDGET_SECONDS
+    monkeypatch.setattr(batch_predictions, "TIME_BUDGET_SECONDS", -1)
+    queued = len(fakes["tasks"].tasks)
+    unfinished = _run(call, predictor, batch_id)
+    assert unfinished.status_code == 202 and unfinished.get_json()["ranges_done"] == 0
+    assert len(fakes["tasks"].tasks) == queued + 1
+    monkeypatch.setattr(batch_predictions, "TIME_BUDGET_SECONDS", budget)
+
+    uploaded = []
+    original_upload = batch_predictions._upload_parquet
+
+    def flaky_upload(blob, table):
+        if blob.name.endswith("part-00001.parquet") and not uploaded.count("fail"):
+            uploaded.append("fail")
+            raise IOError("GCS no disponible")
+        uploaded.append(blob.name)
+        original_upload(blob, table)
+
+    monkeypatch.setattr(batch_predictions, "_upload_parquet", flaky_upload)
+    assert _run(call, predictor, batch_id).status_code == 500
+    doc = fakes["firestore"].collection("exo_scout_batch_predictions").document(batch_id).get().to_dict()
+    assert doc["status"] == "retrying" and 1 not in doc["completed_ranges"]
+    ranges_total = len(doc["ranges"])
+
+    first_run = len(uploaded)
+    assert _run(call, predictor, batch_id).status_code == 200
+    assert uploaded[first_run:] == [f"batch-predictions/{batch_id}/part-00001.parquet"]
+    assert len(_read_output(fakes, f"batch-predictions/{batch_id}")) == 60 and ranges_total > 2
+
+def test_overlapping_runs_score_each_range_once(predictor, fakes, call, monkeypatch):
+    batch_predictions = predictor.batch_predictions
+    input_uri = _upload(fakes, "koi.csv", datasets.csv_payload("kepler", 60, seed=7, labels=False))
+    batch_id = _post(call, predictor, "/batch", {"input_uri": input_uri, "job_id": "job-1"}).get_json()["batch_id"]
+
+    # La primera ejecución se queda dentro del primer rango hasta que llega la segunda
+    second_done = threading.Event()
+    original_upload = batch_predictions._upload_parquet
+
+    def slow_upload(blob, table):
+        second_done.wait(timeout=5)
+        original_upload(blob, table)
+
+    monkeypatch.setattr(batch_predictions, "_upload_parquet", slow_upload)
+    first = {}
+    runner = threading.Thread(target=lambda: first.update(response=_run(call, predictor, batch_id)))
+    runner.start()
+    doc_ref = fakes["firestore"].collection("exo_scout_batch_predictions").document(batch_id)
+    while not doc_ref.get().to_dict().get("lease_until"):
+        threading.Event().wait(0.01)
+    # Entrega duplicada de la tarea: el lease la rechaza para que Cloud Tasks la reintente
+    assert _run(call, predictor, batch_id).status_code == 409
+    second_done.set()
+    runner.join()
+    assert first["response"].status_code == 200
+
+    # Con el lease caducado, dos ejecuciones solapadas sobre los mismos rangos no cuentan filas de más
+    doc_ref.update({"status": "running", "completed_ranges": [], "rows_scored": 0})
+    monkeypatch.setattr(batch_predictions, "_upload_parquet", original_upload)
+    monkeypatch.setattr(batch_predictions, "LEASE_SECONDS", -1)
+    runs = [threading.Thread(target=_run, args=(call, predictor, batch_id)) for _ in range(2)]
+    for run in runs:
+        run.start()
+    for run in runs:
+        run.join()
+    doc = doc_ref.get().to_dict()
+    assert doc["status"] == "completed" and doc["rows_scored"] == 60
+    assert sorted(doc["completed_ranges"]) == list(range(len(doc["ranges"])))
+    assert len(_read_output(fakes, f"batch-predictions/{batch_id}")) == 60
+
+def test_batch_routes_validate_their_input(predictor, call):
+    assert _post(call, predictor, "/batch", {"input_uri": "s3://x/y.csv", "job_id": "job-1"}).status_code == 400
+    # Solo se aceptan entradas de los buckets permitidos
+    assert _post(call, predictor, "/batch", {"input_uri": "gs://otro-proyecto/x.csv", "job_id": "job-1"}).status_code == 400
+    assert _post(call, predictor, "/batch", {"input_uri": "gs://inputs/x.csv", "job_id": "missing"}).status_code == 404
+    assert call(predictor.predictor_function, method="GET", path="/batch/unknown").status_code == 404
+    assert _run(call, predictor, "unknown").status_code == 404
+
+def test_run_route_requires_maintenance_credentials(predictor, fakes, call, monkeypatch):
+    input_uri = _upload(fakes, "koi.csv", datasets.csv_payload("kepler", 20, seed=8, labels=False))
+    batch_id = _post(call, predictor, "/batch", {"input_uri": input_uri, "job_id": "job-1"}).get_json()["batch_id"]
+    assert _post(call, predictor, f"/batch/{batch_id}/run").status_code == 401
+    assert _post(call, predictor, f"/batch/{batch_id}/run", headers={"X-Exo-Admin-Token": "otro"}).status_code == 403
+    assert call(predictor.predictor_function, method="GET", path=f"/batch/{batch_id}").get_json()["status"] == "queued"
+
+    monkeypatch.setattr(predictor.maintenance_auth, "MAINTENANCE_INVOKERS", {INVOKER})
+    monkeypatch.setattr(predictor.maintenance_auth, "_verify_oidc_token",
+                        lambda token, audience: {"email": INVOKER, "email_verified": True})
+    assert _post(call, predictor, f"/batch/{batch_id}/run", headers={"Authorization": "Bearer tarea"}).status_code == 200
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+@pytest.fixture
+def save_api(load_function):
+    return load_function("save_exoplanets")
+
+def _docs(fakes, collection="exoplanetas"):
+    return {ref.id: ref.get().to_dict() for ref in fakes["firestore"].collection(collection).list_documents()}
+
+@pytest.mark.parametrize("raw, expected", [
+    ("42", 42), ("-3", -3), ("0", 0), ("1.5", 1.5), ("0.25", 0.25), ("1e3", 1000.0), ("-0.5", -0.5),
+    ("007", "007"), ("00123.5", "00123.5"), ("-012", "-012"), ("1_000", "1_000"), ("+5", "+5"),
+    ("Kepler-22 b", "Kepler-22 b"), ("  ", None), ("", None), (None, None),
+])
+def test_parse_csv_value_only_converts_lossless_numbers(save_api, raw, expected):
+    assert save_api._parse_csv_value(raw) == expected
+
+def test_csv_bulk_upload_keeps_leading_zero_ids(save_api, fakes, call):
+    body = "# comentario del archivo\nkepid,koi_period,tic\n00757450,9.48,0012\n10797460,54.4,13\n"
+    response = call(save_api.save_exoplanet, method="POST", path="/?id_field=kepid", data=body, content_type="text/csv")
+    assert response.status_code == 201
+    docs = _docs(fakes)
+    assert set(docs) == {"00757450", "10797460"}
+    assert docs["00757450"]["kepid"] == "00757450" and docs["00757450"]["tic"] == "0012"
+    assert docs["10797460"]["kepid"] == 10797460 and docs["10797460"]["koi_period"] == 54.4
+    assert "updated_at" in docs["00757450"]
+
+def test_ndjson_bulk_upload_reports_row_errors(save_api, fakes, call):
+    body = '{"pl_name": "a", "pl_rade": 1.0}\n{no es json}\n\n[1, 2]\n{"pl_name": "b"}\n'
+    response = call(save_api.save_exoplanet, method="POST", path="/", data=body, content_type="application/x-ndjson")
+    summary = response.get_json()
+    assert response.status_code == 207
+    assert summary["written"] == 2 and summary["received"] == 4
+    assert [error["row"] for error in summary["errors"]] == [2, 4]
+    assert len(_docs(fakes)) == 2
+
+def test_json_array_is_written_in_concurrent_batches(save_api, fakes, call, monkeypatch):
+    monkeypatch.setattr(save_api, "DOCS_PER_BATCH", 3)
+    records = [{"pl_name": f"p{i}", "pl_rade": i} for i in range(10)]
+    response = call(save_api.save_exoplanet, method="POST", path="/?id_field=pl_name", json=records)
+    summary = response.get_json()
+    assert response.status_code == 201
+    assert summary["batches"] == 4 and summary["written"] == 10
+    assert len(_docs(fakes)) == 10
+
+def test_deterministic_ids_make_reingest_idempotent(save_api, fakes, call):
+    records = [{"pl_name": "x", "pl_rade": 1}, {"pl_name": "y", "pl_rade": 2}, {"pl_name": "x", "pl_rade": 3}]
+    summary = call(save_api.save_exoplanet, method="POST", path="/?id_field=pl_name", json=records).get_json()
+    assert summary["written"] == 2 and summary["duplicates"] == 1
+    assert _docs(fakes)["x"]["pl_rade"] == 3
+
+    call(save_api.save_exoplanet, method="POST", path="/?idempotent=true", json=records[:2])
+    call(save_api.save_exoplanet, method="POST", path="/?idempotent=true", json=records[:2])
+    assert len(_docs(fakes)) == 4
+
+def test_missing_or_invalid_id_field_fails_the_row(save_api, call):
+    records = [{"pl_name": "a/b"}, {"other": 1}, {"pl_name": "__x__"}]
+    response = call(save_api.save_exoplanet, method="POST", path="/?id_field=pl_name", json=records)
+    assert response.status_code == 400
+    assert response.get_json()["failed"] == 3
+
+def test_single_object_still_creates_one_document(save_api, fakes, call):
+    response = call(save_api.save_exoplanet, method="POST", path="/", data=json.dumps({"pl_name": "solo"}),
+                    content_type="application/json")
+    assert response.status_code == 201
+    assert _docs(fakes)[response.get_json()["id"]]["pl_name"] == "solo"
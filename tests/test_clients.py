@@ -0,0 +1,70 @@
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+@pytest.fixture
+def clients(load_function):
+    module = load_function("crud_jobs", "common.clients")
+    module.reset()
+    yield module
+    module.reset()
+
+def test_client_is_created_once_and_shared(clients):
+    created = []
+    clients.install_backend(firestore=lambda: created.append(object()) or created[-1])
+    first = clients.get_firestore_client()
+    assert clients.get_firestore_client() is first
+    assert len(created) == 1
+    assert "firestore" in clients.setup_stats()
+
+def test_concurrent_first_use_creates_a_single_client(clients):
+    created = []
+
+    def slow_factory():
+        time.sleep(0.05)
+        created.append(object())
+        return created[-1]
+
+    clients.install_backend(storage=slow_factory)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(clients.get_storage_client())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1 and all(client is created[0] for client in results)
+
+def test_install_backend_accepts_objects_and_replaces_existing_clients(clients):
+    first, second = object(), object()
+    clients.install_backend(tasks=first)
+    assert clients.get_tasks_client() is first
+    clients.install_backend(tasks=second)
+    assert clients.get_tasks_client() is second
+    with pytest.raises(ValueError):
+        clients.install_backend(bigquery=object())
+
+def test_backend_from_environment(clients, monkeypatch):
+    fake = object()
+    backend = types.ModuleType("exo_test_backend")
+    backend.install = lambda registry: registry.install_backend(firestore=fake)
+    monkeypatch.setitem(sys.modules, "exo_test_backend", backend)
+    monkeypatch.setenv(clients.BACKEND_ENV_VAR, "exo_test_backend:install")
+    assert clients.get_firestore_client() is fake
+
+def test_shared_modules_are_identical_across_functions():
+    import filecmp
+    import os
+    from conftest import FUNCTIONS_DIR
+
+    shared = {}
+    for function_name in sorted(os.listdir(FUNCTIONS_DIR)):
+        common_dir = os.path.join(FUNCTIONS_DIR, function_name, "common")
+        for filename in os.listdir(common_dir) if os.path.isdir(common_dir) else []:
+            if filename.endswith(".py"):
+                shared.setdefault(filename, []).append(os.path.join(common_dir, filename))
+    for filename, paths in shared.items():
+        for path in paths[1:]:
+            assert filecmp.cmp(paths[0], path, shallow=False), f"{path} difiere de {paths[0]}"
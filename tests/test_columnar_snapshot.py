@@ -0,0 +1,103 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+@pytest.fixture
+def snapshot_module(load_function):
+    return load_function("get_exoplanets", "columnar_snapshot")
+
+def _random_docs(n=300, seed=3):
+    rng = np.random.default_rng(seed)
+    docs = {}
+    for i in range(n):
+        doc = {"pl_name": f"p{i}", "pl_rade": float(rng.lognormal(0.5, 0.8)), "pl_orbper": float(rng.lognormal(2, 1.5))}
+        if rng.random() < 0.1:
+            doc.pop("pl_rade")
+        if rng.random() < 0.05:
+            doc["pl_orbper"] = "desconocido"
+        docs[f"d{i}"] = doc
+    return docs
+
+def _brute_force(docs, ranges, sort_field, descending, limit):
+    def numeric(doc, field):
+        value = doc.get(field)
+        return value if isinstance(value, (int, float)) and not isinstance(value, bool) else math.nan
+
+    selected = []
+    for position, doc in enumerate(docs.values()):
+        ok = True
+        for field, (low, high) in ranges.items():
+            value = numeric(doc, field)
+            ok &= not math.isnan(value) and (low is None or value >= low) and (high is None or value <= high)
+        if ok:
+            selected.append(position)
+    if sort_field:
+        docs_list = list(docs.values())
+        selected = [p for p in selected if not math.isnan(numeric(docs_list[p], sort_field))]
+        selected.sort(key=lambda p: numeric(docs_list[p], sort_field), reverse=descending)
+    return selected[:limit] if limit else selected
+
+@pytest.mark.parametrize("ranges, sort_field, descending, limit", [
+    ({"pl_rade": (0.8, 1.5)}, None, False, None),
+    ({"pl_rade": (None, 2.0), "pl_orbper": (5.0, None)}, "pl_orbper", True, 10),
+    ({}, "pl_rade", False, 25),
+    ({"pl_orbper": (1.0, 50.0)}, "pl_rade", True, 1000),
+    ({"pl_rade": (100.0, 200.0)}, "pl_rade", False, 5),
+])
+def test_query_matches_brute_force(snapshot_module, ranges, sort_field, descending, limit):
+    docs = _random_docs()
+    view = snapshot_module.SnapshotView(docs)
+    positions = view.query(ranges, sort_field=sort_field, descending=descending, limit=limit)
+    expected = _brute_force(docs, ranges, sort_field, descending, limit)
+    if sort_field:
+        # Con empates el orden puede variar: se comparan los valores de la clave
+        column = view.columns[sort_field]
+        assert list(column[positions]) == [column[p] for p in expected]
+    else:
+        assert list(positions) == expected
+
+def test_unknown_or_non_numeric_field_raises_key_error(snapshot_module):
+    view = snapshot_module.SnapshotView({"a": {"pl_name": "x", "pl_rade": 1.0}})
+    with pytest.raises(KeyError):
+        view.query({"pl_name": (0, 1)})
+
+def test_parse_query_args(snapshot_module):
+    ranges, sort_field, descending, limit = snapshot_module.parse_query_args(
+        {"pl_rade_min": "0.5", "pl_rade_max": "2", "sort": "pl_orbper", "order": "desc", "limit": "99999"})
+    assert ranges == {"pl_rade": (0.5, 2.0)} and sort_field == "pl_orbper" and descending and limit == 5000
+    for bad in ({"pl_rade_min": "x"}, {"order": "up"}, {"limit": "ten"}):
+        with pytest.raises(ValueError):
+            snapshot_module.parse_query_args(bad)
+
+def test_incremental_refresh_picks_up_new_and_changed_docs(snapshot_module, fakes, monkeypatch):
+    collection = fakes["firestore"].collection("exoplanetas")
+    base = datetime.now(timezone.utc) - timedelta(minutes=5)
+    collection.document("a").set({"pl_rade": 1.0, "updated_at": base})
+    snapshot = snapshot_module.ColumnarSnapshot(refresh_seconds=0, full_reload_seconds=3600)
+    assert len(snapshot.view(collection)) == 1
+
+    collection.document("b").set({"pl_rade": 2.0, "updated_at": base + timedelta(minutes=1)})
+    collection.document("a").set({"pl_rade": 3.0, "updated_at": base + timedelta(minutes=2)})
+    view = snapshot.view(collection)
+    assert sorted(view.ids) == ["a", "b"]
+    assert view.docs[view.ids.index("a")]["pl_rade"] == 3.0
+
+    # Los borrados solo se recogen en la recarga completa
+    collection.document("b").delete()
+    assert len(snapshot.view(collection)) == 2
+    snapshot.full_reload_seconds = 0
+    assert snapshot.view(collection).ids == ["a"]
+
+def test_query_route(load_function, fakes, call):
+    main = load_function("get_exoplanets")
+    collection = fakes["firestore"].collection("exoplanetas")
+    for i, radius in enumerate([0.5, 1.0, 1.4, 2.5]):
+        collection.document(f"p{i}").set({"pl_rade": radius, "updated_at": datetime.now(timezone.utc)})
+    body = call(main.get_exoplanets, method="GET",
+                path="/get-exoplanets/_query?pl_rade_min=0.9&sort=pl_rade&order=desc&limit=2").get_json()
+    assert [doc["id"] for doc in body["results"]] == ["p3", "p2"]
+    assert body["snapshot_size"] == 4
+    bad = call(main.get_exoplanets, method="GET", path="/get-exoplanets/_query?missing_min=1")
+    assert bad.status_code == 400
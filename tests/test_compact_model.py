@@ -0,0 +1,73 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import datasets
+
+@pytest.fixture
+def compact(load_function):
+    return load_function("trainer", "pipelines.compact_model")
+
+@pytest.fixture
+def config(load_function):
+    config = load_function("trainer", "common.config").ModelConfig()
+    config.compact_latency_samples = 5
+    config.compact_latency_ms = 1000.0
+    return config
+
+def _data(n=600, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n, 4)), columns=list("abcd"))
+    y = (X["a"] + 0.5 * X["b"] + rng.normal(scale=0.7, size=n) > 0).astype(int).to_numpy()
+    return X, y
+
+def test_selection_and_report_rows_are_disjoint(compact):
+    X, y = _data(101)
+    (X_select, y_select), (X_report, y_report) = compact._split_selection(X, y, random_state=42)
+    assert len(X_select) == 50 and len(X_report) == 51
+    assert set(X_select.index).isdisjoint(X_report.index)
+    assert set(X_select.index) | set(X_report.index) == set(X.index)
+    again, _ = compact._split_selection(X, y, random_state=42)
+    assert list(again[0].index) == list(X_select.index)
+
+def test_published_fidelity_comes_from_the_held_out_half(compact, config):
+    X, y = _data()
+    teacher = RandomForestClassifier(n_estimators=30, random_state=0).fit(X.iloc[:300], y[:300])
+    X_eval, y_eval = X.iloc[300:], y[300:]
+    model, report = compact.build_compact_model(teacher, X.iloc[:300], X_eval, y_eval, config)
+    assert model is not None
+    assert report["selection_rows"] + report["eval_rows"] == len(X_eval)
+
+    (X_select, _), (X_report, y_report) = compact._split_selection(X_eval, y_eval, config.random_state)
+    held_out = model.predict_proba(X_report.to_numpy(dtype=np.float32)).argmax(axis=1)
+    selection = model.predict_proba(X_select.to_numpy(dtype=np.float32)).argmax(axis=1)
+    assert report["selected"]["agreement"] == round(float(np.mean(held_out == teacher.predict(X_report))), 4)
+    assert report["selected"]["selection_agreement"] == round(float(np.mean(selection == teacher.predict(X_select))), 4)
+    assert report["status"] == ("ok" if report["selected"]["agreement"] >= config.compact_min_agreement else "low_fidelity")
+
+def test_too_few_evaluation_rows_leave_only_the_full_model(compact, config):
+    X, y = _data(60)
+    teacher = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    artifacts, metadata = {"model": teacher}, {}
+    compact.attach_compact_model(artifacts, metadata, teacher, X, X.iloc[:1], y[:1], config)
+    assert "compact_model" not in artifacts and metadata["compact_model"]["status"] == "error"
+
+def test_compact_model_is_opt_in(train_job, fakes):
+    train_job("plain")
+    train_job("with-fast", compact_model=True)
+    jobs = fakes["firestore"].collection("exo_scout_models")
+    assert "compact_model_agreement" not in jobs.document("plain").get().to_dict()["results"]
+    assert 0 <= jobs.document("with-fast").get().to_dict()["results"]["compact_model_agreement"] <= 1
+
+def test_fast_variant_serves_plain_floats(train_job, load_function, call):
+    train_job("with-fast", compact_model=True)
+    predictor = load_function("predictor")
+    response = call(predictor.predictor_function, method="POST", data={
+        "job_id": "with-fast", "variant": "fast",
+        "file": (io.BytesIO(datasets.csv_payload("kepler", 5, seed=9, labels=False)), "koi.csv")})
+    body = response.get_json()
+    assert response.status_code == 200 and body["variant"] == "fast"
+    assert all(abs(sum(row.values()) - 1) < 1e-3 for row in body["predictions"])
@@ -0,0 +1,133 @@
+import pytest
+
+RECORDS = [
+    {"pl_name": "a", "disposition": "CONFIRMED", "mission": "Kepler", "pl_rade": 1.1, "pl_orbper": 12.0},
+    {"pl_name": "b", "disposition": "CANDIDATE", "kepid": 42, "pl_rade": 2.5},
+    {"pl_name": "c", "disposition": "CONFIRMED", "tid": 7, "pl_orbper": 0.5},
+]
+
+@pytest.fixture
+def stats(load_function):
+    return load_function("save_exoplanets", "common.exoplanet_stats")
+
+def _stats_docs(fakes):
+    return {doc.id: doc.to_dict() for doc in fakes["firestore"].collection("exoplanetas_stats").stream()}
+
+def test_delta_of_a_replacement_moves_the_document_between_counters(stats):
+    old, new = RECORDS[0], {**RECORDS[0], "disposition": "FALSE POSITIVE", "pl_rade": 30.0}
+    change = stats.delta(old, new)
+    assert change == {("by", "disposition", "CONFIRMED"): -1, ("by", "disposition", "FALSE POSITIVE"): 1,
+                      ("hist", "radius_earth", "b02"): -1, ("hist", "radius_earth", "b11"): 1}
+    assert stats.delta(None, RECORDS[1]) == stats.contribution(RECORDS[1])
+    assert stats.delta(RECORDS[1], RECORDS[1]) == {}
+    assert stats.contribution(RECORDS[1])[("by", "mission", "Kepler")] == 1
+    assert stats.contribution(RECORDS[2])[("hist", "radius_earth", "missing")] == 1
+
+def test_fold_sums_every_shard_into_the_rollup(stats, fakes):
+    client = fakes["firestore"]
+    for record in RECORDS:
+        batch = client.batch()
+        stats.add_to_batch(batch, client, stats.contribution(record))
+        batch.commit()
+    # Un shard de una configuración anterior con más shards también cuenta
+    client.collection("exoplanetas_stats").document("shard-99").set({"total": 2, "by": {"tipo": {"x": 2}}})
+    stats.fold_shards(client)
+    rollup = _stats_docs(fakes)["rollup"]
+    assert rollup["total"] == 5 and rollup["by"]["tipo"]["x"] == 2
+    assert rollup["by"]["disposition"] == {"CONFIRMED": 2, "CANDIDATE": 1}
+    assert rollup["shards"] == len([name for name in _stats_docs(fakes) if name.startswith("shard-")])
+
+def test_writes_and_reingests_keep_stats_route_exact(load_function, fakes, call):
+    save = load_function("save_exoplanets")
+    assert call(save.save_exoplanet, method="POST", path="/save-exoplanet?id_field=pl_name", json=RECORDS).status_code == 201
+    changed = [{**RECORDS[0], "disposition": "FALSE POSITIVE"}]
+    assert call(save.save_exoplanet, method="POST", path="/save-exoplanet?id_field=pl_name", json=changed).status_code == 201
+
+    get = load_function("get_exoplanets")
+    body = call(get.get_exoplanets, method="GET", path="/get-exoplanets/_stats").get_json()
+    assert body["total"] == 3
+    assert body["by_disposition"] == {"CONFIRMED": 1, "CANDIDATE": 1, "FALSE POSITIVE": 1}
+    assert body["by_mission"] == {"Kepler": 2, "TESS": 1}
+    assert body["histograms"]["radius_earth"]["missing"] == 1
+
+def test_concurrent_reingests_of_the_same_ids_do_not_drift(load_function, fakes, call, monkeypatch):
+    import threading
+    import time
+    from collections import Counter
+
+    import fake_gcp
+
+    save = load_function("save_exoplanets")
+    stats = save.exoplanet_stats
+    # Lecturas lentas: sin transacción, las reingestas leen el mismo documento anterior
+    original_get = fake_gcp.FakeDocumentReference.get
+
+    def slow_get(self, *args, **kwargs):
+        time.sleep(0.002)
+        return original_get(self, *args, **kwargs)
+    monkeypatch.setattr(fake_gcp.FakeDocumentReference, "get", slow_get)
+
+    def ingest(label):
+        rows = [{"pl_name": f"p{i}", "disposition": label, "pl_rade": 1.0} for i in range(30)]
+        call(save.save_exoplanet, method="POST", path="/save-exoplanet?id_field=pl_name", json=rows)
+
+    threads = [threading.Thread(target=ingest, args=(label,)) for label in ("A", "B", "C", "D") * 3]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats.fold_shards(fakes["firestore"])
+    rollup = _stats_docs(fakes)["rollup"]
+    actual = Counter(doc.to_dict()["disposition"] for doc in fakes["firestore"].collection("exoplanetas").stream())
+    assert rollup["total"] == 30
+    assert {label: count for label, count in rollup["by"]["disposition"].items() if count} == dict(actual)
+
+@pytest.fixture
+def save_with_admin(load_function, monkeypatch):
+    monkeypatch.setenv("EXO_ADMIN_TOKEN", "secreto")
+    monkeypatch.setenv("MAINTENANCE_INVOKERS", "scheduler@proyecto.iam.gserviceaccount.com")
+    return load_function("save_exoplanets")
+
+def test_rebuild_recounts_the_collection_and_collapses_shards(save_with_admin, fakes, call):
+    client = fakes["firestore"]
+    for record in RECORDS:
+        client.collection("exoplanetas").document(record["pl_name"]).set(record)
+    for shard in ("shard-3", "shard-7"):
+        client.collection("exoplanetas_stats").document(shard).set({"total": 50})
+
+    response = call(save_with_admin.save_exoplanet, method="POST", path="/save-exoplanet/_stats/rebuild",
+                    headers={"X-Exo-Admin-Token": "secreto"})
+    assert response.status_code == 200
+    docs = _stats_docs(fakes)
+    assert sorted(docs) == ["rollup", "shard-0"]
+    assert docs["shard-0"]["total"] == docs["rollup"]["total"] == 3
+    assert docs["rollup"]["by"]["disposition"] == {"CONFIRMED": 2, "CANDIDATE": 1}
+
+def test_rebuild_requires_maintenance_credentials(save_with_admin, fakes, call, monkeypatch):
+    def rebuild(**headers):
+        return call(save_with_admin.save_exoplanet, method="POST", path="/save-exoplanet/_stats/rebuild", headers=headers)
+
+    assert rebuild().status_code == 401
+    assert rebuild(**{"X-Exo-Admin-Token": "otro"}).status_code == 403
+
+    auth = save_with_admin.maintenance_auth
+    claims = {"email": "scheduler@proyecto.iam.gserviceaccount.com", "email_verified": True}
+    monkeypatch.setattr(auth, "_verify_oidc_token", lambda token, audience: dict(claims))
+    assert rebuild(Authorization="Bearer firmado").status_code == 200
+    claims["email"] = "otra@proyecto.iam.gserviceaccount.com"
+    assert rebuild(Authorization="Bearer firmado").status_code == 403
+
+    def invalid(token, audience):
+        raise ValueError("firma no válida")
+    monkeypatch.setattr(auth, "_verify_oidc_token", invalid)
+    assert rebuild(Authorization="Bearer falso").status_code == 403
+    assert "rollup" in _stats_docs(fakes)
+
+def test_rebuild_is_closed_without_configuration(load_function, call, monkeypatch):
+    monkeypatch.delenv("EXO_ADMIN_TOKEN", raising=False)
+    monkeypatch.delenv("MAINTENANCE_INVOKERS", raising=False)
+    save = load_function("save_exoplanets")
+    response = call(save.save_exoplanet, method="POST", path="/save-exoplanet/_stats/rebuild",
+                    headers={"X-Exo-Admin-Token": ""})
+    assert response.status_code == 403
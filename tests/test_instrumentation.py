@@ -0,0 +1,77 @@
+import io
+import json
+import os
+import time
+
+import datasets
+import pytest
+
+@pytest.fixture
+def instrumentation(load_function):
+    return load_function("predictor", "common.instrumentation")
+
+def _server_timing(response):
+    entries = {}
+    for entry in response.headers["Server-Timing"].split(", "):
+        name, _, duration = entry.partition(";dur=")
+        entries[name] = float(duration)
+    return entries
+
+def test_nested_phases_are_exclusive(instrumentation, call, capsys):
+    @instrumentation.instrumented("test-fn")
+    def handler(request):
+        with instrumentation.phase("outer"):
+            time.sleep(0.03)
+            with instrumentation.phase("inner"):
+                time.sleep(0.03)
+        with instrumentation.phase("inner"):
+            time.sleep(0.01)
+        return {"ok": True}
+
+    response = call(handler, method="GET", path="/x")
+    timings = _server_timing(response)
+    assert 25 <= timings["outer"] < 55          # sin los 30 ms de 'inner'
+    assert timings["inner"] >= 38               # las dos fases 'inner' se suman
+    assert timings["total"] >= timings["outer"] + timings["inner"]
+    assert "Server-Timing" in response.headers["Access-Control-Expose-Headers"]
+
+    log = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert log["function"] == "test-fn" and log["status"] == 200 and log["path"] == "/x"
+    assert set(log["phases_ms"]) == {"outer", "inner"}
+
+def test_phase_outside_a_request_is_a_no_op(instrumentation):
+    with instrumentation.phase("loose"):
+        pass
+
+def test_handler_error_still_resets_the_request_context(instrumentation, call):
+    @instrumentation.instrumented("test-fn")
+    def failing(request):
+        with instrumentation.phase("work"):
+            raise RuntimeError("fallo")
+
+    with pytest.raises(RuntimeError):
+        call(failing, method="GET", path="/")
+    assert instrumentation._current.get() is None
+
+def test_profile_token_writes_a_profile(load_function, call, monkeypatch, tmp_path, capsys):
+    monkeypatch.setenv("EXO_PROFILE_TOKEN", "secreto")
+    instrumentation = load_function("predictor", "common.instrumentation")
+
+    @instrumentation.instrumented("test-fn")
+    def handler(request):
+        return "ok"
+
+    call(handler, method="GET", path="/", headers={"X-Exo-Profile": "otro"})
+    assert "profile_id" not in json.loads(capsys.readouterr().out.strip())
+    call(handler, method="GET", path="/", headers={"X-Exo-Profile": "secreto"})
+    profile_id = json.loads(capsys.readouterr().out.strip())["profile_id"]
+    assert sorted(os.listdir(tmp_path / "profiles")) == [f"{profile_id}.prof", f"{profile_id}.tracemalloc"]
+
+def test_predictor_reports_its_phases(train_job, load_function, call):
+    train_job("job-1")
+    predictor = load_function("predictor")
+    csv = datasets.csv_payload("kepler", 20, seed=2)
+    response = call(predictor.predictor_function, method="POST",
+                    data={"job_id": "job-1", "file": (io.BytesIO(csv), "a.csv")})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert {"parse", "firestore_read", "gcs_read", "transform", "predict", "serialize", "total"} <= set(_server_timing(response))
@@ -0,0 +1,118 @@
+import importlib
+import io
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import datasets
+
+INVOKER = "cleanup@proyecto.iam.gserviceaccount.com"
+OBJECTS = [("exoplanets-nasa-models", "models/job-1/bundle/manifest.json"),
+           ("exoplanets-nasa-models", "models/job-1/results.json.gz"),
+           ("exoplanets-nasa-models", "raw-uploads/job-1_kepler.csv"),
+           ("exoplanets-nasa-models", "prediction-cache/job-1/1/full/abc.json.gz")]
+PAYLOAD = datasets.csv_payload("kepler", 10, seed=4, labels=False)
+
+def _upload(fakes, objects):
+    for bucket, name in objects:
+        fakes["storage"].bucket(bucket).blob(name).upload_from_string(b"x")
+
+def _names(fakes, bucket="exoplanets-nasa-models"):
+    return sorted(blob.name for blob in fakes["storage"].list_blobs(fakes["storage"].bucket(bucket), prefix=""))
+
+@pytest.fixture
+def jobs_api(load_function, fakes, monkeypatch):
+    monkeypatch.setenv("EXO_ADMIN_TOKEN", "secreto")
+    monkeypatch.setenv("MAINTENANCE_INVOKERS", INVOKER)
+    fakes["firestore"].collection("exo_scout_models").document("job-1").set(
+        {"status": "completed", "params": {"data_source": "kepler"}, "created_at": datetime.now(timezone.utc)})
+    _upload(fakes, OBJECTS)
+    return load_function("crud_jobs")
+
+def _cleanup(call, main, deleted_at, job_id="job-1", **headers):
+    body = {"deleted_at": deleted_at.isoformat()} if deleted_at else {}
+    return call(main.jobs_crud, method="POST", path=f"/jobs/{job_id}/cleanup", json=body, headers=headers)
+
+def test_delete_queues_an_authenticated_cleanup_and_leaves_a_tombstone(jobs_api, fakes, call, monkeypatch):
+    monkeypatch.setenv("GCP_PROJECT", "proyecto")
+    monkeypatch.setenv("JOBS_API_FUNCTION_URL", "https://jobs.example/")
+    monkeypatch.setenv("CLEANUP_INVOKER_SERVICE_ACCOUNT", INVOKER)
+    response = call(jobs_api.jobs_crud, method="DELETE", path="/jobs/job-1")
+    assert response.get_json()["cleanup"] == {"status": "queued"}
+    (task,) = fakes["tasks"].tasks
+    http_request = task.task["http_request"]
+    assert http_request["url"] == "https://jobs.example/jobs/job-1/cleanup"
+    assert http_request["oidc_token"] == {"service_account_email": INVOKER, "audience": http_request["url"]}
+    # El almacenamiento sigue ahí hasta que llega la tarea
+    assert len(_names(fakes)) == len(OBJECTS)
+    aliases = fakes["firestore"].collection("exo_scout_routing").document("aliases").get().to_dict()
+    assert "job-1" in aliases["deleted_jobs"]
+
+def test_cleanup_route_requires_credentials_a_deleted_job_and_deleted_at(jobs_api, fakes, call):
+    deleted_at = datetime.now(timezone.utc)
+    assert _cleanup(call, jobs_api, deleted_at).status_code == 401
+    assert _cleanup(call, jobs_api, deleted_at, **{"X-Exo-Admin-Token": "otro"}).status_code == 403
+    admin = {"X-Exo-Admin-Token": "secreto"}
+    assert _cleanup(call, jobs_api, None, **admin).status_code == 400
+    assert _cleanup(call, jobs_api, deleted_at.replace(tzinfo=None), **admin).status_code == 400
+    # El job sigue existiendo: no se toca su almacenamiento
+    assert _cleanup(call, jobs_api, deleted_at, **admin).status_code == 409
+    assert len(_names(fakes)) == len(OBJECTS)
+
+def test_cleanup_deletes_only_objects_created_before_the_deletion(jobs_api, fakes, call, monkeypatch):
+    fakes["firestore"].collection("exo_scout_models").document("job-1").delete()
+    deleted_at = datetime.now(timezone.utc)
+    # Misma subida después del borrado: mismo job_id, objeto nuevo
+    newer = "raw-uploads/job-1_kepler_v2.csv"
+    _upload(fakes, [("exoplanets-nasa-models", newer)])
+
+    auth = jobs_api.maintenance_auth
+    monkeypatch.setattr(auth, "_verify_oidc_token", lambda token, audience: {"email": INVOKER, "email_verified": True})
+    response = _cleanup(call, jobs_api, deleted_at, Authorization="Bearer tarea")
+    assert response.status_code == 200
+    assert response.get_json()["deleted"] == {"models": 2, "raw_uploads": 1, "prediction_cache": 1}
+    assert _names(fakes) == [newer]
+
+def test_retention_lists_freely_but_purging_requires_credentials(jobs_api, fakes, call):
+    old = datetime.now(timezone.utc) - timedelta(days=30)
+    fakes["firestore"].collection("exo_scout_models").document("failed").set(
+        {"status": "error", "created_at": old, "failed_at": old})
+
+    listed = call(jobs_api.jobs_crud, method="POST", path="/retention").get_json()
+    assert [job["job_id"] for job in listed["jobs"]] == ["failed"] and listed["dry_run"]
+    assert call(jobs_api.jobs_crud, method="POST", path="/retention?dry_run=false").status_code == 401
+    assert fakes["firestore"].collection("exo_scout_models").document("failed").get().exists
+
+    purged = call(jobs_api.jobs_crud, method="POST", path="/retention?dry_run=false",
+                  headers={"X-Exo-Admin-Token": "secreto"}).get_json()
+    assert [job["job_id"] for job in purged["purged"]] == ["failed"]
+    assert not fakes["firestore"].collection("exo_scout_models").document("failed").get().exists
+
+def test_predictor_forgets_a_deleted_job(train_job, load_function, fakes, call):
+    train_job("job-1")
+    train_job("job-2")
+    predictor = load_function("predictor")
+    bundles = importlib.import_module("common.artifact_bundle")
+    routing = importlib.import_module("common.model_routing")
+
+    def predict(job_id):
+        return call(predictor.predictor_function, method="POST",
+                    data={"job_id": job_id, "file": (io.BytesIO(PAYLOAD), "koi.csv")})
+
+    assert predict("job-1").status_code == 200 and predict("job-2").status_code == 200
+    opened = {bundle.bundle_id: job_id for job_id in ("job-1", "job-2")
+              for bundle in bundles._open_bundles.values() if f"/models/{job_id}/" in bundle.manifest_uri}
+    assert sorted(opened.values()) == ["job-1", "job-2"] and sorted(os.listdir(bundles.CACHE_DIR)) == sorted(opened)
+
+    # La Jobs API borra el documento y deja la lápida en la tabla de enrutado
+    fakes["firestore"].collection("exo_scout_models").document("job-1").delete()
+    routing.unpublish_job(fakes["firestore"], "job-1", deleted=True)
+    predictor.route_cache.invalidate()   # Como si hubiera pasado el TTL
+
+    # Una petición de otro job aplica la lápida
+    assert predict("job-2").headers["X-Cache"] == "HIT-MEMORY"
+    remaining = [bundle_id for bundle_id, job_id in opened.items() if job_id == "job-2"]
+    assert list(bundles._open_bundles) == remaining and os.listdir(bundles.CACHE_DIR) == remaining
+    assert not any(key.startswith("job-1:") for key in predictor.prediction_cache.memory_tier._entries)
+    assert predict("job-1").status_code == 404
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+BASE_TIME = datetime(2026, 1, 1, 12, 0, 0)
+
+@pytest.fixture
+def jobs_api(load_function, fakes):
+    main = load_function("crud_jobs")
+    collection = fakes["firestore"].collection("exo_scout_models")
+    for i in range(7):
+        collection.document(f"job-{i}").set({
+            "job_id": f"job-{i}",
+            "model_name": f"model_{i}",
+            "status": "completed" if i % 2 else "error",
+            "params": {"algorithm": "xgboost", "data_source": "kepler" if i < 4 else "k2"},
+            "results": {"f1_score": 0.5 + i / 100, "classification_report": {"big": "x" * 100}},
+            "created_at": BASE_TIME + timedelta(minutes=i),
+        })
+    # Dos trabajos con el mismo created_at: el desempate por ID no debe saltar ni repetir ninguno
+    collection.document("job-tie").set({"job_id": "job-tie", "status": "completed",
+                                        "params": {"data_source": "kepler"}, "created_at": BASE_TIME + timedelta(minutes=3)})
+    return main
+
+def _list(call, main, query):
+    return call(main.jobs_crud, method="GET", path=f"/jobs?{query}")
+
+def test_summary_view_projects_listing_fields(jobs_api, call):
+    body = _list(call, jobs_api, "view=summary&limit=2").get_json()
+    assert [job["job_id"] for job in body["jobs"]] == ["job-6", "job-5"]
+    assert set(body["jobs"][0]) == {"job_id", "model_name", "status", "algorithm", "data_source",
+                                    "f1_score", "created_at", "completed_at", "failed_at"}
+    assert body["jobs"][0]["f1_score"] == pytest.approx(0.56)
+    assert body["next_cursor"]
+
+def test_cursor_pages_through_every_job_once(jobs_api, call):
+    seen, cursor = [], None
+    while True:
+        query = "view=summary&limit=3" + (f"&cursor={cursor}" if cursor else "")
+        body = _list(call, jobs_api, query).get_json()
+        seen.extend(job["job_id"] for job in body["jobs"])
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert sorted(seen) == sorted([f"job-{i}" for i in range(7)] + ["job-tie"])
+    assert len(seen) == len(set(seen))
+    assert seen.index("job-tie") > seen.index("job-4") and seen.index("job-tie") < seen.index("job-2")
+
+def test_filters_combine_with_summary_view(jobs_api, call):
+    body = _list(call, jobs_api, "view=summary&status=completed&data_source=kepler").get_json()
+    assert [job["job_id"] for job in body["jobs"]] == ["job-tie", "job-3", "job-1"]
+    assert body["next_cursor"] is None
+
+def test_full_view_is_unchanged(jobs_api, call):
+    jobs = _list(call, jobs_api, "data_source=k2").get_json()
+    assert [job["job_id"] for job in jobs] == ["job-6", "job-5", "job-4"]
+    assert "classification_report" in jobs[0]["results"]
+
+@pytest.mark.parametrize("query", ["view=compact", "view=summary&limit=abc", "view=summary&cursor=not-a-cursor"])
+def test_invalid_listing_parameters_return_400(jobs_api, call, query):
+    assert _list(call, jobs_api, query).status_code == 400
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+import run_loadtest
+
+@pytest.fixture
+def baseline_file(tmp_path):
+    args, _ = run_loadtest.parse_args(["--concurrency", "3", "--duration", "2", "--train-rows", "500"])
+    baseline = {"command": "python tools/loadtest/run_loadtest.py --concurrency 3 ...",
+                "settings": run_loadtest._settings(args),
+                "endpoints": {"predictor": {"throughput_rps": 100.0, "p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 30.0, "errors": 0}}}
+    path = tmp_path / "baseline.json"
+    path.write_text(json.dumps(baseline))
+    return str(path)
+
+def test_baseline_settings_become_the_defaults(baseline_file):
+    args, baseline = run_loadtest.parse_args(["--baseline", baseline_file])
+    assert (args.concurrency, args.duration, args.train_rows) == (3, 2.0, 500)
+    assert run_loadtest.settings_mismatch(run_loadtest._settings(args), baseline) == []
+
+def test_explicit_settings_that_differ_are_reported(baseline_file):
+    args, baseline = run_loadtest.parse_args(["--baseline", baseline_file, "--rows", "50"])
+    assert run_loadtest.settings_mismatch(run_loadtest._settings(args), baseline) == [("rows", 50, 200)]
+
+def test_baseline_without_settings_never_matches(tmp_path):
+    path = tmp_path / "old.json"
+    path.write_text(json.dumps({"endpoints": {}}))
+    args, baseline = run_loadtest.parse_args(["--baseline", str(path)])
+    assert {key for key, _, _ in run_loadtest.settings_mismatch(run_loadtest._settings(args), baseline)} == set(run_loadtest.SETTINGS)
+
+def test_mismatch_exits_before_running(baseline_file, monkeypatch, capsys):
+    monkeypatch.setattr("sys.argv", ["run_loadtest.py", "--baseline", baseline_file, "--concurrency", "9"])
+    with pytest.raises(SystemExit) as exit_info:
+        run_loadtest.main()
+    assert exit_info.value.code == 2
+    assert "concurrency: 9 (baseline: 3)" in capsys.readouterr().out
+
+def test_compare_with_baseline(baseline_file):
+    baseline = json.loads(open(baseline_file).read())
+    same = {"predictor": {"throughput_rps": 95.0, "p50_ms": 11.0, "p95_ms": 22.0, "p99_ms": 33.0, "errors": 0}}
+    assert run_loadtest.compare_with_baseline(same, baseline, 0.2) == []
+    worse = {"predictor": {"throughput_rps": 50.0, "p50_ms": 10.0, "p95_ms": 40.0, "p99_ms": 30.0, "errors": 2}}
+    regressions = run_loadtest.compare_with_baseline(worse, baseline, 0.2)
+    assert len(regressions) == 3 and any("p95_ms" in r for r in regressions)
+
+def test_state_is_reseeded_when_train_rows_change(tmp_path):
+    args, _ = run_loadtest.parse_args(["--train-rows", "500"])
+    assert run_loadtest._needs_seed(str(tmp_path), args)
+    (tmp_path / "seed.json").write_text(json.dumps({"train_rows": 500}))
+    assert not run_loadtest._needs_seed(str(tmp_path), args)
+    args.train_rows = 3000
+    assert run_loadtest._needs_seed(str(tmp_path), args)
+
+def test_shipped_baseline_records_how_it_was_produced():
+    from conftest import ROOT
+    with open(f"{ROOT}/tools/loadtest/baseline.json") as f:
+        baseline = json.load(f)
+    assert baseline["command"].startswith("python tools/loadtest/run_loadtest.py")
+    assert set(baseline["settings"]) == set(run_loadtest.SETTINGS)
@@ -0,0 +1,100 @@
+import importlib
+import threading
+import time
+
+import numpy as np
+import pytest
+
+KEY = ("job-1", "1", "full")
+
+@pytest.fixture
+def microbatch(load_function):
+    return load_function("predictor", "microbatch")
+
+@pytest.fixture
+def instrumentation(microbatch):
+    return importlib.import_module("common.instrumentation")
+
+def _part(start, rows):
+    return np.arange(start, start + rows, dtype=float).reshape(-1, 1)
+
+def _scorer(calls, delay=0.0, error=None):
+    """Puntúa cada fila como (valor, 2 * valor) y registra los tamaños de cada llamada."""
+    instrumentation = importlib.import_module("common.instrumentation")
+
+    def score(parts):
+        calls.append([len(part) for part in parts])
+        with instrumentation.phase("transform"):
+            time.sleep(delay)
+            if error is not None:
+                raise error
+        with instrumentation.phase("predict"):
+            X = np.concatenate(parts)
+            return np.hstack([X, 2 * X])
+
+    return score
+
+def _submit_together(batcher, instrumentation, parts, score):
+    """Lanza cada 'part' en su hilo; el primero abre el lote. Devuelve (resultados, errores, fases) por parte."""
+    outcomes = [None] * len(parts)
+
+    def run(i):
+        with instrumentation.separate_timings() as timings:
+            try:
+                outcomes[i] = (batcher.submit(KEY, parts[i], score), None, timings.phases)
+            except Exception as e:
+                outcomes[i] = (None, e, timings.phases)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(parts))]
+    threads[0].start()
+    while KEY not in batcher._open and outcomes[0] is None:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+def test_mixed_part_sizes_get_their_own_rows(microbatch, instrumentation):
+    batcher = microbatch.MicroBatcher(window_ms=300, max_rows=64)
+    parts = [_part(0, 1), _part(10, 5), _part(20, 2), _part(30, 3)]
+    calls = []
+    outcomes = _submit_together(batcher, instrumentation, parts, _scorer(calls))
+    assert len(calls) == 1 and sorted(calls[0]) == [1, 2, 3, 5]
+    for part, ((results, size), error, _) in zip(parts, outcomes):
+        assert error is None and size == 4
+        np.testing.assert_array_equal(results, np.hstack([part, 2 * part]))
+
+def test_overflow_closes_the_batch_and_large_requests_skip_it(microbatch, instrumentation):
+    batcher = microbatch.MicroBatcher(window_ms=300, max_rows=4)
+    calls = []
+    score = _scorer(calls)
+    # 3 + 2 > 4: la segunda petición cierra el primer lote y abre otro
+    outcomes = _submit_together(batcher, instrumentation, [_part(0, 3), _part(3, 2)], score)
+    assert sorted(calls) == [[2], [3]]
+    assert [outcome[0][1] for outcome in outcomes] == [1, 1]
+    np.testing.assert_array_equal(outcomes[1][0][0][:, 0], [3, 4])
+    # El primer lote se cerró al llegar la segunda petición, sin agotar la ventana
+    assert outcomes[0][2]["batch_wait"] < 250
+
+    calls.clear()
+    results, size = batcher.submit(KEY, _part(0, 4), score)
+    assert calls == [[4]] and size == 1 and len(results) == 4
+
+def test_leader_error_reaches_every_request(microbatch, instrumentation):
+    batcher = microbatch.MicroBatcher(window_ms=200, max_rows=64)
+    failure = ValueError("modelo corrupto")
+    outcomes = _submit_together(batcher, instrumentation, [_part(0, 1), _part(1, 1), _part(2, 1)],
+                                _scorer([], error=failure))
+    assert [error for _, error, _ in outcomes] == [failure] * 3
+    assert not batcher._open
+
+def test_every_request_reports_the_batch_phases(microbatch, instrumentation):
+    batcher = microbatch.MicroBatcher(window_ms=100, max_rows=64)
+    outcomes = _submit_together(batcher, instrumentation, [_part(0, 1), _part(1, 1)], _scorer([], delay=0.15))
+    (_, _, leader), (_, _, follower) = outcomes
+    for phases in (leader, follower):
+        assert phases["transform"] >= 150 and "predict" in phases
+    # El seguidor esperó la ventana y la puntuación, pero esta ya está en 'transform'
+    assert follower["batch_wait"] < 150
+    assert follower["transform"] == leader["transform"]
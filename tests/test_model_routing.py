@@ -0,0 +1,128 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import datasets
+
+BASE = datetime(2026, 5, 1, tzinfo=timezone.utc)
+
+@pytest.fixture
+def routing(load_function):
+    return load_function("crud_jobs", "common.model_routing")
+
+def _job(fakes, job_id, data_source="kepler", f1=0.8, minutes=0, status="completed", compact=False):
+    data = {
+        "status": status,
+        "params": {"data_source": data_source, "algorithm": "xgboost"},
+        "results": {"gcs_artifacts_path": f"gs://models/models/{job_id}/bundle/manifest.json", "f1_score": f1},
+        "completed_at": BASE + timedelta(minutes=minutes),
+    }
+    if compact:
+        data["results"]["compact_model_agreement"] = 0.97
+    fakes["firestore"].collection("exo_scout_models").document(job_id).set(data)
+    return data
+
+def _routes(fakes):
+    doc = fakes["firestore"].collection("exo_scout_routing").document("aliases").get().to_dict()
+    return {alias: route["job_id"] for alias, route in doc["routes"].items()}, doc["version"]
+
+@pytest.mark.parametrize("name, expected", [
+    ("kepler:best", True), ("k2:latest", True), ("kepler:worst", False), (":best", False),
+    ("9f86d081884c7d659a2feaa0c55ad015", False), (None, False),
+])
+def test_is_alias(routing, name, expected):
+    assert routing.is_alias(name) is expected
+
+def test_best_and_latest_are_tracked_separately(routing, fakes):
+    old_good = _job(fakes, "old-good", f1=0.9, minutes=0)
+    new_worse = _job(fakes, "new-worse", f1=0.7, minutes=10, compact=True)
+    assert sorted(routing.publish_job(fakes["firestore"], "old-good", old_good)) == ["kepler:best", "kepler:latest"]
+    assert routing.publish_job(fakes["firestore"], "new-worse", new_worse) == ["kepler:latest"]
+    routes, version = _routes(fakes)
+    assert routes == {"kepler:best": "old-good", "kepler:latest": "new-worse"} and version == 2
+    doc = fakes["firestore"].collection("exo_scout_routing").document("aliases").get().to_dict()
+    assert doc["routes"]["kepler:latest"]["variants"] == ["full", "fast"]
+
+def test_unpublish_reassigns_to_the_next_candidate(routing, fakes):
+    for job_id, f1, minutes in (("a", 0.9, 0), ("b", 0.8, 5), ("c", 0.85, 1)):
+        routing.publish_job(fakes["firestore"], job_id, _job(fakes, job_id, f1=f1, minutes=minutes))
+    _job(fakes, "pending", f1=0.99, minutes=20, status="training")
+    fakes["firestore"].collection("exo_scout_models").document("a").delete()
+    removed, reassigned = routing.unpublish_job(fakes["firestore"], "a")
+    assert removed == ["kepler:best"] and reassigned == ["kepler:best"]
+    assert _routes(fakes)[0] == {"kepler:best": "c", "kepler:latest": "b"}
+    assert routing.unpublish_job(fakes["firestore"], "missing") == ([], [])
+
+def test_rebuild_uses_only_completed_jobs(routing, fakes):
+    _job(fakes, "k", f1=0.8)
+    _job(fakes, "k2-job", data_source="k2", f1=0.6)
+    _job(fakes, "failed", f1=0.99, minutes=30, status="error")
+    routes = routing.rebuild_routes(fakes["firestore"])
+    assert {alias: route["job_id"] for alias, route in routes.items()} == {
+        "kepler:best": "k", "kepler:latest": "k", "k2:best": "k2-job", "k2:latest": "k2-job"}
+
+def test_rebuild_route_requires_maintenance_credentials(load_function, fakes, call, monkeypatch):
+    monkeypatch.setenv("EXO_ADMIN_TOKEN", "secreto")
+    jobs_api = load_function("crud_jobs")
+    _job(fakes, "k", f1=0.8)
+
+    def rebuild(**headers):
+        return call(jobs_api.jobs_crud, method="POST", path="/aliases/rebuild", headers=headers)
+
+    assert rebuild().status_code == 401
+    assert rebuild(**{"X-Exo-Admin-Token": "otro"}).status_code == 403
+    assert not fakes["firestore"].collection("exo_scout_routing").document("aliases").get().exists
+    response = rebuild(**{"X-Exo-Admin-Token": "secreto"})
+    assert response.status_code == 200 and response.get_json()["aliases"]["kepler:best"]["job_id"] == "k"
+
+def test_rebuild_route_is_closed_without_configuration(load_function, call, monkeypatch):
+    monkeypatch.delenv("EXO_ADMIN_TOKEN", raising=False)
+    monkeypatch.delenv("MAINTENANCE_INVOKERS", raising=False)
+    jobs_api = load_function("crud_jobs")
+    response = call(jobs_api.jobs_crud, method="POST", path="/aliases/rebuild", headers={"X-Exo-Admin-Token": "x"})
+    assert response.status_code == 403
+
+def test_route_cache_reloads_on_ttl_and_on_unknown_alias(routing, fakes, monkeypatch):
+    routing.publish_job(fakes["firestore"], "a", _job(fakes, "a"))
+    clock = [1000.0]
+    monkeypatch.setattr(routing.time, "monotonic", lambda: clock[0])
+    cache = routing.RouteCache(ttl_seconds=30)
+    assert cache.resolve(fakes["firestore"], "kepler:best")["job_id"] == "a"
+
+    routing.publish_job(fakes["firestore"], "k2-job", _job(fakes, "k2-job", data_source="k2"))
+    routing.publish_job(fakes["firestore"], "b", _job(fakes, "b", f1=0.95))
+    # Un alias conocido se sirve de memoria hasta el TTL...
+    assert cache.resolve(fakes["firestore"], "kepler:best")["job_id"] == "a"
+    # ...uno desconocido fuerza la recarga, como mucho una por segundo
+    assert cache.resolve(fakes["firestore"], "k2:best") is None
+    clock[0] += 2
+    assert cache.resolve(fakes["firestore"], "k2:best")["job_id"] == "k2-job"
+    assert cache.resolve(fakes["firestore"], "kepler:best")["job_id"] == "b"
+
+def test_tombstones_survive_rewrites_and_are_delivered_once(routing, fakes, monkeypatch):
+    monkeypatch.setattr(routing, "MAX_DELETED_JOBS", 2)
+    cache = routing.RouteCache(ttl_seconds=0)
+    for job_id in ("x", "y", "z"):
+        routing.unpublish_job(fakes["firestore"], job_id, deleted=True)
+    routing.publish_job(fakes["firestore"], "a", _job(fakes, "a"))
+    routing.rebuild_routes(fakes["firestore"])
+    cache.routes(fakes["firestore"])
+    # Solo se conservan las más recientes
+    assert cache.take_deleted() == {"y", "z"}
+    cache.routes(fakes["firestore"])
+    assert cache.take_deleted() == set()
+    # Un job recreado y eliminado de nuevo vuelve a entregarse
+    routing.unpublish_job(fakes["firestore"], "z", deleted=True)
+    cache.routes(fakes["firestore"])
+    assert cache.take_deleted() == {"z"}
+
+def test_trained_model_is_reachable_through_its_alias(train_job, load_function, call):
+    assert train_job("job-1").get_json()["aliases"] == ["kepler:best", "kepler:latest"]
+    predictor = load_function("predictor")
+    response = call(predictor.predictor_function, method="POST", data={
+        "job_id": "kepler:best", "file": (io.BytesIO(datasets.csv_payload("kepler", 5, seed=3)), "a.csv")})
+    assert response.status_code == 200 and response.get_json()["job_id"] == "job-1"
+    missing = call(predictor.predictor_function, method="POST", data={
+        "job_id": "k2:best", "file": (io.BytesIO(b"a\n1\n"), "a.csv")})
+    assert missing.status_code == 404
@@ -0,0 +1,138 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+import datasets
+from conftest import FUNCTIONS_DIR
+
+@pytest.fixture
+def memory_guard(load_function):
+    return load_function("trainer", "common.memory_guard")
+
+def _allocate(blocks, mb=20):
+    for _ in range(blocks):
+        yield np.ones(mb * 2**20 // 8)
+        time.sleep(0.01)
+
+def test_guard_does_not_touch_process_limits(memory_guard, monkeypatch):
+    def forbidden(*args):
+        raise AssertionError("setrlimit afecta a todo el proceso")
+
+    monkeypatch.setattr(memory_guard.resource, "setrlimit", forbidden)
+    with memory_guard.MemoryGuard(limit_mb=memory_guard.current_rss_mb() + 500) as guard:
+        guard.check("inicio")
+
+def test_hard_limit_applies_only_to_the_subprocess(memory_guard):
+    limit = memory_guard.current_rss_mb() + 100
+    assert memory_guard.run_with_memory_limit(np.ones, (10,), limit).sum() == 10
+    with pytest.raises(memory_guard.MemoryCeilingExceeded, match="límite duro"):
+        memory_guard.run_with_memory_limit(np.ones, (500 * 2**20 // 8,), limit)
+    # Este proceso sigue sin límite
+    assert np.ones(500 * 2**20 // 8).size
+
+def test_soft_guard_reports_a_peak_between_checks(memory_guard):
+    limit = memory_guard.current_rss_mb() + 60
+    with memory_guard.MemoryGuard(limit_mb=limit, poll_seconds=0.005) as guard:
+        blocks = list(_allocate(6))
+        time.sleep(0.05)
+        del blocks
+        with pytest.raises(memory_guard.MemoryCeilingExceeded):
+            guard.check("después del pico")
+    assert guard.peak_mb > limit
+
+def test_guard_without_limit_only_measures(memory_guard):
+    with memory_guard.MemoryGuard(limit_mb=None, poll_seconds=0.005) as guard:
+        blocks = list(_allocate(3))
+        time.sleep(0.05)
+        assert guard.check("sin límite") > 0
+    del blocks
+    assert guard.peak_mb >= guard.check_peak() - 1
+
+def test_out_of_core_request_records_the_algorithm_it_trained(train_job, fakes):
+    response = train_job("ooc-job", algorithm="random_forest", out_of_core=True)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    job = fakes["firestore"].collection("exo_scout_models").document("ooc-job").get().to_dict()
+    assert job["params"]["algorithm"] == "xgboost"
+    assert job["params"]["requested_algorithm"] == "random_forest"
+    assert job["results"]["training_mode"] == "out_of_core" and job["status"] == "completed"
+
+def test_out_of_core_pipeline_trains_in_a_limited_subprocess(load_function, tmp_path):
+    trainer = load_function("trainer")
+    out_of_core = importlib.import_module("pipelines.out_of_core")
+    memory_guard = importlib.import_module("common.memory_guard")
+    csv_path = tmp_path / "kepler.csv"
+    csv_path.write_bytes(datasets.csv_payload("kepler", 600, seed=3))
+    pipeline = out_of_core.OutOfCoreTrainingPipeline(
+        open_source=out_of_core.SourceFile(str(csv_path)),
+        feature_pipeline=trainer.PIPELINES["kepler"](df=None, algorithm="xgboost"),
+        job_id="subprocess", guard=memory_guard.MemoryGuard(limit_mb=memory_guard.current_rss_mb() + 1000))
+    artifacts, metadata = pipeline.run_in_subprocess()
+    assert metadata["training_mode"] == "out_of_core" and "model" in artifacts
+    assert metadata["memory_limit_mb"] == pipeline.guard.limit_mb
+
+# Se entrena en un subproceso para medir una RSS sin los módulos de los demás tests y para poder
+# fijarle un techo duro con setrlimit
+CHILD = """
+import json, sys
+from common.config import ModelConfig
+from common.memory_guard import MemoryGuard, current_rss_mb, limit_data_segment
+from main import PIPELINES
+from pipelines.out_of_core import OutOfCoreTrainingPipeline
+import pandas as pd
+import pyarrow as pa
+
+mode, csv_path, budget_mb = sys.argv[1], sys.argv[2], int(sys.argv[3])
+ModelConfig.xgb_n_estimators = 20
+ModelConfig.ooc_chunk_rows = 10_000
+guard = MemoryGuard(limit_mb=current_rss_mb() + budget_mb, poll_seconds=0.01)
+pa.set_memory_pool(pa.system_memory_pool())
+limit_data_segment(guard.limit_mb)  # Techo duro, como en OutOfCoreTrainingPipeline.run_in_subprocess
+result = {}
+try:
+    if mode == "out_of_core":
+        pipeline = OutOfCoreTrainingPipeline(open_source=lambda: open(csv_path, "rb"),
+                                             feature_pipeline=PIPELINES["kepler"](df=None, algorithm="xgboost"),
+                                             job_id="memory-check", guard=guard)
+        _, metadata = pipeline.run()
+        result.update(ok=True, f1_score=metadata["f1_score"], peak_rss_mb=metadata["peak_rss_mb"])
+    else:
+        with guard:
+            df = pd.read_csv(csv_path, comment="#", low_memory=False)
+            PIPELINES["kepler"](df=df, algorithm="xgboost").run()
+        result.update(ok=True)
+except Exception as e:  # Una reserva por encima del techo duro: MemoryError o "out of memory" de pandas
+    result.update(ok=False, error=f"{type(e).__name__}: {e}")
+result["limit_mb"] = guard.limit_mb
+print(json.dumps(result))
+"""
+
+@pytest.fixture(scope="module")
+def large_csv(tmp_path_factory):
+    path = tmp_path_factory.mktemp("ooc") / "kepler.csv"
+    with open(path, "w") as f:
+        f.write(datasets.ARCHIVE_HEADER)
+        for i in range(4):
+            datasets.FRAMES["kepler"](100_000, seed=i).to_csv(f, index=False, header=(i == 0))
+    return str(path)
+
+def _train_in_subprocess(mode, csv_path, budget_mb):
+    proc = subprocess.run([sys.executable, "-c", CHILD, mode, csv_path, str(budget_mb)],
+                          cwd=f"{FUNCTIONS_DIR}/trainer", capture_output=True, text=True,
+                          env=dict(os.environ, PYTHONPATH=f"{FUNCTIONS_DIR}/trainer"))
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def test_out_of_core_training_fits_under_a_ceiling_the_in_memory_pipeline_exceeds(large_csv):
+    # ~60 MB de CSV. El techo duro cuenta la memoria privada reservada, no solo la residente: fuera de
+    # memoria se reservan ~250 MB más que al arrancar (constante), el pipeline en memoria crece con el CSV
+    out_of_core = _train_in_subprocess("out_of_core", large_csv, 400)
+    assert out_of_core["ok"] and out_of_core["f1_score"] > 0.5
+    assert out_of_core["peak_rss_mb"] <= out_of_core["limit_mb"]
+    in_memory = _train_in_subprocess("in_memory", large_csv, 400)
+    assert not in_memory["ok"] and ("MemoryError" in in_memory["error"] or "out of memory" in in_memory["error"])
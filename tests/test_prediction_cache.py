@@ -0,0 +1,133 @@
+import gzip
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from flask import Flask, jsonify
+
+import datasets
+
+PAYLOAD = datasets.csv_payload("kepler", 15, seed=8, labels=False)
+
+@pytest.fixture
+def cache_module(load_function):
+    return load_function("predictor", "prediction_cache")
+
+def test_response_body_matches_jsonify(cache_module):
+    predictions = [{"CANDIDATE": 0.25, "CONFIRMED": 0.7, "FALSE POSITIVE": 0.05}]
+    model_info = {"job_id": "abc", "alias": "kepler:best", "variant": "full"}
+    body = cache_module.response_body(model_info, cache_module.serialize_predictions(predictions))
+    with Flask("t").app_context():
+        assert body == jsonify({**model_info, "predictions": predictions}).get_data()
+    assert json.loads(cache_module.response_body({}, b"[]")) == {"predictions": []}
+
+def test_model_version_treats_naive_dates_as_utc(cache_module):
+    aware = datetime(2026, 3, 1, 12, tzinfo=timezone.utc)
+    assert cache_module.model_version(aware.replace(tzinfo=None)) == cache_module.model_version(aware)
+    assert cache_module.model_version(None) == "0"
+
+@pytest.fixture
+def predictor(train_job, load_function):
+    train_job("job-1", compact_model=True)
+    module = load_function("predictor")
+    module.prediction_cache.memory_tier.invalidate()
+    return module
+
+def _predict(call, predictor, headers=None, **form):
+    form.setdefault("job_id", "job-1")
+    return call(predictor.predictor_function, method="POST", headers=headers or {},
+                data={**form, "file": (io.BytesIO(PAYLOAD), "koi.csv")})
+
+def _cached_blobs(fakes, job_id="job-1"):
+    bucket = fakes["storage"].bucket("exoplanets-nasa-models")
+    return [blob.name for blob in bucket.list_blobs(prefix=f"prediction-cache/{job_id}/")]
+
+def test_memory_then_storage_tiers(predictor, fakes, call):
+    first = _predict(call, predictor)
+    assert first.headers["X-Cache"] == "MISS"
+    second = _predict(call, predictor)
+    assert second.headers["X-Cache"] == "HIT-MEMORY" and second.get_data() == first.get_data()
+    assert "parse" not in second.headers["Server-Timing"]
+
+    (name,) = _cached_blobs(fakes)
+    assert name.endswith(f"/full/{predictor.prediction_cache.content_digest(PAYLOAD)}.json.gz")
+    # Otra instancia: memoria vacía, pero el objeto de GCS sigue ahí
+    predictor.prediction_cache.memory_tier.invalidate()
+    third = _predict(call, predictor)
+    assert third.headers["X-Cache"] == "HIT-STORAGE" and third.get_data() == first.get_data()
+
+def test_no_cache_forces_a_fresh_prediction(predictor, call):
+    _predict(call, predictor)
+    assert _predict(call, predictor, headers={"Cache-Control": "no-cache"}).headers["X-Cache"] == "MISS"
+
+def test_variants_and_retrained_models_use_separate_entries(predictor, fakes, call):
+    full = _predict(call, predictor)
+    fast = _predict(call, predictor, variant="fast")
+    assert fast.headers["X-Cache"] == "MISS" and fast.get_json()["variant"] == "fast"
+    assert full.get_json()["variant"] == "full"
+
+    # Reentrenar con el mismo job_id cambia 'completed_at' y, con ello, la versión
+    doc = fakes["firestore"].collection("exo_scout_models").document("job-1")
+    doc.update({"completed_at": doc.get().to_dict()["completed_at"] + timedelta(minutes=1)})
+    assert _predict(call, predictor).headers["X-Cache"] == "MISS"
+    assert len(_cached_blobs(fakes)) == 3
+
+def test_storage_failures_are_not_fatal(predictor, fakes, call, monkeypatch):
+    bucket = fakes["storage"].bucket("exoplanets-nasa-models")
+    original_blob = type(bucket).blob
+
+    class BrokenBlob:
+        time_created = None
+
+        def __init__(self, name):
+            self.name = name
+
+        def upload_from_string(self, *args, **kwargs):
+            raise IOError("sin conexión")
+
+        def download_as_bytes(self, *args, **kwargs):
+            raise IOError("sin conexión")
+
+    def blob(self, name, **kwargs):
+        return BrokenBlob(name) if name.startswith("prediction-cache/") else original_blob(self, name, **kwargs)
+
+    monkeypatch.setattr(type(bucket), "blob", blob)
+    monkeypatch.setattr(type(bucket), "get_blob", blob)
+    assert _predict(call, predictor).status_code == 200
+    predictor.prediction_cache.memory_tier.invalidate()
+    assert _predict(call, predictor).headers["X-Cache"] == "MISS"
+
+def test_expired_storage_entries_are_deleted_and_recomputed(predictor, fakes, call, monkeypatch):
+    first = _predict(call, predictor)
+    (name,) = _cached_blobs(fakes)
+    record = fakes["storage"]._objects[("exoplanets-nasa-models", name)]
+    record["updated"] -= timedelta(days=8)
+    stale_since = record["updated"]
+
+    predictor.prediction_cache.memory_tier.invalidate()
+    second = _predict(call, predictor)
+    assert second.headers["X-Cache"] == "MISS" and second.get_data() == first.get_data()
+    # Se borró y se volvió a escribir con la predicción nueva
+    assert _cached_blobs(fakes) == [name]
+    assert fakes["storage"].bucket("exoplanets-nasa-models").blob(name).time_created > stale_since + timedelta(days=7)
+
+    # Sin TTL, el objeto se sirve sea cual sea su antigüedad
+    monkeypatch.setattr(predictor.prediction_cache, "DURABLE_TTL_SECONDS", 0)
+    fakes["storage"]._objects[("exoplanets-nasa-models", name)]["updated"] -= timedelta(days=30)
+    predictor.prediction_cache.memory_tier.invalidate()
+    assert _predict(call, predictor).headers["X-Cache"] == "HIT-STORAGE"
+
+def test_durable_tier_can_be_disabled(train_job, load_function, fakes, call, monkeypatch):
+    train_job("job-1")
+    monkeypatch.setenv("PREDICTION_CACHE_DURABLE", "false")
+    predictor = load_function("predictor")
+    _predict(call, predictor)
+    assert _predict(call, predictor).headers["X-Cache"] == "HIT-MEMORY"
+    assert _cached_blobs(fakes) == []
+
+def test_stored_entry_is_the_gzipped_predictions_list(predictor, fakes, call):
+    body = _predict(call, predictor).get_json()
+    (name,) = _cached_blobs(fakes)
+    stored = gzip.decompress(fakes["storage"].bucket("exoplanets-nasa-models").blob(name).download_as_bytes())
+    assert json.loads(stored) == body["predictions"]
@@ -0,0 +1,117 @@
+import importlib
+import io
+import json
+
+import pytest
+
+import datasets
+
+@pytest.fixture
+def preflight(load_function):
+    return load_function("orchestrator", "preflight")
+
+def _csv(df):
+    return (datasets.ARCHIVE_HEADER + df.to_csv(index=False)).encode("utf-8")
+
+def test_small_file_is_profiled_exactly(preflight):
+    df = datasets.kepler_frame(400, seed=1)
+    report = preflight.profile_csv(_csv(df), "kepler")
+    assert report["errors"] == [] and report["exact"]
+    assert report["estimated_rows"] == 400 and report["sampled_rows"] == 400
+    assert report["estimated_class_counts"] == df["koi_disposition"].value_counts().to_dict()
+    assert report["null_rates"]["koi_prad"] == round(df["koi_prad"].isna().mean(), 4)
+
+def test_large_file_is_estimated_from_spread_blocks(preflight):
+    # Las clases se ordenan por bloques: una muestra solo del principio vería una
+    df = datasets.kepler_frame(30_000, seed=2).sort_values("koi_disposition", kind="stable")
+    report = preflight.profile_csv(_csv(df), "kepler", sample_rows=2_000, blocks=20)
+    assert not report["exact"] and report["sampled_rows"] <= 2_000
+    assert abs(report["estimated_rows"] - 30_000) <= 1
+    expected = df["koi_disposition"].value_counts()
+    for label, count in report["estimated_class_counts"].items():
+        assert abs(count - expected[label]) / expected[label] < 0.15
+
+@pytest.mark.parametrize("data_source, mutate, message", [
+    ("tess", lambda df: df, "No hay pipeline"),
+    ("kepler", lambda df: df.drop(columns=["koi_disposition"]), "columna objetivo"),
+    ("kepler", lambda df: df[["kepoi_name", "koi_disposition"]], "ninguna de las features"),
+    ("kepler", lambda df: df.head(30), "filas etiquetadas"),
+    ("kepler", lambda df: df.assign(koi_disposition="CONFIRMED"), "al menos 2 clases"),
+])
+def test_files_that_cannot_train_are_errors(preflight, data_source, mutate, message):
+    report = preflight.profile_csv(_csv(mutate(datasets.kepler_frame(300, seed=3))), data_source)
+    assert any(message in error for error in report["errors"])
+
+def test_recoverable_problems_are_warnings(preflight):
+    df = datasets.kepler_frame(300, seed=4).drop(columns=["koi_smet"])
+    df["koi_teq"] = None
+    payload = _csv(df) + b"roto,1\n"
+    report = preflight.profile_csv(payload, "kepler")
+    assert report["errors"] == []
+    assert report["features_missing"] == ["koi_smet"]
+    joined = " ".join(report["warnings"])
+    assert "koi_smet" in joined and "koi_teq" in joined and "no tienen" in joined
+    assert report["malformed_rate"] > 0
+
+def test_k2_rows_below_the_minimum_features_are_reported(preflight):
+    df = datasets.k2_frame(300, seed=5)
+    df.loc[:99, ["pl_orbper", "pl_rade", "pl_radj", "pl_bmasse", "pl_bmassj", "pl_orbeccen", "pl_orbsmax",
+                 "pl_insol", "pl_eqt", "st_teff", "st_rad", "st_mass"]] = None
+    report = preflight.profile_csv(_csv(df), "k2")
+    assert sum(report["estimated_class_counts"].values()) == 200
+    assert any("features y el trainer las descartará" in warning for warning in report["warnings"])
+
+def test_preflight_and_trainer_share_the_k2_row_filter(load_function, monkeypatch):
+    df = datasets.k2_frame(300, seed=6)
+    df.loc[:99, ["pl_orbper", "pl_rade", "pl_radj", "pl_bmasse", "pl_bmassj", "pl_orbeccen"]] = None
+    df.loc[100:149, ["pl_orbper", "pl_rade", "pl_radj", "pl_bmasse", "pl_bmassj", "pl_orbeccen", "pl_orbsmax",
+                     "pl_insol", "pl_eqt", "st_teff", "st_rad", "st_mass"]] = None
+    for minimum in (5, 12):
+        k2_pipeline = load_function("trainer", "pipelines.k2_pipeline")
+        schema = importlib.import_module("common.dataset_schema")
+        monkeypatch.setitem(schema.DATASET_SCHEMAS["k2"], "min_valid_features", minimum)
+        X, _ = k2_pipeline.K2TrainingPipeline(df=None, algorithm="xgboost")._select_columns(df)
+        preflight = load_function("orchestrator", "preflight")
+        monkeypatch.setitem(preflight.DATASET_SCHEMAS["k2"], "min_valid_features", minimum)
+        report = preflight.profile_csv(_csv(df), "k2")
+        labeled = df.loc[X.index, "disposition"].notna().sum()
+        assert sum(report["estimated_class_counts"].values()) == labeled
+
+@pytest.fixture
+def orchestrator(load_function, monkeypatch):
+    monkeypatch.setenv("GCP_PROJECT", "exo-local")
+    monkeypatch.setenv("TRAINER_FUNCTION_URL", "https://trainer.test")
+    main = load_function("orchestrator")
+    monkeypatch.setattr(main, "get_data_source_from_headers", lambda headers: "kepler")
+    return main
+
+def _upload(call, orchestrator, payload):
+    return call(orchestrator.orchestrator_function, method="POST",
+                data={"file": (io.BytesIO(payload), "koi.csv"), "params": json.dumps({"algorithm": "xgboost"})})
+
+def test_rejected_upload_is_neither_stored_nor_enqueued(orchestrator, fakes, call):
+    response = _upload(call, orchestrator, _csv(datasets.kepler_frame(20, seed=6)))
+    assert response.status_code == 400 and response.get_json()["details"]
+    assert fakes["tasks"].tasks == []
+    assert list(fakes["storage"].bucket("exoplanets-nasa-models").list_blobs(prefix="raw-uploads/")) == []
+
+def test_accepted_upload_carries_the_estimate_to_the_trainer(orchestrator, fakes, call):
+    payload = _csv(datasets.kepler_frame(300, seed=7).drop(columns=["koi_smet"]))
+    response = _upload(call, orchestrator, payload)
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body["estimated_rows"] == 300 and any("koi_smet" in w for w in body["warnings"])
+    task = json.loads(fakes["tasks"].tasks[0].task["http_request"]["body"])
+    assert task["preflight"]["size_bytes"] == len(payload) and task["data_source"] == "kepler"
+
+def test_trainer_uses_the_preflight_size_without_asking_gcs(load_function, monkeypatch):
+    trainer = load_function("trainer")
+
+    class Blob:
+        def reload(self):
+            raise AssertionError("no debería consultar GCS")
+
+    big = {"preflight": {"size_bytes": trainer.OUT_OF_CORE_THRESHOLD_BYTES + 1}}
+    assert trainer._use_out_of_core(big, Blob())
+    assert not trainer._use_out_of_core({"preflight": {"size_bytes": 10}}, Blob())
+    assert not trainer._use_out_of_core({**big, "out_of_core": False}, Blob())
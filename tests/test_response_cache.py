@@ -0,0 +1,76 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+@pytest.fixture
+def cache_module(load_function):
+    return load_function("get_exoplanets", "common.response_cache")
+
+def test_lru_evicts_by_entries_and_bytes(cache_module):
+    cache = cache_module.ResponseCache(ttl_seconds=60, max_entries=2, max_bytes=10)
+    cache.put("a", b"1234", "ea", 1.0)
+    cache.put("b", b"1234", "eb", 1.0)
+    assert cache.get("a") is not None          # 'a' pasa a ser la más reciente
+    cache.put("c", b"1234", "ec", 1.0)
+    assert cache.get("b") is None and cache.get("a") is not None
+    cache.put("d", b"123456789", "ed", 1.0)     # supera max_bytes: solo cabe 'd'
+    assert cache.stats()["entries"] == 1 and cache.stats()["bytes"] == 9
+
+def test_ttl_and_prefix_invalidation(cache_module, monkeypatch):
+    cache = cache_module.ResponseCache(ttl_seconds=5)
+    cache.put("jobs:list", b"x", "e1", 3.0)
+    cache.put("exoplanetas:list", b"y", "e2", 3.0)
+    cache.invalidate("jobs:")
+    assert cache.get("jobs:list") is None and cache.get("exoplanetas:list") is not None
+    now = time.monotonic()
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now + 10)
+    assert cache.get("exoplanetas:list") is None
+
+def test_zero_ttl_cache_stores_nothing(cache_module):
+    cache = cache_module.ResponseCache(ttl_seconds=0)
+    cache.put("k", b"x", "e", 1.0)
+    assert cache.get("k") is None
+
+@pytest.fixture
+def read_api(load_function, fakes):
+    main = load_function("get_exoplanets")
+    collection = fakes["firestore"].collection("exoplanetas")
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for i in range(3):
+        collection.document(f"p{i}").set({"pl_name": f"p{i}", "updated_at": base + timedelta(seconds=i)})
+    return main, collection
+
+def _get(call, main, path, **kwargs):
+    return call(main.get_exoplanets, method="GET", path=path, **kwargs)
+
+def test_list_is_cached_with_strong_etag(read_api, call):
+    main, _ = read_api
+    first = _get(call, main, "/")
+    second = _get(call, main, "/")
+    assert first.headers["X-Cache"] == "MISS" and second.headers["X-Cache"] == "HIT"
+    assert first.get_data() == second.get_data()
+    revalidated = _get(call, main, "/", headers={"If-None-Match": first.headers["ETag"]})
+    assert revalidated.status_code == 304
+
+def test_write_from_another_instance_invalidates_the_list(read_api, call):
+    main, collection = read_api
+    etag = _get(call, main, "/").headers["ETag"]
+    # save_exoplanet corre en otro proceso: solo comparten Firestore
+    collection.document("p9").set({"pl_name": "p9", "updated_at": datetime.now(timezone.utc)})
+    response = _get(call, main, "/", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["X-Cache"] == "MISS"
+    assert "p9" in {doc["id"] for doc in response.get_json()}
+
+def test_document_route_always_reads_firestore(read_api, call):
+    main, collection = read_api
+    first = _get(call, main, "/get-exoplanets/p1")
+    collection.document("p1").set({"pl_name": "renamed", "updated_at": datetime.now(timezone.utc)})
+    second = _get(call, main, "/get-exoplanets/p1", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200 and second.get_json()["pl_name"] == "renamed"
+    assert _get(call, main, "/get-exoplanets/p1", headers={"If-None-Match": second.headers["ETag"]}).status_code == 304
+    assert _get(call, main, "/get-exoplanets/missing").status_code == 404
+
+def test_save_exoplanets_no_longer_ships_a_cache(load_function):
+    main = load_function("save_exoplanets")
+    assert not hasattr(main, "response_cache")
@@ -0,0 +1,51 @@
+import pytest
+
+METADATA = {
+    "f1_score": 0.91,
+    "algorithm": "xgboost",
+    "classification_report": {"accuracy": 0.9, "macro avg": {"f1-score": 0.88}, "CONFIRMED": {"precision": 0.9}},
+    "feature_importance": {"koi_score": 0.4, "koi_prad": 0.1},
+}
+
+@pytest.fixture
+def completed_job(load_function, fakes):
+    gcp_utils = load_function("trainer", "common.gcp_utils")
+    fakes["firestore"].collection("exo_scout_models").document("job-1").set({"job_id": "job-1", "status": "training"})
+    gcp_utils.update_firestore_metadata("job-1", "gs://models/models/job-1/bundle/manifest.json", METADATA, bucket_name="models")
+    return fakes["firestore"].collection("exo_scout_models").document("job-1").get().to_dict()
+
+def test_job_document_keeps_only_headline_metrics(completed_job, fakes):
+    results = completed_job["results"]
+    assert results["f1_score"] == 0.91 and results["accuracy"] == 0.9 and results["macro_f1"] == 0.88
+    assert "classification_report" not in results and "feature_importance" not in results
+    assert results["results_sidecar_path"] == "gs://models/models/job-1/results.json.gz"
+    assert completed_job["status"] == "completed"
+
+@pytest.fixture
+def jobs_api(completed_job, load_function):
+    return load_function("crud_jobs")
+
+def _get(call, main, path):
+    return call(main.jobs_crud, method="GET", path=path)
+
+def test_results_route_merges_the_sidecar(jobs_api, call):
+    results = _get(call, jobs_api, "/jobs/job-1/results").get_json()
+    assert results["classification_report"]["CONFIRMED"] == {"precision": 0.9}
+    assert results["f1_score"] == 0.91
+
+def test_job_route_includes_sidecar_results_on_request(jobs_api, call):
+    plain = _get(call, jobs_api, "/jobs/job-1").get_json()
+    assert "feature_importance" not in plain["results"]
+    full = _get(call, jobs_api, "/jobs/job-1?include=results").get_json()
+    assert full["results"]["feature_importance"] == METADATA["feature_importance"]
+    assert full["results"]["classification_report"] == METADATA["classification_report"]
+    assert full["results"]["gcs_artifacts_path"].endswith("manifest.json")
+
+def test_legacy_document_without_sidecar_is_returned_as_is(jobs_api, fakes, call):
+    fakes["firestore"].collection("exo_scout_models").document("old").set(
+        {"status": "completed", "results": {"f1_score": 0.8, "classification_report": {"accuracy": 0.8}}})
+    body = _get(call, jobs_api, "/jobs/old?include=results").get_json()
+    assert body["results"]["classification_report"] == {"accuracy": 0.8}
+
+def test_unknown_include_is_rejected(jobs_api, call):
+    assert _get(call, jobs_api, "/jobs/job-1?include=everything").status_code == 400
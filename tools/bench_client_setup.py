@@ -0,0 +1,57 @@
+# tools/bench_client_setup.py
+#
+# Mide el coste por petición de obtener los clientes de GCP:
+#   - antes: un cliente nuevo por petición (autenticación y canal TLS/gRPC cada vez)
+#   - después: el registro compartido de common/clients.py
+#
+# Requiere credenciales por defecto de la aplicación (gcloud auth application-default login).
+# Los clientes abren el canal de forma perezosa, así que con --rpc cada petición
+# hace además una llamada mínima para que el coste de conexión cuente.
+# Uso: python tools/bench_client_setup.py --requests 20 --clients firestore storage --rpc
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions", "trainer"))
+from common import clients  # noqa: E402
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+# Llamadas mínimas por tipo de cliente para forzar la conexión
+_PROBES = {
+    "firestore": lambda c: c.collection("exo_scout_models").limit(1).get(),
+    "storage": lambda c: c.bucket(os.environ.get("MODEL_BUCKET_NAME", "exoplanets-nasa-models")).exists(),
+    "tasks": lambda c: None,
+}
+
+def _measure(label, acquire, n_requests, names, rpc):
+    timings = []
+    for _ in range(n_requests):
+        started = time.perf_counter()
+        for name in names:
+            client = acquire(name)
+            if rpc:
+                _PROBES[name](client)
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"{label:<10} media={statistics.mean(timings):8.2f} ms  p50={_percentile(timings, 50):8.2f} ms  "
+          f"p95={_percentile(timings, 95):8.2f} ms  primera={timings[0]:8.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Coste por petición de obtener los clientes de GCP.")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--clients", nargs="+", default=["firestore", "storage"], choices=["firestore", "storage", "tasks"])
+    parser.add_argument("--rpc", action="store_true", help="Hacer una llamada mínima con cada cliente.")
+    args = parser.parse_args()
+
+    _measure("antes", lambda name: clients._DEFAULT_FACTORIES[name](), args.requests, args.clients, args.rpc)
+    clients.reset()
+    _measure("después", clients.get_client, args.requests, args.clients, args.rpc)
+    print(f"Creación única por proceso: {clients.setup_stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,672 @@
+# tools/fake_gcp.py
+#
+# Dobles en memoria de Firestore, Cloud Storage y Cloud Tasks para ejecutar las
+# funciones en local sin credenciales de GCP. Cubren solo la parte de la API que
+# usa este repositorio.
+#
+# Uso (desde la carpeta de una función):
+#   PYTHONPATH=../../tools EXO_CLIENT_BACKEND=fake_gcp:install \
+#       functions-framework --target=predictor_function
+
+import copy
+import hashlib
+import io
+import itertools
+import os
+import pickle
+import threading
+import urllib.parse
+import uuid
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta, timezone
+
+try:
+    from google.cloud.firestore_v1 import transforms as _transforms
+except ImportError:  # Las funciones sin Firestore no lo tienen instalado
+    _transforms = None
+
+_clock_lock = threading.Lock()
+_last_timestamp = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+def _now():
+    """Marca de tiempo estrictamente creciente, como el 'update_time' de Firestore."""
+    global _last_timestamp
+    with _clock_lock:
+        now = datetime.now(timezone.utc)
+        if now <= _last_timestamp:
+            now = _last_timestamp + timedelta(microseconds=1)
+        _last_timestamp = now
+        return now
+
+# =============================================================================
+# FIRESTORE
+# =============================================================================
+
+def _get_path(data, field_path):
+    value = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            raise KeyError(field_path)
+        value = value[part]
+    return value
+
+def _apply_value(target, key, value, now):
+    if _transforms is not None:
+        if value is _transforms.SERVER_TIMESTAMP:
+            target[key] = now
+            return
+        if value is _transforms.DELETE_FIELD:
+            target.pop(key, None)
+            return
+        if isinstance(value, _transforms.Increment):
+            target[key] = target.get(key, 0) + value.value
+            return
+        if isinstance(value, _transforms.ArrayUnion):
+            current = list(target.get(key, []))
+            target[key] = current + [v for v in value.values if v not in current]
+            return
+        if isinstance(value, _transforms.ArrayRemove):
+            target[key] = [v for v in target.get(key, []) if v not in value.values]
+            return
+    if isinstance(value, dict):
+        nested = {}
+        for k, v in value.items():
+            _apply_value(nested, k, v, now)
+        target[key] = nested
+    else:
+        target[key] = copy.deepcopy(value)
+
+def _set_path(data, field_path, value, now):
+    parts = field_path.split(".")
+    target = data
+    for part in parts[:-1]:
+        if not isinstance(target.get(part), dict):
+            target[part] = {}
+        target = target[part]
+    _apply_value(target, parts[-1], value, now)
+
+def _merge(target, updates, now):
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value, now)
+        else:
+            _apply_value(target, key, value, now)
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = _now()
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        if self._data is None:
+            return None
+        return copy.deepcopy(_get_path(self._data, field_path))
+
+class FakeDocumentReference:
+    def __init__(self, client, collection_path, doc_id):
+        self._client = client
+        self.id = doc_id
+        self.path = f"{collection_path}/{doc_id}"
+        self._collection_path = collection_path
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self._client, self._collection_path)
+
+    def collection(self, name):
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None):
+        return self._client._snapshot(self)
+
+    def set(self, data, merge=False):
+        self._client._write(self, data, mode="merge" if merge else "set")
+
+    def create(self, data):
+        self._client._write(self, data, mode="create")
+
+    def update(self, updates):
+        self._client._write(self, updates, mode="update")
+
+    def delete(self):
+        self._client._delete(self)
+
+class FakeQuery:
+    def __init__(self, client, collection_path, filters=(), orders=(), limit=None, projection=None, cursor=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._projection = projection
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                     projection=self._projection, cursor=self._cursor)
+        state.update(changes)
+        return FakeQuery(self._client, self._collection_path, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    def start_after(self, document_fields):
+        return self._copy(cursor=document_fields)
+
+    def stream(self, transaction=None):
+        return iter(self._client._run_query(self))
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.rsplit("/", 1)[-1]
+        self._path = path
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._client, self._path, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data, document_id=None):
+        doc_ref = self.document(document_id)
+        doc_ref.create(data)
+        return self._client._docs[doc_ref.path]["update_time"], doc_ref
+
+    def list_documents(self):
+        prefix = self._path + "/"
+        return [FakeDocumentReference(self._client, self._path, path[len(prefix):])
+                for path in list(self._client._docs) if path.startswith(prefix) and "/" not in path[len(prefix):]]
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append((reference, data, "merge" if merge else "set"))
+
+    def create(self, reference, data):
+        self._writes.append((reference, data, "create"))
+
+    def update(self, reference, updates):
+        self._writes.append((reference, updates, "update"))
+
+    def delete(self, reference):
+        self._writes.append((reference, None, "delete"))
+
+    def commit(self):
+        with self._client._lock:
+            for reference, data, mode in self._writes:
+                if mode == "delete":
+                    self._client._delete(reference)
+                else:
+                    self._client._write(reference, data, mode)
+        self._writes = []
+
+class FakeTransaction(FakeWriteBatch):
+    """Transacción mínima: las escrituras se aplican juntas al terminar."""
+    def __init__(self, client):
+        super().__init__(client)
+        self._max_attempts = 1
+        self._id = None
+        self._read_only = False
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, FakeDocumentReference):
+            return iter([ref_or_query.get()])
+        return ref_or_query.stream()
+
+    def get_all(self, references, **kwargs):
+        return iter([ref.get() for ref in references])
+
+    # Protocolo que usa @firestore.transactional. Las transacciones se serializan
+    # con el lock del cliente, que se mantiene desde _begin hasta _commit/_rollback.
+    def _clean_up(self):
+        self._writes = []
+
+    def _begin(self, retry_id=None):
+        self._client._lock.acquire()
+        self._id = uuid.uuid4().bytes
+
+    def _commit(self):
+        try:
+            self.commit()
+        finally:
+            self._release()
+
+    def _rollback(self):
+        self._writes = []
+        self._release()
+
+    def _release(self):
+        if self._id is not None:
+            self._id = None
+            self._client._lock.release()
+
+class FakeFirestoreClient:
+    def __init__(self, project="exo-local"):
+        self.project = project
+        self._docs = {}
+        self._lock = threading.RLock()
+
+    def collection(self, path):
+        return FakeCollectionReference(self, path)
+
+    def document(self, path):
+        collection_path, doc_id = path.rsplit("/", 1)
+        return FakeDocumentReference(self, collection_path, doc_id)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        return [ref.get() for ref in references]
+
+    def collections(self):
+        return [FakeCollectionReference(self, p) for p in sorted({path.split("/")[0] for path in self._docs})]
+
+    # --- Implementación interna ---
+    def _snapshot(self, reference):
+        with self._lock:
+            record = self._docs.get(reference.path)
+            if record is None:
+                return FakeDocumentSnapshot(reference, None)
+            return FakeDocumentSnapshot(reference, copy.deepcopy(record["data"]), record["create_time"], record["update_time"])
+
+    def _write(self, reference, data, mode):
+        with self._lock:
+            now = _now()
+            record = self._docs.get(reference.path)
+            if mode == "create" and record is not None:
+                raise ValueError(f"409 Document already exists: {reference.path}")
+            if mode == "update":
+                if record is None:
+                    raise ValueError(f"404 No document to update: {reference.path}")
+                new_data = copy.deepcopy(record["data"])
+                for field_path, value in data.items():
+                    _set_path(new_data, field_path, value, now)
+            elif mode == "merge" and record is not None:
+                new_data = copy.deepcopy(record["data"])
+                _merge(new_data, data, now)
+            else:
+                new_data = {}
+                _merge(new_data, data, now)
+            self._docs[reference.path] = {
+                "data": new_data,
+                "create_time": record["create_time"] if record else now,
+                "update_time": now,
+            }
+
+    def _delete(self, reference):
+        with self._lock:
+            self._docs.pop(reference.path, None)
+
+    def _run_query(self, query):
+        prefix = query._collection_path + "/"
+        with self._lock:
+            rows = [
+                (FakeDocumentReference(self, query._collection_path, path[len(prefix):]), copy.deepcopy(record))
+                for path, record in self._docs.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+            ]
+
+        def field_value(ref, data, field_path):
+            return ref.id if field_path == "__name__" else _get_path(data, field_path)
+
+        matched = []
+        for ref, record in rows:
+            data = record["data"]
+            try:
+                if all(_compare(field_value(ref, data, f), op, v) for f, op, v in query._filters):
+                    for field_path, _ in query._orders:
+                        field_value(ref, data, field_path)  # Firestore excluye los que no tienen el campo
+                    matched.append((ref, record))
+            except KeyError:
+                continue
+
+        orders = list(query._orders)
+        if not any(f == "__name__" for f, _ in orders):
+            orders.append(("__name__", orders[-1][1] if orders else "ASCENDING"))
+        for field_path, direction in reversed(orders):
+            matched.sort(key=lambda item: _sort_key(field_value(item[0], item[1]["data"], field_path)),
+                         reverse=direction == "DESCENDING")
+
+        if query._cursor is not None:
+            cursor = query._cursor
+            if isinstance(cursor, FakeDocumentSnapshot):
+                cursor = {**cursor.to_dict(), "__name__": cursor.id}
+            values = []
+            for field_path, direction in orders:
+                if field_path == "__name__" and field_path in cursor:
+                    value = cursor[field_path]
+                    values.append((field_path, direction, getattr(value, "id", value)))
+                elif field_path in cursor:
+                    values.append((field_path, direction, cursor[field_path]))
+                else:
+                    break
+
+            def after_cursor(item):
+                for field_path, direction, value in values:
+                    current = _sort_key(field_value(item[0], item[1]["data"], field_path))
+                    target = _sort_key(value)
+                    if current != target:
+                        return current < target if direction == "DESCENDING" else current > target
+                return False
+            matched = [item for item in matched if after_cursor(item)]
+
+        if query._limit is not None:
+            matched = matched[:query._limit]
+
+        snapshots = []
+        for ref, record in matched:
+            data = record["data"]
+            if query._projection is not None:
+                projected = {}
+                for field_path in query._projection:
+                    try:
+                        _set_path(projected, field_path, _get_path(data, field_path), None)
+                    except KeyError:
+                        pass
+                data = projected
+            snapshots.append(FakeDocumentSnapshot(ref, data, record["create_time"], record["update_time"]))
+        return snapshots
+
+def _sort_key(value):
+    # Orden entre tipos de Firestore: null < bool < número < fecha < texto < resto
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value.timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    return (5, str(value))
+
+def _compare(value, op, target):
+    if op == "==":
+        return value == target
+    if op == "!=":
+        return value != target
+    if op == "in":
+        return value in target
+    if op == "not-in":
+        return value not in target
+    if op == "array_contains":
+        return isinstance(value, list) and target in value
+    if op == "array_contains_any":
+        return isinstance(value, list) and any(t in value for t in target)
+    a, b = _sort_key(value), _sort_key(target)
+    if a[0] != b[0]:
+        return False
+    return {"<": a < b, "<=": a <= b, ">": a > b, ">=": a >= b}[op]
+
+# =============================================================================
+# CLOUD STORAGE
+# =============================================================================
+
+class _BlobWriter(io.BytesIO):
+    def __init__(self, blob):
+        super().__init__()
+        self._blob = blob
+
+    def close(self):
+        if not self.closed:
+            self._blob.upload_from_string(self.getvalue())
+        super().close()
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.content_type = None
+        self.content_encoding = None
+        self.metadata = None
+
+    @property
+    def _store(self):
+        return self.bucket.client._objects
+
+    @property
+    def _key(self):
+        return (self.bucket.name, self.name)
+
+    @property
+    def size(self):
+        record = self._store.get(self._key)
+        return len(record["data"]) if record else None
+
+    @property
+    def md5_hash(self):
+        record = self._store.get(self._key)
+        return record["md5"] if record else None
+
+    @property
+    def updated(self):
+        record = self._store.get(self._key)
+        return record["updated"] if record else None
+
+    @property
+    def time_created(self):
+        return self.updated
+
+    def reload(self, **kwargs):
+        if self._key not in self._store:
+            raise FileNotFoundError(f"404 gs://{self.bucket.name}/{self.name}")
+
+    def exists(self, **kwargs):
+        return self._key in self._store
+
+    def upload_from_string(self, data, content_type=None, **kwargs):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._store[self._key] = {
+            "data": bytes(data),
+            "md5": hashlib.md5(data).hexdigest(),
+            "updated": _now(),
+            "content_type": content_type or self.content_type,
+            "metadata": dict(self.metadata or {}),
+        }
+
+    def upload_from_file(self, file_obj, content_type=None, **kwargs):
+        self.upload_from_string(file_obj.read(), content_type=content_type)
+
+    def upload_from_filename(self, filename, content_type=None, **kwargs):
+        with open(filename, "rb") as f:
+            self.upload_from_string(f.read(), content_type=content_type)
+
+    def download_as_bytes(self, start=None, end=None, **kwargs):
+        record = self._store.get(self._key)
+        if record is None:
+            raise FileNotFoundError(f"404 gs://{self.bucket.name}/{self.name}")
+        data = record["data"]
+        if start is not None or end is not None:
+            data = data[start or 0:(end + 1) if end is not None else None]
+        return data
+
+    def download_as_text(self, **kwargs):
+        return self.download_as_bytes().decode("utf-8")
+
+    def download_to_filename(self, filename, **kwargs):
+        with open(filename, "wb") as f:
+            f.write(self.download_as_bytes())
+
+    def download_to_file(self, file_obj, **kwargs):
+        file_obj.write(self.download_as_bytes())
+
+    def open(self, mode="rb", **kwargs):
+        if "w" in mode:
+            writer = _BlobWriter(self)
+            return io.TextIOWrapper(writer, encoding="utf-8") if "b" not in mode else writer
+        data = io.BytesIO(self.download_as_bytes())
+        return io.TextIOWrapper(data, encoding="utf-8") if "b" not in mode else data
+
+    def delete(self, **kwargs):
+        if self._store.pop(self._key, None) is None:
+            raise FileNotFoundError(f"404 gs://{self.bucket.name}/{self.name}")
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def blob(self, blob_name, **kwargs):
+        return FakeBlob(self, blob_name)
+
+    def get_blob(self, blob_name, **kwargs):
+        blob = FakeBlob(self, blob_name)
+        return blob if blob.exists() else None
+
+    def list_blobs(self, prefix=None, **kwargs):
+        return self.client.list_blobs(self, prefix=prefix, **kwargs)
+
+    def delete_blobs(self, blobs, on_error=None, **kwargs):
+        for blob in blobs:
+            try:
+                blob.delete()
+            except FileNotFoundError:
+                if on_error is None:
+                    raise
+                on_error(blob)
+
+class FakeStorageClient:
+    def __init__(self, project="exo-local"):
+        self.project = project
+        self._objects = {}
+
+    def bucket(self, bucket_name):
+        return FakeBucket(self, bucket_name)
+
+    def get_bucket(self, bucket_name):
+        return FakeBucket(self, bucket_name)
+
+    def list_blobs(self, bucket_or_name, prefix=None, max_results=None, **kwargs):
+        bucket = bucket_or_name if isinstance(bucket_or_name, FakeBucket) else FakeBucket(self, bucket_or_name)
+        names = sorted(name for (b, name) in list(self._objects) if b == bucket.name and name.startswith(prefix or ""))
+        return [FakeBlob(bucket, name) for name in itertools.islice(names, max_results)]
+
+class _FileObjectStore(MutableMapping):
+    """Objetos de FakeStorageClient guardados en disco: un fichero por objeto."""
+    def __init__(self, root):
+        self._root = root
+
+    def _path(self, key):
+        bucket_name, name = key
+        return os.path.join(self._root, bucket_name, urllib.parse.quote(name, safe=""))
+
+    def __getitem__(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, record):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)  # Otro proceso puede estar leyendo el mismo objeto
+
+    def __delitem__(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def __iter__(self):
+        if not os.path.isdir(self._root):
+            return
+        for bucket_name in os.listdir(self._root):
+            for filename in os.listdir(os.path.join(self._root, bucket_name)):
+                if not filename.endswith(".tmp"):
+                    yield bucket_name, urllib.parse.unquote(filename)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+class FileStorageClient(FakeStorageClient):
+    """
+    Como FakeStorageClient, pero con los objetos en 'root'. Varios procesos que
+    usen la misma carpeta ven los mismos objetos.
+    """
+    def __init__(self, root, project="exo-local"):
+        super().__init__(project=project)
+        self._objects = _FileObjectStore(root)
+
+# =============================================================================
+# CLOUD TASKS
+# =============================================================================
+
+class FakeTask:
+    def __init__(self, name, task):
+        self.name = name
+        self.task = task
+
+class FakeTasksClient:
+    """Guarda las tareas creadas; un 'dispatcher' opcional las ejecuta al encolarlas."""
+    def __init__(self, dispatcher=None):
+        self.tasks = []
+        self.dispatcher = dispatcher
+
+    @staticmethod
+    def queue_path(project, location, queue):
+        return f"projects/{project}/locations/{location}/queues/{queue}"
+
+    def create_task(self, parent=None, task=None, request=None, **kwargs):
+        if request is not None:
+            parent, task = request["parent"], request["task"]
+        created = FakeTask(f"{parent}/tasks/{uuid.uuid4().hex}", task)
+        self.tasks.append(created)
+        if self.dispatcher is not None:
+            self.dispatcher(task)
+        return created
+
+# =============================================================================
+# INSTALACIÓN
+# =============================================================================
+
+def install(clients, firestore=None, storage=None, tasks=None):
+    """
+    Registra los dobles en common/clients.py. Pensado para EXO_CLIENT_BACKEND
+    ('fake_gcp:install'); devuelve los clientes para poder sembrar datos.
+    """
+    fakes = {
+        "firestore": firestore or FakeFirestoreClient(),
+        "storage": storage or FakeStorageClient(),
+        "tasks": tasks or FakeTasksClient(),
+    }
+    clients.install_backend(**fakes)
+    return fakes
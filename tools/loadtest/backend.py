@@ -0,0 +1,74 @@
+# tools/loadtest/backend.py
+#
+# Backend de clientes para las pruebas de carga (EXO_CLIENT_BACKEND=backend:install).
+# Todos los procesos comparten la carpeta EXO_LOADTEST_STATE:
+#   - gcs/: Cloud Storage en disco (fake_gcp.FileStorageClient), visible entre procesos.
+#   - firestore.pkl: documentos sembrados por seed.py. Cada proceso los carga en
+#     su propio FakeFirestoreClient; lo que escribe un proceso no lo ven los demás.
+#   - seed.json: parámetros con los que seed.py preparó la carpeta.
+# Cloud Tasks se sustituye por FakeTasksClient sin dispatcher (solo cuenta las tareas).
+
+import os
+import pickle
+import time
+
+import fake_gcp
+
+STATE_ENV_VAR = "EXO_LOADTEST_STATE"
+FIRESTORE_SNAPSHOT = "firestore.pkl"
+SEED_INFO = "seed.json"
+STORAGE_DIR = "gcs"
+
+def state_dir():
+    path = os.environ.get(STATE_ENV_VAR)
+    if not path:
+        raise RuntimeError(f"La variable de entorno {STATE_ENV_VAR} no está configurada.")
+    return path
+
+def save_firestore(firestore_client, path=None):
+    """Guarda los documentos de un FakeFirestoreClient para que los carguen los servidores."""
+    path = path or state_dir()
+    with open(os.path.join(path, FIRESTORE_SNAPSHOT), "wb") as f:
+        pickle.dump(firestore_client._docs, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_firestore(path=None):
+    client = fake_gcp.FakeFirestoreClient()
+    snapshot = os.path.join(path or state_dir(), FIRESTORE_SNAPSHOT)
+    if os.path.exists(snapshot):
+        with open(snapshot, "rb") as f:
+            client._docs.update(pickle.load(f))
+    return client
+
+def install(clients):
+    path = state_dir()
+    return fake_gcp.install(
+        clients,
+        firestore=load_firestore(path),
+        storage=fake_gcp.FileStorageClient(os.path.join(path, STORAGE_DIR)),
+        tasks=fake_gcp.FakeTasksClient(),
+    )
+
+class _GeminiResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGeminiModel:
+    """
+    Sustituye a GenerativeModel en el orquestador: reconoce la fuente por las
+    mismas "huellas" de columnas que describe el prompt, con una latencia fija
+    opcional para simular la llamada a Vertex AI.
+    """
+    def __init__(self, latency_seconds=0.0):
+        self.latency_seconds = latency_seconds
+
+    def generate_content(self, prompt):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        columns = prompt.rsplit("**Columnas a analizar:**", 1)[-1]
+        if "koi_" in columns:
+            return _GeminiResponse("kepler")
+        if "disc_facility" in columns or "discoverymethod" in columns:
+            return _GeminiResponse("k2")
+        if "toi" in columns or "tfopwg_disp" in columns:
+            return _GeminiResponse("tess")
+        return _GeminiResponse("unknown")
@@ -0,0 +1,113 @@
+# tools/loadtest/bench_microbatch.py
+#
+# Compara el predictor con y sin micro-batching (functions/predictor/microbatch.py)
+# bajo peticiones interactivas pequeñas y concurrentes. Levanta un servidor del
+# predictor por cada ventana de --windows (0 = ruta actual, una petición por
+# llamada a predict_proba) con el mismo estado que run_loadtest.py, y mide el
+# throughput y la latencia p50/p95/p99 de cada uno. Las peticiones llevan
+# 'Cache-Control: no-cache' para que todas puntúen el modelo.
+#
+# Uso:
+#   python tools/loadtest/bench_microbatch.py --concurrency 16 --rows 1 --windows 0 2 5 10
+#   python tools/loadtest/bench_microbatch.py --variant fast --max-rows 128 --output /tmp/microbatch.json
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE]
+
+import datasets  # noqa: E402
+from datasets import SEEDED_JOBS  # noqa: E402
+from run_loadtest import _run_endpoint, _start_server  # noqa: E402
+
+class MicrobatchScenario:
+    """Peticiones de --rows filas al modelo sembrado de --data-source, sin caché de resultados."""
+    def __init__(self, args):
+        self.args = args
+        self.payloads = [datasets.csv_payload(args.data_source, args.rows, seed=1000 + v, labels=False)
+                         for v in range(args.payload_variants)]
+
+    def predictor(self, session, base_url, i):
+        return session.post(f"{base_url}/", files={"file": ("input.csv", self.payloads[i % len(self.payloads)], "text/csv")},
+                            data={"job_id": SEEDED_JOBS[self.args.data_source], "variant": self.args.variant},
+                            headers={"Cache-Control": "no-cache"}, timeout=self.args.timeout)
+
+def _print_report(results, baseline_window):
+    print(f"\n{'ventana ms':>10}{'peticiones':>11}{'errores':>9}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for window, summary in results.items():
+        print(f"{window:>10}{summary['requests']:>11}{summary['errors']:>9}{summary['throughput_rps']:>10.1f}"
+              f"{summary.get('p50_ms', float('nan')):>10.1f}{summary.get('p95_ms', float('nan')):>10.1f}"
+              f"{summary.get('p99_ms', float('nan')):>10.1f}")
+    reference = results.get(baseline_window)
+    for window, summary in results.items():
+        phases = ", ".join(f"{phase}={ms:.1f}" for phase, ms in summary["server_phases_ms"].items())
+        print(f"  ventana {window} fases (media ms): {phases or 'sin Server-Timing'}")
+        if reference and window != baseline_window and reference["throughput_rps"] and "p95_ms" in summary:
+            print(f"    frente a {baseline_window} ms: throughput x{summary['throughput_rps'] / reference['throughput_rps']:.2f}, "
+                  f"p95 {summary['p95_ms'] - reference['p95_ms']:+.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Predictor con y sin micro-batching.")
+    parser.add_argument("--windows", nargs="+", type=float, default=[0, 2, 5, 10],
+                        help="Valores de PREDICT_MICROBATCH_WINDOW_MS a comparar (0 = sin micro-batching).")
+    parser.add_argument("--max-rows", type=int, default=256, help="PREDICT_MICROBATCH_MAX_ROWS.")
+    parser.add_argument("--variant", default="full", choices=["full", "fast"])
+    parser.add_argument("--concurrency", type=int, default=16, help="Peticiones en vuelo.")
+    parser.add_argument("--duration", type=float, default=15.0, help="Segundos de carga por ventana.")
+    parser.add_argument("--requests", type=int, default=0, help="Máximo de peticiones por ventana (0 = sin límite).")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--rows", type=int, default=1, help="Filas por CSV enviado.")
+    parser.add_argument("--data-source", default="kepler", choices=sorted(SEEDED_JOBS))
+    parser.add_argument("--payload-variants", type=int, default=64, help="CSV distintos enviados en rotación.")
+    parser.add_argument("--server-workers", type=int, default=1)
+    parser.add_argument("--server-threads", type=int, default=16)
+    parser.add_argument("--state", default="/tmp/exo-loadtest", help="Carpeta de estado (la de run_loadtest.py).")
+    parser.add_argument("--reseed", action="store_true", help="Volver a entrenar los modelos sembrados.")
+    parser.add_argument("--train-rows", type=int, default=3000)
+    parser.add_argument("--output", help="Guardar los resultados en este JSON.")
+    args = parser.parse_args()
+    args.gemini_latency = 0.0
+
+    state = os.path.abspath(args.state)
+    log_dir = os.path.join(state, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    if args.reseed or not os.path.exists(os.path.join(state, "firestore.pkl")):
+        subprocess.run([sys.executable, os.path.join(HERE, "seed.py"), "--state", state,
+                        "--train-rows", str(args.train_rows)], check=True, stdout=subprocess.DEVNULL)
+
+    scenario = MicrobatchScenario(args)
+    results = {}
+    for window in args.windows:
+        label = f"{window:g}"
+        extra_env = {
+            "PREDICT_MICROBATCH_WINDOW_MS": str(window),
+            "PREDICT_MICROBATCH_MAX_ROWS": str(args.max_rows),
+            # Solo el nivel en memoria: no mezclar la escritura en disco de la caché con la medida
+            "PREDICTION_CACHE_DURABLE": "false",
+        }
+        process, base_url = _start_server("predictor", state, log_dir, args, extra_env=extra_env,
+                                          log_name=f"predictor-microbatch-{label}")
+        try:
+            print(f"Cargando el predictor con ventana de {label} ms ({args.concurrency} en paralelo, {args.duration:.0f} s)...")
+            results[label] = _run_endpoint("predictor", base_url, scenario, args)
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    _print_report(results, f"{args.windows[0]:g}")
+    if args.output:
+        settings = {key: getattr(args, key) for key in ("windows", "max_rows", "variant", "concurrency", "duration",
+                                                        "rows", "data_source", "server_workers", "server_threads")}
+        with open(args.output, "w") as f:
+            json.dump({"settings": settings, "windows": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# tools/loadtest/datasets.py
+#
+# CSV sintéticos con el formato de las exportaciones del NASA Exoplanet Archive
+# (cabecera de comentarios '#', columnas 'koi_*' de Kepler o 'pl_*'/'st_*' de K2)
+# y distribuciones de valores parecidas a las reales, incluidos los nulos.
+
+import numpy as np
+import pandas as pd
+
+ARCHIVE_HEADER = (
+    "# This file was produced by the NASA Exoplanet Archive  http://exoplanetarchive.ipac.caltech.edu\n"
+    "# Datos sintéticos generados por tools/loadtest para pruebas de carga\n"
+)
+# job_id fijo de los modelos que entrena seed.py, por fuente de datos
+SEEDED_JOBS = {"kepler": "loadtest-kepler", "k2": "loadtest-k2"}
+DISPOSITIONS = ["CONFIRMED", "CANDIDATE", "FALSE POSITIVE"]
+NULL_RATE = 0.05
+
+def _with_nulls(rng, df, columns, rate=NULL_RATE):
+    for column in columns:
+        df.loc[rng.random(len(df)) < rate, column] = np.nan
+    return df
+
+def kepler_frame(n_rows, seed=0, labels=True):
+    rng = np.random.default_rng(seed)
+    disposition = rng.choice(DISPOSITIONS, n_rows, p=[0.3, 0.25, 0.45])
+    false_positive = disposition == "FALSE POSITIVE"
+    confirmed = disposition == "CONFIRMED"
+    period = rng.lognormal(2.5, 1.3, n_rows).clip(0.3, 1500)
+    srad = rng.lognormal(0, 0.3, n_rows)
+    prad = rng.lognormal(0.8 + 1.2 * false_positive, 0.9, n_rows)
+    df = pd.DataFrame({
+        "kepid": rng.integers(757_000, 12_900_000, n_rows),
+        "kepoi_name": [f"K{i // 10 + 1:05d}.{i % 10 + 1:02d}" for i in range(n_rows)],
+        "koi_fpflag_nt": (false_positive & (rng.random(n_rows) < 0.4)).astype(int),
+        "koi_fpflag_ss": (false_positive & (rng.random(n_rows) < 0.5)).astype(int),
+        "koi_fpflag_co": (false_positive & (rng.random(n_rows) < 0.35)).astype(int),
+        "koi_fpflag_ec": (false_positive & (rng.random(n_rows) < 0.15)).astype(int),
+        "koi_score": np.where(false_positive, rng.beta(1, 6, n_rows), rng.beta(5 + 3 * confirmed, 1.5, n_rows)).round(3),
+        "koi_period": period.round(6),
+        "koi_prad": prad.round(2),
+        "koi_teq": (1400 * period ** -0.33 * rng.normal(1, 0.1, n_rows)).round(0),
+        "koi_insol": rng.lognormal(3.5, 2.0, n_rows).round(2),
+        "koi_sma": (0.0197 * period ** (2 / 3)).round(4),
+        "koi_eccen": np.zeros(n_rows),
+        "koi_incl": rng.uniform(80, 90, n_rows).round(2),
+        "koi_duration": rng.lognormal(1.3, 0.5, n_rows).round(4),
+        "koi_depth": rng.lognormal(6.0 + 1.5 * false_positive, 1.4, n_rows).round(1),
+        "koi_ror": (prad / (srad * 109.1)).round(5),
+        "koi_impact": rng.uniform(0, 1.2, n_rows).round(3),
+        "koi_model_snr": rng.lognormal(3.2 + 0.5 * confirmed, 1.0, n_rows).round(1),
+        "koi_steff": rng.normal(5600, 800, n_rows).round(0),
+        "koi_slogg": rng.normal(4.4, 0.25, n_rows).round(3),
+        "koi_srad": srad.round(3),
+        "koi_smass": rng.lognormal(0, 0.2, n_rows).round(3),
+        "koi_smet": rng.normal(0, 0.25, n_rows).round(2),
+        "koi_count": rng.integers(1, 7, n_rows),
+        "koi_num_transits": (1400 / period).astype(int).clip(1, 3000),
+    })
+    _with_nulls(rng, df, ["koi_score", "koi_teq", "koi_insol", "koi_depth", "koi_model_snr", "koi_steff", "koi_slogg", "koi_srad", "koi_smet"])
+    if labels:
+        df.insert(2, "koi_disposition", disposition)
+    return df
+
+def k2_frame(n_rows, seed=0, labels=True):
+    rng = np.random.default_rng(seed)
+    disposition = rng.choice(DISPOSITIONS, n_rows, p=[0.45, 0.4, 0.15])
+    false_positive = disposition == "FALSE POSITIVE"
+    period = rng.lognormal(2.2, 1.1, n_rows).clip(0.3, 500)
+    rade = rng.lognormal(0.9 + 1.0 * false_positive, 0.8, n_rows)
+    bmasse = rade ** 2.06 * rng.lognormal(0, 0.4, n_rows)
+    df = pd.DataFrame({
+        "pl_name": [f"K2-{i + 1} b" for i in range(n_rows)],
+        "hostname": [f"K2-{i + 1}" for i in range(n_rows)],
+        "discoverymethod": "Transit",
+        "disc_year": rng.integers(2014, 2024, n_rows),
+        "disc_facility": "K2",
+        "pl_orbper": period.round(6),
+        "pl_rade": rade.round(2),
+        "pl_radj": (rade / 11.21).round(3),
+        "pl_bmasse": bmasse.round(2),
+        "pl_bmassj": (bmasse / 317.8).round(4),
+        "pl_orbeccen": rng.beta(1, 8, n_rows).round(3),
+        "pl_orbsmax": (0.0197 * period ** (2 / 3)).round(4),
+        "pl_insol": rng.lognormal(3.0, 1.8, n_rows).round(2),
+        "pl_eqt": (1300 * period ** -0.33 * rng.normal(1, 0.1, n_rows)).round(0),
+        "st_teff": rng.normal(5200, 900, n_rows).round(0),
+        "st_rad": rng.lognormal(-0.1, 0.3, n_rows).round(3),
+        "st_mass": rng.lognormal(-0.1, 0.2, n_rows).round(3),
+        "st_met": rng.normal(0, 0.2, n_rows).round(2),
+        "st_logg": rng.normal(4.5, 0.2, n_rows).round(3),
+        "pl_controv_flag": (rng.random(n_rows) < 0.05).astype(int),
+        "ttv_flag": (rng.random(n_rows) < 0.08).astype(int),
+    })
+    _with_nulls(rng, df, ["pl_bmasse", "pl_bmassj", "pl_orbeccen", "pl_insol", "pl_eqt", "st_met", "st_mass"], rate=0.15)
+    if labels:
+        df.insert(2, "disposition", disposition)
+    return df
+
+FRAMES = {"kepler": kepler_frame, "k2": k2_frame}
+
+def csv_payload(data_source, n_rows, seed=0, labels=True):
+    """CSV listo para enviar, con la cabecera de comentarios del archivo de la NASA."""
+    return (ARCHIVE_HEADER + FRAMES[data_source](n_rows, seed=seed, labels=labels).to_csv(index=False)).encode("utf-8")
@@ -0,0 +1,371 @@
+# tools/loadtest/run_loadtest.py
+#
+# Prueba de carga local de los endpoints de servicio (predictor, orquestador y
+# Jobs API) sin GCP. Cada función corre en su propio proceso con el Functions
+# Framework (serve.py) sobre los dobles de backend.py; los modelos se entrenan
+# antes con el trainer real (seed.py).
+#
+# Para cada endpoint mantiene --concurrency peticiones en vuelo durante
+# --duration segundos e informa del throughput y de la latencia p50/p95/p99,
+# además del tiempo medio por fase según la cabecera Server-Timing. Con
+# --baseline compara contra una ejecución guardada y termina con código 1 si
+# alguna métrica empeora más de --tolerance.
+#
+# La baseline guarda los parámetros de la ejecución ('settings') y el comando
+# que la generó. Con --baseline, los parámetros que no se indican en la línea
+# de comandos se toman de ella; si alguno difiere, no se compara (código 2).
+#
+# Uso:
+#   python tools/loadtest/run_loadtest.py --concurrency 8 --duration 20
+#   python tools/loadtest/run_loadtest.py --reseed --save-baseline tools/loadtest/baseline.json
+#   python tools/loadtest/run_loadtest.py --baseline tools/loadtest/baseline.json
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+import backend  # noqa: E402
+import datasets  # noqa: E402
+from datasets import SEEDED_JOBS  # noqa: E402
+
+ENDPOINTS = ("predictor", "orchestrator", "jobs_crud")
+LATENCY_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+# Parámetros que determinan los resultados; se guardan en la baseline
+SETTINGS = ("endpoints", "concurrency", "duration", "requests", "warmup", "rows", "upload_rows", "data_source",
+            "payload_variants", "duplicate_rate", "gemini_latency", "server_workers", "server_threads", "train_rows")
+SERVER_START_TIMEOUT = 90
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _parse_server_timing(header):
+    phases = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        if params.startswith("dur="):
+            phases[name] = float(params[4:])
+    return phases
+
+# =============================================================================
+# ESCENARIOS
+# =============================================================================
+
+class Scenarios:
+    """Genera la petición i-ésima de cada endpoint con cargas realistas."""
+    def __init__(self, args):
+        self.args = args
+        sources = ["kepler", "k2"] if args.data_source == "mixed" else [args.data_source]
+        # Varias cargas distintas por fuente, para no medir solo respuestas repetidas
+        self.predict_payloads = [
+            (source, datasets.csv_payload(source, args.rows, seed=100 + v, labels=False))
+            for v in range(args.payload_variants) for source in sources
+        ]
+        self.upload_payloads = [(source, datasets.csv_payload(source, args.upload_rows, seed=7)) for source in sources]
+        self.nonces = itertools.count(1)
+        self.run_id = f"{os.getpid()}-{int(time.time())}"
+        self.job_routes = [
+            "/jobs?view=summary&limit=50",
+            "/jobs?view=summary&limit=50&status=completed&data_source=kepler",
+            f"/jobs/{SEEDED_JOBS['kepler']}",
+            f"/jobs/{SEEDED_JOBS['k2']}/results",
+        ]
+
+    def predictor(self, session, base_url, i):
+        source, payload = self.predict_payloads[i % len(self.predict_payloads)]
+        return session.post(f"{base_url}/", files={"file": ("input.csv", payload, "text/csv")},
+                            data={"job_id": SEEDED_JOBS[source]}, timeout=self.args.timeout)
+
+    def orchestrator(self, session, base_url, i):
+        source, payload = self.upload_payloads[i % len(self.upload_payloads)]
+        # Una fracción de las subidas repite un fichero ya enviado (ruta idempotente)
+        nonce = 0 if random.random() < self.args.duplicate_rate else f"{self.run_id}-{next(self.nonces)}"
+        # El job_id es el SHA-256 del fichero: la línea de comentario lo hace único
+        body = f"# nonce: {nonce}\n".encode() + payload
+        return session.post(f"{base_url}/", files={"file": (f"{source}.csv", body, "text/csv")},
+                            data={"params": json.dumps({"algorithm": "random_forest"})}, timeout=self.args.timeout)
+
+    def jobs_crud(self, session, base_url, i):
+        return session.get(base_url + self.job_routes[i % len(self.job_routes)], timeout=self.args.timeout)
+
+# =============================================================================
+# SERVIDORES
+# =============================================================================
+
+def _start_server(name, state, log_dir, args, extra_env=None, log_name=None):
+    port = _free_port()
+    env = dict(os.environ, WORKERS=str(args.server_workers), THREADS=str(args.server_threads), **(extra_env or {}))
+    log = open(os.path.join(log_dir, f"{log_name or name}.log"), "wb")
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "serve.py"), "--function", name, "--port", str(port),
+         "--state", state, "--gemini-latency", str(args.gemini_latency)],
+        stdout=log, stderr=subprocess.STDOUT, env=env,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"El servidor de {name} terminó al arrancar; revisa {log.name}.")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"El servidor de {name} no arrancó en {SERVER_START_TIMEOUT} s; revisa {log.name}.")
+
+def _clean_uploads(state):
+    """Borra las subidas del orquestador de la carpeta de estado (conserva las sembradas)."""
+    prefix = urllib.parse.quote("raw-uploads/", safe="")
+    seeded = tuple(urllib.parse.quote(f"raw-uploads/{job_id}_", safe="") for job_id in SEEDED_JOBS.values())
+    gcs_dir = os.path.join(state, "gcs")
+    for bucket_name in os.listdir(gcs_dir) if os.path.isdir(gcs_dir) else []:
+        for filename in os.listdir(os.path.join(gcs_dir, bucket_name)):
+            if filename.startswith(prefix) and not filename.startswith(seeded):
+                os.remove(os.path.join(gcs_dir, bucket_name, filename))
+
+# =============================================================================
+# CARGA
+# =============================================================================
+
+def _run_endpoint(name, base_url, scenarios, args):
+    send = getattr(scenarios, name)
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    # Calentamiento: carga perezosa de artefactos, clientes y cachés
+    for i in range(args.warmup):
+        send(session(), base_url, i)
+
+    counter = itertools.count()
+    samples, lock = [], threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            i = next(counter)
+            if args.requests and i >= args.requests:
+                return
+            started = time.perf_counter()
+            try:
+                response = send(session(), base_url, i)
+                status, timing = response.status_code, response.headers.get("Server-Timing")
+            except requests.RequestException as e:
+                status, timing = f"{type(e).__name__}", None
+            latency_ms = (time.perf_counter() - started) * 1000
+            with lock:
+                samples.append((latency_ms, status, timing))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for _ in range(args.concurrency):
+            executor.submit(worker)
+    elapsed = time.perf_counter() - started
+    return _summarize(samples, elapsed)
+
+def _summarize(samples, elapsed):
+    ok = [latency for latency, status, _ in samples if isinstance(status, int) and status < 400]
+    statuses = defaultdict(int)
+    phases = defaultdict(float)
+    for _, status, timing in samples:
+        statuses[str(status)] += 1
+        for phase, ms in _parse_server_timing(timing).items():
+            phases[phase] += ms
+    summary = {
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": len(samples) - len(ok),
+        "statuses": dict(statuses),
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed > 0 else 0.0,
+        "server_phases_ms": {phase: round(total / len(samples), 2) for phase, total in phases.items()} if samples else {},
+    }
+    if ok:
+        summary.update({
+            "mean_ms": round(sum(ok) / len(ok), 2),
+            "p50_ms": round(_percentile(ok, 50), 2),
+            "p95_ms": round(_percentile(ok, 95), 2),
+            "p99_ms": round(_percentile(ok, 99), 2),
+        })
+    return summary
+
+# =============================================================================
+# INFORME Y BASELINE
+# =============================================================================
+
+def _settings(args):
+    return {key: getattr(args, key) for key in SETTINGS}
+
+def settings_mismatch(settings, baseline):
+    """Parámetros de esta ejecución que no coinciden con los de la baseline: [(clave, actual, baseline)]."""
+    reference = baseline.get("settings", {})
+    return [(key, settings[key], reference.get(key)) for key in SETTINGS if settings[key] != reference.get(key)]
+
+def _needs_seed(state, args):
+    try:
+        with open(os.path.join(state, backend.SEED_INFO)) as f:
+            seeded = json.load(f)
+    except FileNotFoundError:
+        return True
+    return seeded.get("train_rows") != args.train_rows
+
+def _print_report(results):
+    print(f"\n{'endpoint':<13}{'peticiones':>11}{'errores':>9}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, summary in results.items():
+        print(f"{name:<13}{summary['requests']:>11}{summary['errors']:>9}{summary['throughput_rps']:>10.1f}"
+              f"{summary.get('p50_ms', float('nan')):>10.1f}{summary.get('p95_ms', float('nan')):>10.1f}"
+              f"{summary.get('p99_ms', float('nan')):>10.1f}")
+    for name, summary in results.items():
+        phases = ", ".join(f"{phase}={ms:.1f}" for phase, ms in summary["server_phases_ms"].items())
+        print(f"  {name} fases (media ms): {phases or 'sin Server-Timing'}")
+        if summary["errors"]:
+            print(f"  {name} estados: {summary['statuses']}")
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Devuelve la lista de regresiones: latencias por encima de base*(1+tolerance)
+    o throughput por debajo de base*(1-tolerance), y errores donde antes no había.
+    """
+    regressions = []
+    for name, summary in results.items():
+        reference = baseline.get("endpoints", {}).get(name)
+        if not reference:
+            continue
+        for metric in LATENCY_METRICS:
+            if metric in summary and metric in reference and summary[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {summary[metric]:.1f} > {reference[metric]:.1f} (+{tolerance:.0%})")
+        if summary["throughput_rps"] < reference["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {summary['throughput_rps']:.1f} < {reference['throughput_rps']:.1f} req/s (-{tolerance:.0%})")
+        if summary["errors"] and not reference.get("errors"):
+            regressions.append(f"{name}: {summary['errors']} errores (la baseline no tenía ninguno)")
+    return regressions
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="Prueba de carga local de los endpoints de servicio.")
+    parser.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS), choices=ENDPOINTS)
+    parser.add_argument("--concurrency", type=int, default=8, help="Peticiones en vuelo por endpoint.")
+    parser.add_argument("--duration", type=float, default=15.0, help="Segundos de carga por endpoint.")
+    parser.add_argument("--requests", type=int, default=0, help="Máximo de peticiones por endpoint (0 = sin límite).")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--rows", type=int, default=200, help="Filas por CSV enviado al predictor.")
+    parser.add_argument("--upload-rows", type=int, default=500, help="Filas por CSV subido al orquestador.")
+    parser.add_argument("--data-source", default="mixed", choices=["mixed", "kepler", "k2"])
+    parser.add_argument("--payload-variants", type=int, default=8, help="CSV distintos por fuente para el predictor.")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1, help="Fracción de subidas repetidas al orquestador.")
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="Latencia simulada de Gemini (s).")
+    parser.add_argument("--server-workers", type=int, default=1)
+    parser.add_argument("--server-threads", type=int, default=8)
+    parser.add_argument("--state", default="/tmp/exo-loadtest", help="Carpeta de estado (se reutiliza entre ejecuciones).")
+    parser.add_argument("--reseed", action="store_true", help="Volver a entrenar los modelos sembrados.")
+    parser.add_argument("--train-rows", type=int, default=3000)
+    parser.add_argument("--output", help="Guardar los resultados en este JSON.")
+    parser.add_argument("--baseline", help="Comparar contra esta baseline.")
+    parser.add_argument("--save-baseline", help="Guardar esta ejecución como baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Margen antes de marcar una regresión.")
+    parser.add_argument("--allow-settings-mismatch", action="store_true",
+                        help="Comparar aunque los parámetros no coincidan con los de la baseline.")
+    return parser
+
+def parse_args(argv=None):
+    """Devuelve (args, baseline). Con --baseline, sus parámetros sustituyen a los valores por defecto."""
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        parser.set_defaults(**{key: value for key, value in baseline.get("settings", {}).items() if key in SETTINGS})
+        args = parser.parse_args(argv)
+    return args, baseline
+
+def main():
+    args, baseline = parse_args()
+    if baseline is not None:
+        mismatch = settings_mismatch(_settings(args), baseline)
+        if mismatch and not args.allow_settings_mismatch:
+            print("ERROR: Los parámetros no coinciden con los de la baseline; no se puede comparar:")
+            for key, current, reference in mismatch:
+                print(f"  - {key}: {current!r} (baseline: {reference!r})")
+            print(f"  La baseline se generó con: {baseline.get('command', 'comando desconocido')}")
+            sys.exit(2)
+
+    state = os.path.abspath(args.state)
+    log_dir = os.path.join(state, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    if args.reseed or _needs_seed(state, args):
+        subprocess.run([sys.executable, os.path.join(HERE, "seed.py"), "--state", state,
+                        "--train-rows", str(args.train_rows)], check=True, stdout=subprocess.DEVNULL)
+
+    scenarios = Scenarios(args)
+    servers = {}
+    results = {}
+    try:
+        for name in args.endpoints:
+            servers[name] = _start_server(name, state, log_dir, args)
+        for name in args.endpoints:
+            print(f"Cargando {name} ({args.concurrency} en paralelo, {args.duration:.0f} s)...")
+            results[name] = _run_endpoint(name, servers[name][1], scenarios, args)
+    finally:
+        for process, _ in servers.values():
+            process.terminate()
+        for process, _ in servers.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        _clean_uploads(state)
+
+    _print_report(results)
+    report = {
+        "command": shlex.join(["python", "tools/loadtest/run_loadtest.py", *sys.argv[1:]]),
+        "settings": _settings(args),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "endpoints": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Baseline guardada en {args.save_baseline}.")
+
+    if baseline is not None:
+        if baseline.get("machine", {}).get("cpus") != os.cpu_count():
+            print("WARN: La baseline se tomó en una máquina con otro número de CPUs.")
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("\nREGRESIONES frente a la baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("\n✓ Sin regresiones frente a la baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# tools/loadtest/seed.py
+#
+# Prepara la carpeta de estado de una prueba de carga: entrena un modelo de
+# Kepler y otro de K2 con el trainer real (sobre los dobles de GCP) y añade
+# trabajos de relleno para que los listados de la Jobs API tengan volumen.
+# Uso: python tools/loadtest/seed.py --state /tmp/exo-loadtest --train-rows 3000
+
+import argparse
+import copy
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, "..", ".."))
+sys.path[:0] = [os.path.join(ROOT, "functions", "trainer"), HERE, os.path.dirname(HERE)]
+
+import backend  # noqa: E402
+import datasets  # noqa: E402
+
+INPUT_BUCKET = "exoplanets-nasa-models"
+
+def _train(trainer_main, app, data_source, n_rows, algorithm):
+    from flask import request
+    from common.clients import get_storage_client
+
+    job_id = datasets.SEEDED_JOBS[data_source]
+    blob_name = f"raw-uploads/{job_id}_{data_source}.csv"
+    get_storage_client().bucket(INPUT_BUCKET).blob(blob_name).upload_from_string(
+        datasets.csv_payload(data_source, n_rows, seed=1), content_type="text/csv"
+    )
+    payload = {
+        "job_id": job_id,
+        "gcs_input_uri": f"gs://{INPUT_BUCKET}/{blob_name}",
+        "data_source": data_source,
+        "algorithm": algorithm,
+        "model_name": f"loadtest_{data_source}_{algorithm}",
+    }
+    with app.test_request_context(method="POST", json=payload):
+        response = app.make_response(trainer_main.trainer_function(request))
+    if response.status_code != 200:
+        raise RuntimeError(f"El entrenamiento de {job_id} falló: {response.get_data(as_text=True)[:500]}")
+    print(f"✓ Modelo {job_id} entrenado con {n_rows} filas ({algorithm}).")
+
+def _add_filler_jobs(firestore_client, count):
+    """Trabajos completados y con error que solo sirven para dar volumen a /jobs."""
+    template = firestore_client.collection("exo_scout_models").document(datasets.SEEDED_JOBS["kepler"]).get().to_dict()
+    base_time = datetime.now()
+    for i in range(count):
+        job_id = f"loadtest-filler-{i:05d}"
+        data = copy.deepcopy(template)
+        data.update({
+            "job_id": job_id,
+            "model_name": f"filler_{i}",
+            "status": "completed" if i % 5 else "error",
+            "created_at": base_time - timedelta(minutes=i + 1),
+        })
+        data["params"]["data_source"] = "kepler" if i % 3 else "k2"
+        firestore_client.collection("exo_scout_models").document(job_id).set(data)
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepara el estado de una prueba de carga.")
+    parser.add_argument("--state", required=True, help="Carpeta de estado compartida por los servidores.")
+    parser.add_argument("--train-rows", type=int, default=3000)
+    parser.add_argument("--algorithm", default="random_forest", choices=["random_forest", "gradient_boosting", "xgboost"])
+    parser.add_argument("--filler-jobs", type=int, default=200)
+    args = parser.parse_args()
+
+    os.makedirs(args.state, exist_ok=True)
+    os.environ[backend.STATE_ENV_VAR] = os.path.abspath(args.state)
+
+    from flask import Flask
+    import main as trainer_main
+    from common import clients
+    fakes = backend.install(clients)
+
+    app = Flask("loadtest-seed")
+    for data_source in datasets.SEEDED_JOBS:
+        _train(trainer_main, app, data_source, args.train_rows, args.algorithm)
+    _add_filler_jobs(fakes["firestore"], args.filler_jobs)
+    backend.save_firestore(fakes["firestore"], args.state)
+    # run_loadtest.py vuelve a sembrar si la baseline pide otro tamaño de entrenamiento
+    with open(os.path.join(args.state, backend.SEED_INFO), "w") as f:
+        json.dump({"train_rows": args.train_rows, "algorithm": args.algorithm, "filler_jobs": args.filler_jobs}, f)
+    print(f"✓ Estado preparado en {args.state}.")
+
+if __name__ == "__main__":
+    main()
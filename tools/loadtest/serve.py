@@ -0,0 +1,50 @@
+# tools/loadtest/serve.py
+#
+# Sirve una función con el Functions Framework (gunicorn, como en Cloud Run)
+# usando los dobles de GCP de backend.py y un Gemini falso para el orquestador.
+# Lo lanza run_loadtest.py, un proceso por función.
+# Uso: python tools/loadtest/serve.py --function predictor --port 8081 --state /tmp/exo-loadtest
+
+import argparse
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, "..", ".."))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+# nombre -> (carpeta de la función, punto de entrada)
+FUNCTIONS = {
+    "predictor": ("predictor", "predictor_function"),
+    "orchestrator": ("orchestrator", "orchestrator_function"),
+    "jobs_crud": ("crud_jobs", "jobs_crud"),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Sirve una función para las pruebas de carga.")
+    parser.add_argument("--function", required=True, choices=sorted(FUNCTIONS))
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--state", required=True)
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="Segundos de latencia simulada de Gemini.")
+    args = parser.parse_args()
+
+    os.environ["EXO_LOADTEST_STATE"] = os.path.abspath(args.state)
+    os.environ["EXO_CLIENT_BACKEND"] = "backend:install"
+    os.environ.setdefault("GCP_PROJECT", "exo-local")
+    os.environ.setdefault("TRAINER_FUNCTION_URL", "http://127.0.0.1:9/trainer")
+    os.environ.setdefault("EXO_BUNDLE_CACHE_DIR", os.path.join(args.state, "bundle-cache"))
+
+    from functions_framework import create_app
+    from functions_framework._http import create_server
+
+    folder, target = FUNCTIONS[args.function]
+    app = create_app(target=target, source=os.path.join(ROOT, "functions", folder, "main.py"))
+    if args.function == "orchestrator":
+        from backend import FakeGeminiModel
+        sys.modules["main"].gemini_model = FakeGeminiModel(args.gemini_latency)
+
+    print(f"INFO: Sirviendo {args.function} en http://127.0.0.1:{args.port}")
+    create_server(app, debug=False).run("127.0.0.1", args.port)
+
+if __name__ == "__main__":
+    main()